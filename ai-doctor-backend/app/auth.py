@@ -3,7 +3,7 @@ from typing import Optional
 from jose import JWTError, jwt
 from fastapi import Depends, HTTPException, status
 from fastapi.security import OAuth2PasswordBearer
-from app.db import db  # Your MongoDB connection
+from app.services.auth_cache import load_user
 from bson import ObjectId
 import os
 
@@ -37,7 +37,9 @@ async def get_current_user(token: str = Depends(oauth2_scheme)):
     except JWTError:
         raise credentials_exception
 
-    user = await db.users.find_one({"_id": ObjectId(user_id)})
+    if not ObjectId.is_valid(user_id):
+        raise credentials_exception
+    user = await load_user(user_id)  # cached for AUTH_CACHE_TTL
     if user is None:
         raise credentials_exception
 
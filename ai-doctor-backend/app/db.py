@@ -1,14 +1,74 @@
 # app/db.py
-from motor.motor_asyncio import AsyncIOMotorClient
-from fastapi import Depends
-from config import MONGO_URI
-from bson.objectid import ObjectId
+from config import MONGO_DB, MONGO_URI
+
+
+# Stands in for the Motor database so modules can keep doing `from app.db import db` at import
+# time: the client is opened by connect() in the app lifespan (or on first use, for scripts that
+# don't run one) and closed by close() on shutdown
+class _Database:
+    def __init__(self):
+        self._client = None
+        self._database = None
+        self._owned = False  # False when the database was handed in with use_database()
+
+    def _current(self):
+        if self._database is None:
+            connect()
+        return self._database
+
+    def __getattr__(self, name):
+        return getattr(self._current(), name)
+
+    def __getitem__(self, name):
+        return self._current()[name]
+
+
+db = _Database()
+
+
+def connect(uri: str = MONGO_URI) -> None:
+    if db._database is not None:
+        return
+    from motor.motor_asyncio import AsyncIOMotorClient
+    db._client = AsyncIOMotorClient(uri)
+    db._database = db._client[MONGO_DB]
+    db._owned = True
+
+
+def close() -> None:
+    if db._owned and db._client is not None:
+        db._client.close()
+        db._client = None
+        db._database = None
+        db._owned = False
+
+
+def use_database(database) -> None:
+    """Serve `db` from an existing database (a scratch server database, mongomock); the caller closes it."""
+    close()
+    db._client = None
+    db._database = database
+    db._owned = False
 
-client = AsyncIOMotorClient(MONGO_URI)
-db = client.ai_doctor  # database name
 
 def get_db():
-    return db
+    # The real Motor database, for APIs that type-check it (e.g. GridFS buckets)
+    return db._current()
+
+async def get_diagnosis_by_id(diagnosis_id: str, projection: dict = None):
+    return await db.diagnoses.find_one({"frontendId": diagnosis_id}, projection)
 
-async def get_diagnosis_by_id(diagnosis_id: str):
-    return await db.diagnoses.find_one({"frontendId": diagnosis_id})
\ No newline at end of file
+# One query for a batch of a user's diagnoses, by frontendId and/or createdAt range, oldest first
+async def find_user_diagnoses(user_id: str, ids: list = None, start=None, end=None,
+                              projection: dict = None, limit: int = 0):
+    query = {"userId": user_id}
+    if ids is not None:
+        query["frontendId"] = {"$in": ids}
+    if start or end:
+        query["createdAt"] = {}
+        if start:
+            query["createdAt"]["$gte"] = start
+        if end:
+            query["createdAt"]["$lte"] = end
+    cursor = db.diagnoses.find(query, projection).sort("createdAt", 1).limit(limit)
+    return await cursor.to_list(length=None)
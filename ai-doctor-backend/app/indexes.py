@@ -0,0 +1,225 @@
+# app/indexes.py
+#
+# Every index the app relies on, created/reconciled at startup, plus a check that the hot queries
+# are actually answered from an index rather than a collection scan.
+
+import os
+from datetime import datetime
+
+from pymongo import ASCENDING, DESCENDING, IndexModel
+from pymongo.errors import OperationFailure, PyMongoError
+
+from app.db import db
+from app.services.media_store import GRIDFS_BUCKET, MEDIA_BACKEND
+
+# "warn": log problems and keep serving. "strict": refuse to start with a missing index or a scan.
+INDEX_MODE = os.environ.get("INDEX_MODE", "warn").lower()
+
+INDEXES = {
+    "users": [
+        IndexModel([("email", ASCENDING)], unique=True),
+    ],
+    "diagnoses": [
+        # frontendId is also the idempotency key for /api/chat submissions
+        IndexModel([("frontendId", ASCENDING)], unique=True),
+        # History pages and exports: a user's diagnoses by date, _id breaking ties
+        IndexModel([("userId", ASCENDING), ("createdAt", DESCENDING), ("_id", DESCENDING)]),
+        # Media still linked from a diagnosis, checked before the janitor or the TTS cache evicts it
+        IndexModel([("ttsUrl", ASCENDING)]),
+        IndexModel([("audioUrl", ASCENDING)]),
+        IndexModel([("imageUrl", ASCENDING)]),
+    ],
+    "chat_jobs": [
+        IndexModel([("status", ASCENDING), ("createdAt", ASCENDING)]),
+        # Lease recovery: running jobs whose owner stopped renewing
+        IndexModel([("status", ASCENDING), ("leaseUntil", ASCENDING)]),
+    ],
+    # Logged-out tokens; Mongo removes each one once the token would have expired anyway
+    "revoked_tokens": [
+        IndexModel([("expiresAt", ASCENDING)], expireAfterSeconds=0),
+    ],
+    # Shared rate-limit buckets (RATE_LIMIT_BACKEND=mongo), dropped once they'd be full again
+    "rate_limits": [
+        IndexModel([("expiresAt", ASCENDING)], expireAfterSeconds=0),
+    ],
+}
+
+if MEDIA_BACKEND == "gridfs":
+    INDEXES[f"{GRIDFS_BUCKET}.files"] = [
+        IndexModel([("filename", ASCENDING), ("uploadDate", ASCENDING)]),  # GridFS's own
+        # One object per name, so two nodes storing the same key at once can't leave duplicates
+        IndexModel([("filename", ASCENDING)], unique=True),
+    ]
+
+# (name, collection, filter, sort) for each lookup on a request path
+QUERY_SHAPES = [
+    ("login/signup by email", "users", {"email": "someone@example.com"}, None),
+    ("report by frontendId", "diagnoses", {"frontendId": "example"}, None),
+    ("history page", "diagnoses", {"userId": "example"}, [("createdAt", -1), ("_id", -1)]),
+    ("export by date range", "diagnoses", {"userId": "example", "createdAt": {"$gte": datetime(2000, 1, 1)}},
+     [("createdAt", 1)]),
+    ("referenced media", "diagnoses",
+     {"$or": [{"ttsUrl": {"$in": ["example"]}}, {"audioUrl": {"$in": ["example"]}}, {"imageUrl": {"$in": ["example"]}}]},
+     None),
+    ("job recovery", "chat_jobs", {"status": "queued"}, [("createdAt", 1)]),
+    ("lapsed job leases", "chat_jobs", {"status": "running", "leaseUntil": {"$lt": datetime(2000, 1, 1)}}, None),
+]
+
+# Unique keys that older code could store twice (retried /api/chat submissions): before the index
+# is built, every extra copy is moved to <collection>_duplicates and the oldest one stays
+DEDUPE_BEFORE_UNIQUE = {("diagnoses", "frontendId")}
+
+_COMPARED_OPTIONS = ("unique", "sparse")
+
+
+class IndexProblem(Exception):
+    pass
+
+
+def _problem(message: str) -> None:
+    if INDEX_MODE == "strict":
+        raise IndexProblem(message)
+    print(f"[DB] WARNING: {message}")
+
+
+def _keys(key) -> list:
+    # Servers may report directions as floats (1.0)
+    return [(field, int(direction) if isinstance(direction, (int, float)) else direction)
+            for field, direction in (key.items() if isinstance(key, dict) else key)]
+
+
+def _options(spec: dict) -> dict:
+    return {option: bool(spec.get(option, False)) for option in _COMPARED_OPTIONS}
+
+
+async def _dedupe(collection, field: str) -> int:
+    """Move every document but the oldest of each duplicated field value aside; returns how many moved."""
+    moved = 0
+    groups = collection.aggregate([
+        {"$match": {field: {"$exists": True}}},
+        {"$group": {"_id": f"${field}", "ids": {"$push": "$_id"}, "count": {"$sum": 1}}},
+        {"$match": {"count": {"$gt": 1}}},
+    ], allowDiskUse=True)
+    aside = collection.database[f"{collection.name}_duplicates"]
+    async for group in groups:
+        extra = sorted(group["ids"])[1:]
+        docs = await collection.find({"_id": {"$in": extra}}).to_list(length=None)
+        # Copied before deleting, so an interrupted run loses nothing (a rerun just finds fewer)
+        for doc in docs:
+            await aside.replace_one({"_id": doc["_id"]}, doc, upsert=True)
+        await collection.delete_many({"_id": {"$in": extra}})
+        moved += len(extra)
+    return moved
+
+
+async def _reconcile(collection, model: IndexModel, existing: dict) -> None:
+    wanted = model.document
+    keys = _keys(wanted["key"])
+    # Matched by key pattern, so an index someone created by hand under another name still counts
+    current = next((name for name, spec in existing.items() if _keys(spec["key"]) == keys), None)
+    if current and _options(existing[current]) == _options(wanted):
+        return
+    if wanted.get("unique") and len(keys) == 1 and (collection.name, keys[0][0]) in DEDUPE_BEFORE_UNIQUE:
+        moved = await _dedupe(collection, keys[0][0])
+        if moved:
+            print(f"[DB] Moved {moved} duplicate {keys[0][0]} document(s) to {collection.name}_duplicates")
+    if current:
+        print(f"[DB] Rebuilding index {collection.name}.{current}: options {_options(existing[current])} -> {_options(wanted)}")
+        await collection.drop_index(current)
+    try:
+        name = await collection.create_indexes([model])
+        print(f"[DB] Created index {collection.name}.{name[0]}")
+    except OperationFailure as e:
+        # Typically a unique index over data that already has duplicates; keep the old index meanwhile
+        if current:
+            await collection.create_index(keys, name=current, **{k: v for k, v in _options(existing[current]).items() if v})
+        if wanted.get("unique"):
+            # Unique indexes back correctness (idempotent chats, one account per email), not just speed
+            raise IndexProblem(f"Could not create unique index {collection.name} {keys}: {e}")
+        _problem(f"Could not create index {collection.name} {keys}: {e}")
+
+
+async def ensure_indexes(database=None) -> None:
+    """Create missing indexes and fix ones whose options drifted. Undeclared indexes are only reported."""
+    database = database if database is not None else db
+    for collection_name, models in INDEXES.items():
+        collection = database[collection_name]
+        try:
+            existing = await collection.index_information()
+            for model in models:
+                await _reconcile(collection, model, existing)
+        except IndexProblem:
+            raise
+        except PyMongoError as e:
+            _problem(f"Could not check indexes on {collection_name}: {e}")
+            continue
+
+        declared = [_keys(model.document["key"]) for model in models] + [[("_id", 1)]]
+        for name, spec in existing.items():
+            if _keys(spec["key"]) not in declared:
+                print(f"[DB] Note: index {collection_name}.{name} is not declared in app/indexes.py")
+
+
+def _plan_stages(plan: dict) -> list:
+    stages = [plan.get("stage")]
+    for child in ([plan["inputStage"]] if "inputStage" in plan else []) + plan.get("inputStages", []):
+        stages += _plan_stages(child)
+    if "queryPlan" in plan:  # slot-based engine wraps the classic plan
+        stages += _plan_stages(plan["queryPlan"])
+    return [stage for stage in stages if stage]
+
+
+def _index_supports(keys: list, query: dict, sort: list) -> bool:
+    # Equality fields must make up the index prefix (in any order), then range/sort fields in order
+    fields = [field for field, _ in keys]
+    equality = {field for field, value in query.items()
+                if not isinstance(value, dict) or set(value) <= {"$eq", "$in"}}
+    rest = []
+    for field in [f for f in query if f not in equality] + [f for f, _ in sort or []]:
+        if field not in equality and field not in rest:
+            rest.append(field)
+    return set(fields[:len(equality)]) == equality and fields[len(equality):len(equality) + len(rest)] == rest
+
+
+def _declared_support(indexes: list, query: dict, sort: list) -> bool:
+    if "$or" in query:
+        # Every branch needs an index of its own, together with the fields outside the $or
+        rest = {field: value for field, value in query.items() if field != "$or"}
+        return all(_declared_support(indexes, {**rest, **branch}, sort) for branch in query["$or"])
+    return any(_index_supports(keys, query, sort) for keys in indexes)
+
+
+async def explain_plan(database, collection: str, query: dict, sort: list = None):
+    """(stages of the winning plan, True if it uses an index). Falls back to matching the declared
+    indexes when the server can't explain (e.g. mongomock)."""
+    command = {"find": collection, "filter": query}
+    if sort:
+        command["sort"] = dict(sort)
+    try:
+        result = await database.command("explain", command, verbosity="queryPlanner")
+    except (OperationFailure, NotImplementedError, TypeError):
+        info = await database[collection].index_information()
+        supported = _declared_support([_keys(spec["key"]) for spec in info.values()], query, sort)
+        return ["(declared indexes)", "IXSCAN" if supported else "COLLSCAN"], supported
+    stages = _plan_stages(result["queryPlanner"]["winningPlan"])
+    if stages == ["EOF"]:
+        return stages, True  # the collection doesn't exist yet; nothing to scan
+    uses_index = "COLLSCAN" not in stages and any("IXSCAN" in stage or stage in ("IDHACK", "EXPRESS_IXSCAN")
+                                                  for stage in stages)
+    return stages, uses_index
+
+
+async def check_query_plans(database=None) -> list:
+    """[(name, stages, uses_index)] for every QUERY_SHAPE; each one that would scan is reported."""
+    database = database if database is not None else db
+    results = []
+    for name, collection, query, sort in QUERY_SHAPES:
+        try:
+            stages, uses_index = await explain_plan(database, collection, query, sort)
+        except PyMongoError as e:
+            print(f"[DB] Could not explain '{name}': {e}")
+            continue
+        results.append((name, stages, uses_index))
+        if not uses_index:
+            _problem(f"Query '{name}' on {collection} runs without an index: {' <- '.join(stages)}")
+    return results
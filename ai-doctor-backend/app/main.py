@@ -3,20 +3,87 @@
 from dotenv import load_dotenv
 load_dotenv()
 
-from fastapi import FastAPI, UploadFile, File
+from fastapi import FastAPI, UploadFile, File, Query
 from fastapi.middleware.cors import CORSMiddleware
-from fastapi.staticfiles import StaticFiles
 from pydantic import BaseModel
-from fastapi.responses import FileResponse
-from app.routes import chat, auth, diagnosis, pdf
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
+from app import db as database
+from app.indexes import check_query_plans, ensure_indexes
+from app.migrations import run_migrations
+from app.services.admission import AdmissionMiddleware, admission_stats
+from app.routes import chat, auth, diagnosis, media, pdf, providers
+from app.services import auth_cache
+from app.services.audio_prep import AUDIO_PREP_DIR, audio_totals
+from app.services.health import ProviderUnavailable, health_stats
+from app.services.image_resolver import REPORT_IMAGE_DIR, image_resolver
+from app.services.jobs import job_queue
+from app.services.metrics import MetricsMiddleware, metrics
+from app.services.passwords import shutdown_password_pool
+from app.services.pdf_engine import pdf_engine
+from app.services.providers import registry
+from app.services.stages import AdmissionRejected, stage_stats
+from app.services.storage_janitor import janitor
+from app.services.tts import speak
+from app.services.tts_cache import TTS_CACHE_DIR, tts_cache
+from app.services.tts_stream import open_speech_stream, stream_stats
+from app.services.upload_store import INCOMING_DIR, UPLOADS_DIR, UploadRejected
+from app.utils.executor import run_blocking, shutdown_executor
+from app.utils.trace import TraceMiddleware
 
-from gtts import gTTS
-import uuid
+import asyncio
+import math
 import os
-import tempfile
+from contextlib import asynccontextmanager
+from typing import Literal
+
+# Import the provider SDKs and build their clients in the background once the app is up, so
+# startup doesn't wait on them (off: on the first request that needs each one)
+PROVIDER_PREWARM = os.environ.get("PROVIDER_PREWARM", "true").lower() == "true"
+
+# Everything the app writes into, created once at startup
+DATA_DIRS = [UPLOADS_DIR, INCOMING_DIR, TTS_CACHE_DIR, REPORT_IMAGE_DIR, AUDIO_PREP_DIR]
+
+
+def prewarm_providers() -> None:
+    registry.startup()
+    try:
+        import gtts.tts  # noqa: F401
+    except Exception as e:
+        print(f"[PROVIDERS] Could not import gTTS: {e}")
+
+
+# The Mongo client, provider clients, their connection pools, DB indexes, the job workers and
+# the storage janitor live for the whole app lifetime
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    for directory in DATA_DIRS:
+        os.makedirs(directory, exist_ok=True)
+    database.connect()
+    prewarm = asyncio.create_task(run_blocking(prewarm_providers)) if PROVIDER_PREWARM else None
+    # Before the indexes, so copied duplicates are deduplicated with the rest
+    await run_migrations()
+    await ensure_indexes()
+    await check_query_plans()
+    await job_queue.start()
+    janitor.start()
+    pdf_engine.start()
+    yield
+    await janitor.stop()
+    await job_queue.stop()
+    if prewarm:
+        await prewarm
+    registry.close()
+    pdf_engine.shutdown()
+    await image_resolver.close()
+    shutdown_password_pool()
+    shutdown_executor()
+    database.close()
 
 # Create FastAPI app instance
-app = FastAPI()
+app = FastAPI(lifespan=lifespan)
+
+# Rate limits and request slots for chat/TTS, inside CORS so browsers can read the 429s
+app.add_middleware(AdmissionMiddleware)
 
 # Allow frontend access (temp: allow all)
 app.add_middleware(
@@ -25,32 +92,100 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Request-ID", "Retry-After"],
 )
+# Outermost, so the trace id is set before anything else runs and timing covers the whole request
+app.add_middleware(MetricsMiddleware)
+app.add_middleware(TraceMiddleware)
+
+# A provider whose circuit is open fails fast instead of timing out
+@app.exception_handler(ProviderUnavailable)
+async def provider_unavailable_handler(request, exc: ProviderUnavailable):
+    return JSONResponse(
+        status_code=503,
+        content={"detail": str(exc)},
+        headers={"Retry-After": str(max(1, round(exc.retry_after)))},
+    )
 
-# Serve static files
-app.mount("/temp", StaticFiles(directory="temp"), name="temp")
-app.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+# Shed by a stage queue or a provider quota after the request was admitted
+@app.exception_handler(AdmissionRejected)
+async def admission_rejected_handler(request, exc: AdmissionRejected):
+    return JSONResponse(
+        status_code=exc.status_code,
+        content={"detail": exc.detail},
+        headers={"Retry-After": str(max(1, math.ceil(exc.retry_after)))},
+    )
+
+@app.exception_handler(UploadRejected)
+async def upload_rejected_handler(request, exc: UploadRejected):
+    return JSONResponse(status_code=exc.status_code, content={"detail": exc.detail})
+
+# /uploads, /temp and /media are served by the media router (Range, ETag, caching)
 
 
 
 # TTS endpoint
 class TTSRequest(BaseModel):
     text: str
+    mode: Literal["whole", "sentences"] = "whole"
+    engine: Literal["gtts", "elevenlabs"] = "gtts"
 
 @app.post("/api/tts")
 async def generate_tts(data: TTSRequest):
-    text = data.text
-    tts = gTTS(text)
+    # Identical text is rendered once and then served from the TTS cache
+    path = await speak(data.text, engine=data.engine, mode=data.mode)
+    return FileResponse(path, media_type="audio/mpeg", filename=os.path.basename(path))
+
+# Audio goes out chunk by chunk while it's still being synthesized (and is cached once complete)
+@app.post("/api/tts/stream")
+async def stream_tts(data: TTSRequest):
+    chunks = await open_speech_stream(data.text, engine=data.engine, mode=data.mode)
+    return StreamingResponse(chunks, media_type="audio/mpeg")
+
+# Same stream for <audio src="...">, which can only GET
+@app.get("/api/tts/stream")
+async def stream_tts_get(text: str = Query(..., min_length=1),
+                         mode: Literal["whole", "sentences"] = "whole",
+                         engine: Literal["gtts", "elevenlabs"] = "gtts"):
+    chunks = await open_speech_stream(text, engine=engine, mode=mode)
+    return StreamingResponse(chunks, media_type="audio/mpeg")
+
+@app.get("/api/tts/stream/stats")
+async def tts_stream_stats():
+    return stream_stats()
+
+@app.get("/api/tts/cache/stats")
+async def tts_cache_stats():
+    return tts_cache.stats()
+
+# Bytes and file counts per directory and artifact class, as of the last janitor sweep
+@app.get("/api/storage/stats")
+async def storage_stats():
+    return janitor.stats()
 
-    temp_dir = tempfile.gettempdir()
-    filename = f"{uuid.uuid4()}.mp3"
-    path = os.path.join(temp_dir, filename)
+# Prometheus scrape endpoint. Latencies and sizes are recorded as they happen; the caches, pools,
+# breakers and queue are read from their stats() at scrape time.
+metrics.register_stats("tts_cache", tts_cache.stats)
+metrics.register_stats("pdf_cache", pdf_engine.stats)
+metrics.register_stats("report_images", image_resolver.stats)
+metrics.register_stats("auth_cache", auth_cache.stats)
+metrics.register_stats("jobs", job_queue.stats)
+metrics.register_stats("stage", stage_stats, label="stage")
+metrics.register_stats("rate_limits", admission_stats)
+metrics.register_stats("audio_prep", audio_totals)
+metrics.register_stats("storage", janitor.stats)
+metrics.register_stats("provider_pool", registry.stats, label="provider")
+metrics.register_stats("provider_health", lambda: {name: dict(stats, open=stats["state"] != "closed")
+                                                   for name, stats in health_stats().items()}, label="provider")
 
-    tts.save(path)
-    return FileResponse(path, media_type="audio/mpeg", filename=filename)
+@app.get("/metrics", include_in_schema=False)
+async def prometheus_metrics():
+    return PlainTextResponse(metrics.render(), media_type="text/plain; version=0.0.4")
 
 # Include chat router
 app.include_router(chat.router, prefix="/api")
 app.include_router(auth.router, prefix="/api/auth")
 app.include_router(diagnosis.router)
-app.include_router(pdf.router)
\ No newline at end of file
+app.include_router(pdf.router)
+app.include_router(providers.router, prefix="/api/providers")
+app.include_router(media.router)
\ No newline at end of file
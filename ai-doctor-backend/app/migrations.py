@@ -0,0 +1,55 @@
+# app/migrations.py
+#
+# One-off data moves run at startup. Each is recorded in the migrations collection once it has
+# completed, so it runs once per database.
+
+from datetime import datetime, timezone
+
+from pymongo.errors import BulkWriteError, PyMongoError
+
+from app.db import db
+from config import LEGACY_MONGO_DB, MONGO_DB
+
+BATCH_SIZE = 500
+
+
+async def _insert_new(collection, docs: list) -> int:
+    # Already copied (same _id) or already stored under the same frontendId: skipped, not an error
+    try:
+        return len((await collection.insert_many(docs, ordered=False)).inserted_ids)
+    except BulkWriteError as e:
+        return e.details["nInserted"]
+
+
+async def copy_legacy_diagnoses(database) -> int:
+    """Copy diagnoses saved through the old sync client (LEGACY_MONGO_DB) into the app database."""
+    legacy = database.client[LEGACY_MONGO_DB]
+    copied, batch = 0, []
+    async for doc in legacy.diagnoses.find({}):
+        batch.append(doc)
+        if len(batch) >= BATCH_SIZE:
+            copied += await _insert_new(database.diagnoses, batch)
+            batch = []
+    if batch:
+        copied += await _insert_new(database.diagnoses, batch)
+    return copied
+
+
+MIGRATIONS = []
+if LEGACY_MONGO_DB and LEGACY_MONGO_DB != MONGO_DB:
+    MIGRATIONS.append((f"diagnoses from {LEGACY_MONGO_DB}", copy_legacy_diagnoses))
+
+
+async def run_migrations(database=None) -> None:
+    database = database if database is not None else db
+    for name, migrate in MIGRATIONS:
+        if await database.migrations.find_one({"_id": name}):
+            continue
+        try:
+            count = await migrate(database)
+        except PyMongoError as e:
+            # Not recorded, so the next start tries again
+            print(f"[DB] Migration '{name}' failed: {e}")
+            continue
+        await database.migrations.insert_one({"_id": name, "count": count, "doneAt": datetime.now(timezone.utc)})
+        print(f"[DB] Migration '{name}': {count} document(s)")
@@ -11,4 +11,5 @@ class Diagnosis(BaseModel):
     ttsUrl: Optional[str] = None
     symptom: Optional[str] = None
     frontendId: str # New field to store the frontend-generated ID
+    traceId: Optional[str] = None # Request trace id, to find this diagnosis' log lines
     createdAt: datetime = Field(default_factory=lambda: datetime.now(timezone.utc))
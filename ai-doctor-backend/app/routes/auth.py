@@ -1,11 +1,16 @@
-from fastapi import APIRouter, HTTPException, Depends
-from passlib.hash import bcrypt
+from datetime import datetime, timezone
+from fastapi import APIRouter, BackgroundTasks, HTTPException, Depends
+from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 from pydantic import BaseModel, EmailStr
+from pymongo.errors import DuplicateKeyError
 from app.models.user import User
-from app.utils.auth import create_access_token
+from app.services import auth_cache
+from app.services.passwords import hash_password, needs_rehash, verify_password
+from app.utils.auth import authenticate, create_access_token, get_current_user
 from app.db import db
 
 router = APIRouter()
+bearer = HTTPBearer()
 
 class SignupModel(BaseModel):
     name: str
@@ -16,35 +21,69 @@ class LoginModel(BaseModel):
     email: EmailStr
     password: str
 
+class ChangePasswordModel(BaseModel):
+    currentPassword: str
+    newPassword: str
+
 @router.post("/signup")
 async def signup(data: SignupModel):
     users = db.users
     if await users.find_one({"email": data.email}):
         raise HTTPException(status_code=400, detail="Email already registered.")
     
-    hashed_pw = bcrypt.hash(data.password)
+    # bcrypt runs in its own bounded pool, not on the event loop
+    hashed_pw = await hash_password(data.password)
     new_user = {"name": data.name, "email": data.email, "password": hashed_pw}
-    result = await users.insert_one(new_user)
+    try:
+        result = await users.insert_one(new_user)
+    except DuplicateKeyError:
+        # Same email signed up concurrently; the unique index caught it
+        raise HTTPException(status_code=400, detail="Email already registered.")
     
     token = create_access_token({"user_id": str(result.inserted_id)})
     return {"message": "Signup successful", "token": token}
 
+async def _upgrade_hash(user_id, password: str):
+    # Stored with an older work factor: re-hash now that we have the plain password
+    await db.users.update_one({"_id": user_id}, {"$set": {"password": await hash_password(password)}})
+    auth_cache.invalidate_user(str(user_id))
+
 @router.post("/login")
-async def login(data: LoginModel):
-    print(f"DEBUG: Login attempt for email: {data.email}")
+async def login(data: LoginModel, background_tasks: BackgroundTasks):
     users = db.users
     user = await users.find_one({"email": data.email})
     
     if not user:
-        print(f"DEBUG: User with email {data.email} not found.")
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
-    print(f"DEBUG: User found. Hashed password from DB: {user['password']}")
-    password_match = bcrypt.verify(data.password, user["password"])
-    print(f"DEBUG: Password verification result: {password_match}")
+    password_match = await verify_password(data.password, user["password"])
 
     if not password_match:
         raise HTTPException(status_code=401, detail="Invalid credentials")
     
+    if needs_rehash(user["password"]):
+        background_tasks.add_task(_upgrade_hash, user["_id"], data.password)
+
     token = create_access_token({"user_id": str(user["_id"])})
     return {"message": "Login successful", "token": token}
+
+@router.post("/logout")
+async def logout(credentials: HTTPAuthorizationCredentials = Depends(bearer)):
+    payload = await authenticate(credentials.credentials)
+    await auth_cache.revoke_token(credentials.credentials, payload)
+    return {"message": "Logged out"}
+
+@router.post("/change-password")
+async def change_password(data: ChangePasswordModel, user=Depends(get_current_user)):
+    if not await verify_password(data.currentPassword, user["password"]):
+        raise HTTPException(status_code=401, detail="Invalid credentials")
+
+    # Whole seconds, to compare with the iat of tokens; every older token stops working
+    changed_at = datetime.now(timezone.utc).replace(microsecond=0)
+    await db.users.update_one({"_id": user["_id"]},
+                              {"$set": {"password": await hash_password(data.newPassword),
+                                        "passwordChangedAt": changed_at}})
+    auth_cache.invalidate_user(str(user["_id"]))
+
+    token = create_access_token({"user_id": str(user["_id"])})
+    return {"message": "Password changed", "token": token}
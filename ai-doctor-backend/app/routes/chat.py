@@ -1,79 +1,55 @@
-from fastapi import APIRouter, UploadFile, File, Form
-from app.services.stt import transcribe_audio
-from app.services.vision import analyze_image
-from app.services.tts import synthesize_speech
-from app.db import db
-from app.models.diagnosis import Diagnosis
-import uuid, os, shutil
+import json
+import math
+from typing import Literal
+from fastapi import APIRouter, UploadFile, File, Form, HTTPException, Query
+from fastapi.responses import StreamingResponse
+from app.services.chat_pipeline import run_chat, stream_chat
+from app.services.jobs import JobQueueFull, job_queue
+from app.services.stages import AdmissionRejected
+from app.services.upload_store import UploadRejected
+from app.utils.trace import log
 
 router = APIRouter()
 
-UPLOADS_DIR = "uploads"
-API_BASE_URL = os.environ.get("API_BASE_URL")
-
 @router.post("/chat")
-async def chat(audio: UploadFile = File(...), image: UploadFile = File(None), symptom: str = Form(None), frontendId: str = Form(...)):
-    os.makedirs(UPLOADS_DIR, exist_ok=True)
-
-    # Save audio permanently
-    audio_filename = f"{uuid.uuid4()}-{audio.filename}"
-    audio_path = os.path.join(UPLOADS_DIR, audio_filename)
-    with open(audio_path, "wb") as f:
-        shutil.copyfileobj(audio.file, f)
-    audio_url = f"{API_BASE_URL}/uploads/{audio_filename}"
-
-    # Save image permanently
-    image_path = None
-    image_url = None
-    if image:
-        image_filename = f"{uuid.uuid4()}-{image.filename}"
-        image_path = os.path.join(UPLOADS_DIR, image_filename)
-        with open(image_path, "wb") as f:
-            shutil.copyfileobj(image.file, f)
-        image_url = f"{API_BASE_URL}/uploads/{image_filename}"
-
-    # 1. Transcribe speech
-    transcript = transcribe_audio(audio_path)
-
-    # 2. Generate prompt
-    system_prompt = """You have to act as a professional doctor, i know you are not but this is for learning purpose. 
-        What's in this image?. Do you find anything wrong with it medically? 
-        If you make a differential, suggest some remedies for them. Donot add any numbers or special characters in 
-        your response. Your response should be in one long paragraph. Also always answer as if you are answering to a real person.
-        Donot say 'In the image I see' but say 'With what I see and hear, I think you have ....'
-        Dont respond as an AI model in markdown, your answer should mimic that of an actual doctor not an AI bot, 
-        Keep your answer concise (max 2 sentences). No preamble, start your answer right away please"""
-    if symptom:
-        system_prompt += f" The user has also indicated a primary symptom of: {symptom}. Please take this into account."
-    query = system_prompt + transcript
-
-    # 3. Diagnose image
-    if image_path:
-        diagnosis = analyze_image(query, image_path)
-    else:
-        diagnosis = "No image provided for me to analyze."
-
-    # 4. TTS Response
-    voice_path = f"temp/{uuid.uuid4()}.mp3"
-    synthesize_speech(diagnosis, output_path=voice_path)
-
-    # 5. Save to MongoDB
-    record = Diagnosis(
-        userId="anonymous",
-        diagnosis=diagnosis,
-        transcript=transcript,
-        audioUrl=audio_url,
-        imageUrl=image_url,
-        ttsUrl=f"{API_BASE_URL}/temp/{os.path.basename(voice_path)}",
-        symptom=symptom,
-        frontendId=frontendId
-    )
-    await db.diagnoses.insert_one(record.model_dump())
-
-    return {
-        "transcript": transcript,
-        "diagnosis": diagnosis,
-        "voice_url": f"{API_BASE_URL}/temp/{os.path.basename(voice_path)}",
-        "image_url": image_url,
-        "audio_url": audio_url
-    }
+async def chat(audio: UploadFile = File(...), image: UploadFile = File(None), symptom: str = Form(None), frontendId: str = Form(...),
+               ttsMode: Literal["whole", "sentences"] = Form("whole")):
+    # Provider calls and file I/O run off the event loop inside the pipeline
+    return await run_chat(audio, image=image, symptom=symptom, frontendId=frontendId, tts_mode=ttsMode)
+
+# Server-Sent Events variant: transcript, diagnosis tokens and the voice URL are pushed as they become ready
+@router.post("/chat/stream")
+async def chat_stream(audio: UploadFile = File(...), image: UploadFile = File(None), symptom: str = Form(None), frontendId: str = Form(...),
+                      ttsMode: Literal["whole", "sentences"] = Form("whole")):
+    async def events():
+        try:
+            async for event, data in stream_chat(audio, image=image, symptom=symptom, frontendId=frontendId, tts_mode=ttsMode):
+                yield f"event: {event}\ndata: {json.dumps(data)}\n\n"
+        except UploadRejected as e:
+            yield f"event: error\ndata: {json.dumps({'detail': e.detail, 'status': e.status_code})}\n\n"
+        except AdmissionRejected as e:
+            error = {'detail': e.detail, 'status': e.status_code, 'retryAfter': max(1, math.ceil(e.retry_after))}
+            yield f"event: error\ndata: {json.dumps(error)}\n\n"
+        except Exception as e:
+            log("CHAT", f"Stream failed: {e}")
+            yield f"event: error\ndata: {json.dumps({'detail': 'Diagnosis failed'})}\n\n"
+
+    return StreamingResponse(events(), media_type="text/event-stream", headers={"Cache-Control": "no-cache"})
+
+# Queued variant: returns a job id right away; the diagnosis runs on the bounded worker pool
+@router.post("/chat/jobs", status_code=202)
+async def submit_chat_job(audio: UploadFile = File(...), image: UploadFile = File(None), symptom: str = Form(None), frontendId: str = Form(...),
+                          ttsMode: Literal["whole", "sentences"] = Form("whole")):
+    try:
+        job_id = await job_queue.submit(audio, image=image, symptom=symptom, frontendId=frontendId, tts_mode=ttsMode)
+    except JobQueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": str(e.retry_after)})
+    return {"job_id": job_id, "status": "queued"}
+
+# Pass ?wait=N to long-poll up to N seconds for the job to finish
+@router.get("/chat/jobs/{job_id}")
+async def get_chat_job(job_id: str, wait: float = Query(0, ge=0, le=60)):
+    job = await job_queue.get(job_id, wait=wait)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
@@ -1,11 +1,19 @@
-from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form
-from typing import Optional
-from app.db import db, get_diagnosis_by_id 
-from app.utils.auth import JWTBearer
+from fastapi import APIRouter, Depends, HTTPException, UploadFile, File, Form, Query, Response
+from fastapi.responses import StreamingResponse
+from pydantic import BaseModel
+from datetime import datetime
+from typing import List, Literal, Optional
+from app.db import db, get_diagnosis_by_id, find_user_diagnoses
+from app.utils.auth import JWTBearer, get_current_user
 from app.models.diagnosis import Diagnosis
-from config import db
-from fastapi.responses import FileResponse
-from app.services.pdf_generator import generate_pdf_report
+from pymongo.errors import DuplicateKeyError
+from app.services.media_store import media_store
+from app.services.pdf_engine import pdf_engine
+from app.services.pdf_export import EXPORT_MAX_REPORTS, combined_pdf, zip_stream
+from app.services.pdf_generator import REPORT_FIELDS
+from app.services.history import (
+    HISTORY_MAX_PAGE_SIZE, HISTORY_PAGE_SIZE, decode_cursor, history_list, history_ndjson, history_page, projection_for,
+)
 
 router = APIRouter()
 auth = JWTBearer()
@@ -24,30 +32,91 @@ async def diagnose(image: Optional[UploadFile] = File(None), audio: Optional[Upl
         return {"diagnosis": "Based on the audio, your symptoms are consistent with a common cold. Rest, stay hydrated, and consider over-the-counter remedies."}
 
 @router.post("/api/diagnosis", dependencies=[Depends(auth)])
-def save_diagnosis(data: Diagnosis):
-    db.diagnoses.insert_one(data.dict())
+async def save_diagnosis(data: Diagnosis):
+    try:
+        await db.diagnoses.insert_one(data.model_dump())
+    except DuplicateKeyError:
+        # frontendId is unique: a retried save is already stored
+        pass
     return {"message": "Diagnosis saved"}
 
-@router.get("/api/diagnosis", dependencies=[Depends(auth)])
-def get_diagnoses(user_id: str = Depends(auth)):
-    records = list(db.diagnoses.find({"userId": user_id}))
-    for r in records:
-        r["_id"] = str(r["_id"])
-    return records
+# Newest first. Without limit or cursor this is the original bare list of every diagnosis; pass
+# either to get one page, {items, nextCursor}, and send nextCursor back as cursor for the next.
+# format=ndjson streams everything from the cursor on, one diagnosis per line (for exports).
+@router.get("/api/diagnosis")
+async def get_diagnoses(limit: Optional[int] = Query(None, ge=1, le=HISTORY_MAX_PAGE_SIZE),
+                        cursor: Optional[str] = None,
+                        fields: Optional[str] = Query(None, description="Comma-separated; pages skip transcript by default"),
+                        format: Literal["json", "ndjson"] = "json",
+                        user=Depends(get_current_user)):
+    field_list = [f.strip() for f in fields.split(",") if f.strip()] if fields else None
+    try:
+        projection_for(field_list)
+        if cursor:
+            decode_cursor(cursor)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    user_id = str(user["_id"])
+    if format == "ndjson":
+        return StreamingResponse(history_ndjson(user_id, cursor, field_list), media_type="application/x-ndjson")
+    if limit is None and cursor is None:
+        return await history_list(user_id, field_list)
+    return await history_page(user_id, limit or HISTORY_PAGE_SIZE, cursor, field_list)
 
 @router.get("/api/diagnosis/pdf/{diagnosis_id}")
 async def get_diagnosis_pdf(diagnosis_id: str):
     # 1. Fetch the diagnosis data from DB
-    diagnosis = await get_diagnosis_by_id(diagnosis_id)
+    diagnosis = await get_diagnosis_by_id(diagnosis_id, REPORT_FIELDS)
     if not diagnosis:
         raise HTTPException(status_code=404, detail="Diagnosis not found")
 
-    # 2. Generate the PDF and get the file path
-    pdf_path = generate_pdf_report(diagnosis)
+    # 2. Render it (or reuse the cached render of this version of the diagnosis)
+    key, pdf = await pdf_engine.render("report", diagnosis)
+
+    # 3. Return the PDF as a download; Content-Location is the stored copy in the media backend
+    return Response(
+        content=pdf,
+        media_type="application/pdf",
+        headers={
+            "Content-Disposition": f'attachment; filename="diagnosis-report-{diagnosis_id}.pdf"',
+            "Content-Location": media_store.url("pdf", key)
+        }
+    )
+
+class ExportRequest(BaseModel):
+    ids: Optional[List[str]] = None  # frontendIds
+    start: Optional[datetime] = None
+    end: Optional[datetime] = None
+    format: Literal["zip", "pdf"] = "zip"
+
+@router.post("/api/diagnosis/export")
+async def export_diagnoses(data: ExportRequest, user=Depends(get_current_user)):
+    if data.ids is None and not (data.start or data.end):
+        raise HTTPException(status_code=400, detail="Provide diagnosis ids or a date range.")
+    if data.ids is not None and len(data.ids) > EXPORT_MAX_REPORTS:
+        raise HTTPException(status_code=400, detail=f"At most {EXPORT_MAX_REPORTS} reports per export.")
+
+    # One $in / range query for the whole batch, only the fields the report shows
+    diagnoses = await find_user_diagnoses(str(user["_id"]), ids=data.ids, start=data.start, end=data.end,
+                                          projection=REPORT_FIELDS, limit=EXPORT_MAX_REPORTS + 1)
+    if not diagnoses:
+        raise HTTPException(status_code=404, detail="No diagnoses found")
+    if len(diagnoses) > EXPORT_MAX_REPORTS:
+        raise HTTPException(status_code=400, detail=f"More than {EXPORT_MAX_REPORTS} reports; narrow the date range.")
 
-    # 3. Return the PDF as a download
-    return FileResponse(
-        path=pdf_path,
-        filename=f"diagnosis-report-{diagnosis_id}.pdf",
-        media_type="application/pdf"
+    if data.format == "pdf":
+        key, pdf = await combined_pdf(diagnoses)
+        return Response(
+            content=pdf,
+            media_type="application/pdf",
+            headers={
+                "Content-Disposition": 'attachment; filename="diagnosis-reports.pdf"',
+                "Content-Location": media_store.url("pdf", key)
+            }
+        )
+    return StreamingResponse(
+        zip_stream(diagnoses),
+        media_type="application/zip",
+        headers={"Content-Disposition": 'attachment; filename="diagnosis-reports.zip"'}
     )
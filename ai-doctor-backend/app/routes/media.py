@@ -0,0 +1,23 @@
+from fastapi import APIRouter, Request
+from app.services.media_delivery import media_response
+
+router = APIRouter()
+
+# Streams an upload, TTS clip or PDF from whichever backend holds it, so any node can serve any object
+@router.api_route("/media/{namespace}/{key}", methods=["GET", "HEAD"])
+async def get_media(request: Request, namespace: str, key: str):
+    return await media_response(request, namespace, key)
+
+# Links handed out by the local backend (and stored on older diagnoses) go through the same
+# Range/ETag/caching path that the plain static mounts used to bypass
+@router.api_route("/uploads/{key}", methods=["GET", "HEAD"])
+async def get_upload(request: Request, key: str):
+    return await media_response(request, "uploads", key)
+
+@router.api_route("/temp/tts/{key}", methods=["GET", "HEAD"])
+async def get_tts_clip(request: Request, key: str):
+    return await media_response(request, "tts", key)
+
+@router.api_route("/temp/{key}", methods=["GET", "HEAD"])
+async def get_temp_file(request: Request, key: str):
+    return await media_response(request, "pdf", key)
@@ -1,6 +1,7 @@
-from fastapi import APIRouter, Request
-from fastapi.responses import FileResponse
-from app.services.pdf_service import generate_enhanced_pdf_report
+from fastapi import APIRouter, Request, Response
+from app.services.image_resolver import image_resolver
+from app.services.media_store import media_store
+from app.services.pdf_engine import pdf_engine
 
 router = APIRouter()
 
@@ -12,7 +13,13 @@ async def generate_pdf_report_route(request: Request):
     # For example, you can pass the user ID, diagnosis ID, etc.
     # and fetch more details from the database here.
     
-    filepath, filename = generate_enhanced_pdf_report(data)
+    # Identical payloads are served from the engine's cache instead of being rendered again
+    key, pdf = await pdf_engine.render("enhanced", data, image_url=data.get("image_url"))
     
-    return FileResponse(filepath, media_type="application/pdf", filename=filename)
+    return Response(pdf, media_type="application/pdf",
+                    headers={"Content-Disposition": f'attachment; filename="diagnosis_report_{key[:32]}.pdf"',
+                             "Content-Location": media_store.url("pdf", key)})
 
+@router.get("/api/pdf-report/stats")
+async def pdf_report_stats():
+    return {**pdf_engine.stats(), "images": image_resolver.stats()}
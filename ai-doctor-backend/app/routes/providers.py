@@ -0,0 +1,15 @@
+from fastapi import APIRouter
+from app.services.health import health_stats
+from app.services.providers import registry
+
+router = APIRouter()
+
+# Connection pool statistics per provider, for sizing PROVIDER_POOL_SIZE / PROVIDER_KEEPALIVE
+@router.get("/stats")
+async def provider_stats():
+    return registry.stats()
+
+# Circuit breaker state, rolling error rate and p95 latency per provider
+@router.get("/health")
+async def provider_health():
+    return health_stats()
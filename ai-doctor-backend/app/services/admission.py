@@ -0,0 +1,293 @@
+# app/services/admission.py
+#
+# Admission control for the routes that end up spending provider quota. Each client (the user
+# behind the bearer token, else the caller's IP) has a token bucket per route class, each provider
+# has one bucket for the whole deployment, and chat/TTS requests take a slot in their *_requests
+# stage before their uploads are read. Whatever is over a limit gets a fast 429/503 with
+# Retry-After. Buckets live in this process ("local") or in Mongo ("mongo"), shared by every worker.
+
+import asyncio
+import json
+import math
+import os
+import threading
+import time
+from datetime import datetime, timezone
+
+from fastapi import HTTPException
+from pymongo.errors import DuplicateKeyError, PyMongoError
+
+from app.db import db
+from app.services.metrics import metrics
+from app.services.stages import AdmissionRejected, reset_deadline, set_deadline, stage, time_left
+from app.services.upload_store import MAX_UPLOAD_REQUEST_BYTES
+from app.utils.auth import verify_token
+from app.utils.trace import log
+
+RATE_LIMIT_BACKEND = os.environ.get("RATE_LIMIT_BACKEND", "local").lower()
+RATE_LIMIT_COLLECTION = "rate_limits"
+# Only behind a proxy that sets X-Forwarded-For itself; otherwise any client could pick its own key
+TRUST_FORWARDED_FOR = os.environ.get("TRUST_FORWARDED_FOR", "false").lower() == "true"
+# How long an interactive request may wait for a provider's bucket to refill before it's shed
+PROVIDER_MAX_WAIT = float(os.environ.get("PROVIDER_MAX_WAIT", "5"))
+LOCAL_BUCKET_KEYS = 10000  # full buckets are forgotten once there are more than this many
+
+
+def _limit(prefix: str, per_minute: float, burst: int) -> tuple:
+    return (float(os.environ.get(f"{prefix}_RATE_PER_MINUTE", per_minute)),
+            int(os.environ.get(f"{prefix}_BURST", burst)))
+
+
+# Per client and route class: sustained requests per minute and burst (a rate of 0 turns it off)
+CLIENT_LIMITS = {
+    "chat": _limit("CHAT", 10, 5),
+    "tts": _limit("TTS", 30, 10),
+}
+# Per provider across the deployment: calls per minute and burst, to stay inside the API quotas
+PROVIDER_LIMITS = {
+    "groq-stt": _limit("GROQ_STT", 120, 20),
+    "groq-vision": _limit("GROQ_VISION", 120, 20),
+    "elevenlabs": _limit("ELEVENLABS", 100, 10),
+    "gtts": _limit("GTTS", 300, 30),
+}
+# Seconds a request of each class has to finish; stages shed work that can't make it in time
+REQUEST_DEADLINES = {
+    "chat": float(os.environ.get("CHAT_DEADLINE", "60")),
+    "tts": float(os.environ.get("TTS_DEADLINE", "30")),
+}
+# Request body cap per route class; only the multipart chat uploads are large
+BODY_LIMITS = {
+    "chat": MAX_UPLOAD_REQUEST_BYTES,
+}
+
+# (method, path) -> route class
+ADMITTED_ROUTES = {
+    ("POST", "/api/chat"): "chat",
+    ("POST", "/api/chat/stream"): "chat",
+    ("POST", "/api/chat/jobs"): "chat",
+    ("POST", "/api/tts"): "tts",
+    ("POST", "/api/tts/stream"): "tts",
+    ("GET", "/api/tts/stream"): "tts",
+}
+
+
+def _gcra(tat, now: float, per_minute: float, burst: int, cost: int = 1) -> tuple:
+    """Token bucket kept as a single timestamp (GCRA): tat is when the bucket would be full again.
+    Returns (new tat, 0) when the tokens were taken, else (tat, seconds until they're there)."""
+    interval = 60.0 / per_minute
+    new_tat = max(tat or now, now) + cost * interval
+    excess = new_tat - now - burst * interval
+    if excess > 0:
+        return tat, excess
+    return new_tat, 0.0
+
+
+class LocalBuckets:
+    name = "local"
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._tats = {}
+
+    async def take(self, key: str, per_minute: float, burst: int, cost: int = 1) -> float:
+        """0 if the tokens were taken, else the seconds until they would be."""
+        now = time.time()
+        with self._lock:
+            tat, wait = _gcra(self._tats.get(key), now, per_minute, burst, cost)
+            if not wait:
+                self._tats[key] = tat
+                if len(self._tats) > LOCAL_BUCKET_KEYS:
+                    self._tats = {k: t for k, t in self._tats.items() if t > now}
+        return wait
+
+    def stats(self) -> dict:
+        return {"keys": len(self._tats)}
+
+
+# One document per bucket ({_id: key, tat, expiresAt}), updated compare-and-swap style so
+# concurrent workers never both spend the same token. Mongo's TTL monitor drops a bucket once
+# it would be full again, which is the same as it never having been used.
+class MongoBuckets:
+    name = "mongo"
+    attempts = 3
+
+    def __init__(self, collection: str = RATE_LIMIT_COLLECTION):
+        self.collection = collection
+        self.fallback = LocalBuckets()
+        self.conflicts = 0
+        self.errors = 0
+
+    async def take(self, key: str, per_minute: float, burst: int, cost: int = 1) -> float:
+        collection = db[self.collection]
+        try:
+            for _ in range(self.attempts):
+                doc = await collection.find_one({"_id": key}, {"tat": 1})
+                current = doc["tat"] if doc else None
+                tat, wait = _gcra(current, time.time(), per_minute, burst, cost)
+                if wait:
+                    return wait
+                fields = {"tat": tat, "expiresAt": datetime.fromtimestamp(tat, timezone.utc)}
+                if doc is None:
+                    try:
+                        await collection.insert_one({"_id": key, **fields})
+                        return 0.0
+                    except DuplicateKeyError:
+                        pass
+                elif (await collection.update_one({"_id": key, "tat": current}, {"$set": fields})).modified_count:
+                    return 0.0
+                self.conflicts += 1
+        except PyMongoError as e:
+            # Limits keep applying per process rather than not at all
+            self.errors += 1
+            log("ADMISSION", f"Mongo rate limits unavailable ({e}); using this worker's buckets")
+            return await self.fallback.take(key, per_minute, burst, cost)
+        # Lost every race: others are taking this bucket's tokens right now
+        return cost * 60.0 / per_minute
+
+    def stats(self) -> dict:
+        return {"conflicts": self.conflicts, "errors": self.errors, "fallback_keys": len(self.fallback._tats)}
+
+
+_BACKENDS = {"local": LocalBuckets, "mongo": MongoBuckets}
+
+
+def _build_buckets():
+    if RATE_LIMIT_BACKEND not in _BACKENDS:
+        raise RuntimeError(f"Unknown RATE_LIMIT_BACKEND {RATE_LIMIT_BACKEND!r} (expected one of {', '.join(_BACKENDS)})")
+    return _BACKENDS[RATE_LIMIT_BACKEND]()
+
+
+buckets = _build_buckets()
+
+
+async def admit_client(route_class: str, client: str) -> None:
+    per_minute, burst = CLIENT_LIMITS[route_class]
+    if per_minute <= 0:
+        return
+    wait = await buckets.take(f"{route_class}:{client}", per_minute, burst)
+    if wait:
+        metrics.inc("aidoctor_admission_rejected_total", scope=f"client_{route_class}", reason="rate_limit")
+        raise AdmissionRejected(429, "Too many requests, please slow down", wait)
+
+
+async def take_provider(provider: str) -> float:
+    """Take one call from the provider's bucket: 0 if taken, else the seconds until one is free."""
+    per_minute, burst = PROVIDER_LIMITS[provider]
+    if per_minute <= 0:
+        return 0.0
+    return await buckets.take(f"provider:{provider}", per_minute, burst)
+
+
+async def admit_provider(provider: str) -> None:
+    """Take one call from the provider's bucket, waiting for it as long as the request can afford
+    (queued jobs always wait); otherwise the request is shed with a 503."""
+    while wait := await take_provider(provider):
+        left = time_left()
+        if left is not None and wait > min(PROVIDER_MAX_WAIT, left):
+            metrics.inc("aidoctor_admission_rejected_total", scope=provider, reason="quota")
+            raise AdmissionRejected(503, f"{provider} is at its request quota, try again shortly", wait)
+        await asyncio.sleep(wait)
+
+
+def client_key(scope) -> str:
+    headers = dict(scope.get("headers") or [])
+    authorization = headers.get(b"authorization", b"").decode("latin-1")
+    if authorization[:7].lower() == "bearer ":
+        try:
+            user_id = verify_token(authorization[7:].strip()).get("user_id")
+        except Exception:
+            user_id = None
+        if user_id:
+            return f"user:{user_id}"
+    if TRUST_FORWARDED_FOR and b"x-forwarded-for" in headers:
+        return "ip:" + headers[b"x-forwarded-for"].decode("latin-1").split(",")[0].strip()
+    client = scope.get("client")
+    return f"ip:{client[0] if client else 'unknown'}"
+
+
+async def _send_json(send, status_code: int, detail: str, headers: list = ()) -> None:
+    body = json.dumps({"detail": detail}).encode()
+    await send({
+        "type": "http.response.start",
+        "status": status_code,
+        "headers": [
+            (b"content-type", b"application/json"),
+            (b"content-length", str(len(body)).encode()),
+            *headers,
+        ],
+    })
+    await send({"type": "http.response.body", "body": body})
+
+
+async def _send_rejection(send, rejection: AdmissionRejected) -> None:
+    retry_after = str(max(1, math.ceil(rejection.retry_after))).encode()
+    await _send_json(send, rejection.status_code, rejection.detail, [(b"retry-after", retry_after)])
+
+
+def _content_length(scope):
+    for name, value in scope.get("headers") or []:
+        if name == b"content-length":
+            try:
+                return int(value)
+            except ValueError:
+                return None
+    return None
+
+
+def _too_large(route_class: str, limit: int) -> str:
+    metrics.inc("aidoctor_admission_rejected_total", scope=f"client_{route_class}", reason="too_large")
+    return f"Request body exceeds {limit} bytes"
+
+
+# Bodies without a Content-Length (chunked) are counted as they arrive. FastAPI passes an
+# HTTPException raised while the form is read straight through, so the client still gets a 413.
+def _limited(receive, route_class: str, limit: int):
+    received = 0
+
+    async def limited_receive():
+        nonlocal received
+        message = await receive()
+        if message["type"] == "http.request":
+            received += len(message.get("body", b""))
+            if received > limit:
+                raise HTTPException(status_code=413, detail=_too_large(route_class, limit))
+        return message
+    return limited_receive
+
+
+# Plain ASGI, so a rejected request (over its rate, its slots or its size) is answered before its
+# multipart body is read and spooled
+class AdmissionMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        route_class = ADMITTED_ROUTES.get((scope.get("method"), scope.get("path"))) if scope["type"] == "http" else None
+        if route_class is None:
+            return await self.app(scope, receive, send)
+
+        # Oversized uploads are refused from the headers alone, before any of the body is read
+        limit = BODY_LIMITS.get(route_class)
+        if limit is not None:
+            length = _content_length(scope)
+            if length is not None and length > limit:
+                return await _send_json(send, 413, _too_large(route_class, limit))
+            receive = _limited(receive, route_class, limit)
+
+        token = set_deadline(REQUEST_DEADLINES[route_class])
+        admitted = False
+        try:
+            await admit_client(route_class, client_key(scope))
+            async with stage(f"{route_class}_requests"):
+                admitted = True
+                await self.app(scope, receive, send)
+        except AdmissionRejected as e:
+            if admitted:
+                raise
+            await _send_rejection(send, e)
+        finally:
+            reset_deadline(token)
+
+
+def admission_stats() -> dict:
+    return {"backend": buckets.name, **buckets.stats()}
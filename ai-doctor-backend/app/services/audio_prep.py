@@ -0,0 +1,105 @@
+# app/services/audio_prep.py
+
+import os
+import threading
+import time
+import uuid
+
+from app.utils.trace import log
+
+# Whisper works at 16 kHz mono internally, so anything richer is wasted upload
+AUDIO_SAMPLE_RATE = int(os.environ.get("AUDIO_SAMPLE_RATE", "16000"))
+AUDIO_FORMAT = os.environ.get("AUDIO_FORMAT", "mp3")
+AUDIO_BITRATE = os.environ.get("AUDIO_BITRATE", "32k")
+AUDIO_MAX_SECONDS = float(os.environ.get("AUDIO_MAX_SECONDS", "120"))
+AUDIO_MIN_SILENCE_MS = int(os.environ.get("AUDIO_MIN_SILENCE_MS", "300"))
+AUDIO_SILENCE_BELOW_DB = float(os.environ.get("AUDIO_SILENCE_BELOW_DB", "16"))  # relative to clip loudness
+AUDIO_KEEP_SILENCE_MS = int(os.environ.get("AUDIO_KEEP_SILENCE_MS", "200"))
+# Normalized copies only feed STT; the janitor expires them like other scratch files
+AUDIO_PREP_DIR = os.path.join("temp", "stt")
+
+_totals_lock = threading.Lock()
+_totals = {"clips": 0, "skipped": 0, "bytes_in": 0, "bytes_out": 0, "seconds": 0.0}
+
+
+def _trim_silence(segment):
+    from pydub.silence import detect_nonsilent
+    if segment.dBFS == float("-inf"):
+        return segment
+    ranges = detect_nonsilent(
+        segment,
+        min_silence_len=AUDIO_MIN_SILENCE_MS,
+        silence_thresh=segment.dBFS - AUDIO_SILENCE_BELOW_DB,
+    )
+    if not ranges:
+        return segment
+    # Only leading and trailing silence; pauses inside speech are left alone
+    start = max(0, ranges[0][0] - AUDIO_KEEP_SILENCE_MS)
+    end = min(len(segment), ranges[-1][1] + AUDIO_KEEP_SILENCE_MS)
+    return segment[start:end]
+
+
+def _reuse(out_path: str):
+    os.utime(out_path)  # fresh again as far as the storage janitor is concerned
+    return out_path, {"cached": True, "bytes_out": os.path.getsize(out_path)}
+
+
+def normalize_audio(audio_path: str):
+    """Trim silence, cap duration, downmix to mono 16 kHz and transcode to a compact format.
+
+    Returns (path to send to STT, stats). The original upload is left as it is (it's what the
+    stored diagnosis links to); the normalized copy goes to AUDIO_PREP_DIR. If the clip can't be
+    decoded (e.g. ffmpeg missing) the original path is returned. Uploads are named by content hash,
+    so a clip that was already normalized once is reused as is.
+    """
+    from pydub import AudioSegment  # imported on first use: it's slow and only chat needs it
+    start = time.perf_counter()
+    name = os.path.basename(audio_path)
+    out_path = os.path.join(AUDIO_PREP_DIR, f"{name.split('.')[0]}.{AUDIO_SAMPLE_RATE // 1000}k.{AUDIO_FORMAT}")
+    if os.path.exists(out_path):
+        return _reuse(out_path)
+    os.makedirs(AUDIO_PREP_DIR, exist_ok=True)
+    tmp_path = f"{out_path}.{uuid.uuid4().hex}.tmp"
+    try:
+        bytes_in = os.path.getsize(audio_path)
+        segment = AudioSegment.from_file(audio_path)
+        original_ms = len(segment)
+        segment = _trim_silence(segment)[:int(AUDIO_MAX_SECONDS * 1000)]
+        segment = segment.set_channels(1).set_frame_rate(AUDIO_SAMPLE_RATE)
+
+        segment.export(tmp_path, format=AUDIO_FORMAT, bitrate=AUDIO_BITRATE)
+        os.replace(tmp_path, out_path)
+    except Exception as e:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+        # A concurrent request for the same clip may have finished it in the meantime
+        if os.path.exists(out_path):
+            return _reuse(out_path)
+        log("AUDIO", f"Skipping normalization of {audio_path}: {e}")
+        with _totals_lock:
+            _totals["skipped"] += 1
+        return audio_path, {"skipped": str(e)}
+
+    bytes_out = os.path.getsize(out_path)
+    elapsed = time.perf_counter() - start
+    stats = {
+        "bytes_in": bytes_in,
+        "bytes_out": bytes_out,
+        "bytes_saved": bytes_in - bytes_out,
+        "duration_in_ms": original_ms,
+        "duration_out_ms": len(segment),
+        "seconds": round(elapsed, 3),
+    }
+    with _totals_lock:
+        _totals["clips"] += 1
+        _totals["bytes_in"] += bytes_in
+        _totals["bytes_out"] += bytes_out
+        _totals["seconds"] += elapsed
+    log("AUDIO", f"{os.path.basename(audio_path)}: {bytes_in} -> {bytes_out} bytes, "
+                 f"{original_ms} -> {len(segment)} ms in {elapsed * 1000:.0f} ms")
+    return out_path, stats
+
+
+def audio_totals() -> dict:
+    with _totals_lock:
+        return dict(_totals, bytes_saved=_totals["bytes_in"] - _totals["bytes_out"])
@@ -0,0 +1,89 @@
+# app/services/auth_cache.py
+
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from bson.objectid import ObjectId
+
+from app.db import db
+
+AUTH_CACHE_TTL = float(os.environ.get("AUTH_CACHE_TTL", "60"))  # 0 disables both caches
+AUTH_CACHE_ENTRIES = int(os.environ.get("AUTH_CACHE_ENTRIES", "10000"))
+
+
+# LRU with a per-entry expiry. Only touched from the event loop, so no locking.
+class TTLCache:
+    def __init__(self, max_entries: int = AUTH_CACHE_ENTRIES, ttl: float = AUTH_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl = ttl
+        self._entries = OrderedDict()  # key -> (expires at, value)
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key):
+        entry = self._entries.get(key)
+        if entry is None or entry[0] <= time.monotonic():
+            if entry is not None:
+                del self._entries[key]
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry[1]
+
+    def put(self, key, value, ttl: float = None) -> None:
+        ttl = self.ttl if ttl is None else min(ttl, self.ttl)
+        if ttl <= 0:
+            return
+        self._entries[key] = (time.monotonic() + ttl, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def pop(self, key) -> None:
+        self._entries.pop(key, None)
+
+    def stats(self) -> dict:
+        return {"entries": len(self._entries), "hits": self.hits, "misses": self.misses}
+
+
+token_cache = TTLCache()  # token -> decoded payload
+user_cache = TTLCache()   # user id -> user document
+
+
+def token_id(token: str) -> str:
+    return hashlib.sha256(token.encode("utf-8")).hexdigest()
+
+
+async def load_user(user_id: str):
+    """The user document for an id string, from the cache when possible; None if there's no such user."""
+    user = user_cache.get(user_id)
+    if user is None:
+        user = await db.users.find_one({"_id": ObjectId(user_id)})
+        if user is not None:
+            user_cache.put(user_id, user)
+    return user
+
+
+def invalidate_user(user_id: str) -> None:
+    user_cache.pop(user_id)
+
+
+# Logged-out tokens stay rejected until they would have expired anyway. Kept in Mongo (with a TTL
+# index) so every node sees them; a token another node still has cached stays usable for at most
+# AUTH_CACHE_TTL seconds.
+async def revoke_token(token: str, payload: dict) -> None:
+    token_cache.pop(token)
+    expires = datetime.fromtimestamp(payload.get("exp", time.time()), timezone.utc)
+    await db.revoked_tokens.update_one({"_id": token_id(token)}, {"$set": {"expiresAt": expires}}, upsert=True)
+
+
+async def is_revoked(token: str) -> bool:
+    return await db.revoked_tokens.find_one({"_id": token_id(token)}, {"_id": 1}) is not None
+
+
+def stats() -> dict:
+    return {"tokens": token_cache.stats(), "users": user_cache.stats(), "ttl": AUTH_CACHE_TTL}
@@ -0,0 +1,282 @@
+# app/services/chat_pipeline.py
+
+import asyncio
+import os
+import time
+
+from pymongo.errors import DuplicateKeyError
+
+from app.db import db
+from app.models.diagnosis import Diagnosis
+from app.services.admission import admit_provider
+from app.services.stages import stage
+from app.services.stt import cached_transcript, transcribe_uncached
+from app.services.tts import speak
+from app.services.audio_prep import normalize_audio
+from app.services.image_prep import ImageTooLarge, prepare_image
+from app.services.image_resolver import media_location
+from app.services.media_store import MediaNotFound, media_store
+from app.services.metrics import collect_timings, describe_timings, metrics
+from app.services.upload_store import UploadRejected, digest_of, ensure_local, store_upload, upload_url
+from app.services.vision import stream_encoded_image
+from app.utils.executor import iterate_blocking, run_blocking
+from app.utils.trace import current_trace_id, log
+
+NO_IMAGE_DIAGNOSIS = "No image provided for me to analyze."
+
+SYSTEM_PROMPT = """You have to act as a professional doctor, i know you are not but this is for learning purpose.
+        What's in this image?. Do you find anything wrong with it medically?
+        If you make a differential, suggest some remedies for them. Donot add any numbers or special characters in
+        your response. Your response should be in one long paragraph. Also always answer as if you are answering to a real person.
+        Donot say 'In the image I see' but say 'With what I see and hear, I think you have ....'
+        Dont respond as an AI model in markdown, your answer should mimic that of an actual doctor not an AI bot,
+        Keep your answer concise (max 2 sentences). No preamble, start your answer right away please"""
+
+
+def build_query(transcript: str, symptom: str = None) -> str:
+    system_prompt = SYSTEM_PROMPT
+    if symptom:
+        system_prompt += f" The user has also indicated a primary symptom of: {symptom}. Please take this into account."
+    return system_prompt + transcript
+
+
+# UploadFiles are stored as the request comes in; queued jobs hand over paths stored at submission.
+# Either way the file is named by its content hash, which doubles as the stage cache key.
+async def _materialize(source, kind: str):
+    async with metrics.span(f"save_{kind}"):
+        if isinstance(source, str):
+            return await ensure_local(source), digest_of(source)
+        stored = await store_upload(source, kind)
+    metrics.observe("aidoctor_payload_bytes", stored["size"], kind=f"upload_{kind}")
+    return stored["path"], stored["digest"]
+
+
+async def _store_uploads(audio, image=None):
+    # Let both uploads settle before reporting a rejection, so no write is left running
+    stored_audio, stored_image = await asyncio.gather(
+        _materialize(audio, "audio"),
+        _materialize(image, "image") if image else asyncio.sleep(0),
+        return_exceptions=True,
+    )
+    for stored in (stored_audio, stored_image):
+        if isinstance(stored, BaseException):
+            raise stored
+    return stored_audio[0], stored_image[0] if stored_image else None
+
+
+async def _save_and_prepare(image):
+    image_path, digest = await _materialize(image, "image")
+    # Downsized, re-encoded payload plus its real MIME type
+    async with metrics.span("image_prep"):
+        try:
+            prepared = await run_blocking(prepare_image, image_path, digest)
+        except ImageTooLarge as e:
+            raise UploadRejected(413, f"Image is too large to process: {e}")
+    metrics.observe("aidoctor_payload_bytes", len(prepared[0]), kind="vision_image")
+    return image_path, prepared
+
+
+def _payload(doc: dict) -> dict:
+    return {
+        "transcript": doc.get("transcript"),
+        "diagnosis": doc.get("diagnosis"),
+        "voice_url": doc.get("ttsUrl"),
+        "image_url": doc.get("imageUrl"),
+        "audio_url": doc.get("audioUrl")
+    }
+
+
+def _stored_events(doc: dict):
+    payload = _payload(doc)
+    yield "transcript", {"transcript": payload["transcript"]}
+    yield "diagnosis", {"diagnosis": payload["diagnosis"]}
+    yield "audio", {"voice_url": payload["voice_url"]}
+    yield "done", payload
+
+
+async def _insert_diagnosis(record: Diagnosis) -> dict:
+    doc = record.model_dump()
+    async with metrics.span("db_insert"):
+        try:
+            await db.diagnoses.insert_one(doc)
+            return doc
+        except DuplicateKeyError:
+            # Another worker finished the same frontendId first; its stored result wins
+            return await db.diagnoses.find_one({"frontendId": record.frontendId})
+
+
+async def _speak_in_stage(text: str, mode: str) -> str:
+    async with stage("tts"), metrics.span("tts"):
+        return await speak(text, mode=mode)
+
+
+# A stored diagnosis is only replayed once its voice exists too (a record can outlive its clip, or
+# predate inserting after TTS); a missing voice is rendered again and the record pointed at it
+async def _complete_stored(doc: dict, tts_mode: str) -> dict:
+    if doc.get("ttsUrl"):
+        # Older records point at /temp/<uuid>.mp3 rather than the tts namespace
+        location = media_location(doc["ttsUrl"])
+        if location is None:
+            return doc  # not our media; nothing to check
+        try:
+            await media_store.stat(*location)
+            return doc
+        except MediaNotFound:
+            pass
+    log("CHAT", f"{doc.get('frontendId')} is stored without its voice; rendering it again")
+    voice_path = await _speak_in_stage(doc["diagnosis"], tts_mode)
+    voice_url = media_store.url("tts", os.path.basename(voice_path))
+    if voice_url != doc.get("ttsUrl"):
+        await db.diagnoses.update_one({"_id": doc["_id"]}, {"$set": {"ttsUrl": voice_url}})
+    return {**doc, "ttsUrl": voice_url}
+
+
+# Runs the diagnosis and yields (event, data) pairs in order as each stage finishes:
+# transcript -> token* -> diagnosis -> audio -> done
+async def _run_pipeline(audio, image=None, symptom: str = None, frontendId: str = None, tts_mode: str = "whole"):
+    started = time.perf_counter()
+    timings = collect_timings()
+    # 1. Save and prepare the image while the audio is saved and transcribed
+    image_task = asyncio.create_task(_save_and_prepare(image)) if image else None
+    try:
+        audio_path, audio_digest = await _materialize(audio, "audio")
+        # Smaller, trimmed mono copy for a faster Whisper upload; the diagnosis keeps the original
+        async with metrics.span("audio_prep"):
+            stt_path, _ = await run_blocking(normalize_audio, audio_path)
+        metrics.observe("aidoctor_payload_bytes", os.path.getsize(stt_path), kind="stt_audio")
+        # A cached transcript needs neither an STT slot nor Groq quota
+        transcript = cached_transcript(audio_digest)
+        if transcript is None:
+            async with stage("stt"), metrics.span("stt"):
+                await admit_provider("groq-stt")
+                transcript = await run_blocking(transcribe_uncached, stt_path, audio_digest)
+        yield "transcript", {"transcript": transcript}
+
+        image_path, prepared = await image_task if image_task else (None, None)
+    finally:
+        if image_task and not image_task.done():
+            image_task.cancel()
+    audio_url = upload_url(audio_path)
+    image_url = upload_url(image_path) if image_path else None
+
+    # 2. Diagnose image, forwarding tokens as the completion streams
+    if prepared:
+        encoded, mime_type = prepared
+        tokens = []
+        async with stage("vision"), metrics.span("vision"):
+            await admit_provider("groq-vision")
+            async for token in iterate_blocking(stream_encoded_image, build_query(transcript, symptom), encoded, mime_type):
+                tokens.append(token)
+                yield "token", {"token": token}
+        diagnosis = "".join(tokens)
+    else:
+        diagnosis = NO_IMAGE_DIAGNOSIS
+    yield "diagnosis", {"diagnosis": diagnosis}
+
+    # 3. Speech, then the Mongo insert: the diagnosis is only stored once its voice exists, so a
+    # failed TTS leaves no half-finished record for a retry to replay. The voice URL is that of the
+    # clip speak() returns, which is the gTTS one after a fallback.
+    voice_path = await _speak_in_stage(diagnosis, tts_mode)
+    record = Diagnosis(
+        userId="anonymous",
+        diagnosis=diagnosis,
+        transcript=transcript,
+        audioUrl=audio_url,
+        imageUrl=image_url,
+        ttsUrl=media_store.url("tts", os.path.basename(voice_path)),
+        symptom=symptom,
+        frontendId=frontendId,
+        traceId=current_trace_id()
+    )
+    stored = await _insert_diagnosis(record)
+    payload = _payload(stored)
+    yield "audio", {"voice_url": payload["voice_url"]}
+
+    log("CHAT", f"{frontendId} diagnosed in {(time.perf_counter() - started) * 1000:.0f}ms: {describe_timings(timings)}")
+    yield "done", payload
+
+
+# One in-flight diagnosis per frontendId. Events are buffered so a duplicate submission
+# can attach at any point and replay everything it missed.
+class _ChatRun:
+    def __init__(self):
+        self.events = []
+        self.finished = False
+        self.error = None
+        self.task = None
+        self._changed = asyncio.Event()
+
+    def publish(self, event: str, data: dict) -> None:
+        self.events.append((event, data))
+        self._wake()
+
+    def _wake(self) -> None:
+        self._changed.set()
+        self._changed = asyncio.Event()
+
+    async def drive(self, events, frontendId: str) -> None:
+        try:
+            async for event, data in events:
+                self.publish(event, data)
+        except Exception as e:
+            self.error = e
+        finally:
+            self.close(frontendId)
+
+    def close(self, frontendId: str) -> None:
+        self.finished = True
+        _inflight.pop(frontendId, None)
+        self._wake()
+
+    async def subscribe(self):
+        seen = 0
+        while True:
+            while seen < len(self.events):
+                yield self.events[seen]
+                seen += 1
+            if self.finished:
+                break
+            await self._changed.wait()
+        if self.error:
+            raise self.error
+
+
+_inflight = {}
+
+
+# Idempotent on frontendId: a completed submission replays the stored result and a
+# concurrent duplicate attaches to the running computation instead of starting another
+async def stream_chat(audio, image=None, symptom: str = None, frontendId: str = None, tts_mode: str = "whole"):
+    run = _inflight.get(frontendId)
+    if run is None:
+        existing = await db.diagnoses.find_one({"frontendId": frontendId})
+        if existing:
+            for event in _stored_events(await _complete_stored(existing, tts_mode)):
+                yield event
+            return
+        run = _inflight.get(frontendId)
+        if run is None:
+            run = _inflight[frontendId] = _ChatRun()
+            # Starlette closes the UploadFiles when this request ends, which can be before the
+            # pipeline is done with them, so they are stored here and the pipeline gets paths
+            try:
+                audio, image = await _store_uploads(audio, image)
+            except BaseException as e:
+                # Duplicates already attached to this run fail the same way
+                run.error = e if isinstance(e, Exception) else RuntimeError("upload was interrupted")
+                run.close(frontendId)
+                raise
+            # Runs as its own task so a client that disconnects doesn't abort work others may share
+            run.task = asyncio.create_task(run.drive(_run_pipeline(audio, image, symptom, frontendId, tts_mode), frontendId))
+
+    async for event in run.subscribe():
+        yield event
+
+
+# Non-streaming wrapper kept for /api/chat: drains the event stream and returns the final payload
+async def run_chat(audio, image=None, symptom: str = None, frontendId: str = None, tts_mode: str = "whole") -> dict:
+    result = None
+    async for event, data in stream_chat(audio, image=image, symptom=symptom, frontendId=frontendId, tts_mode=tts_mode):
+        if event == "done":
+            result = data
+    return result
@@ -0,0 +1,178 @@
+# app/services/health.py
+
+import os
+import threading
+import time
+from collections import deque
+
+from app.services.metrics import metrics
+from app.utils.trace import log
+
+BREAKER_WINDOW_SECONDS = float(os.environ.get("BREAKER_WINDOW_SECONDS", "60"))
+BREAKER_MIN_CALLS = int(os.environ.get("BREAKER_MIN_CALLS", "5"))
+BREAKER_ERROR_RATE = float(os.environ.get("BREAKER_ERROR_RATE", "0.5"))
+BREAKER_COOLDOWN_SECONDS = float(os.environ.get("BREAKER_COOLDOWN_SECONDS", "30"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+
+class ProviderUnavailable(Exception):
+    def __init__(self, name: str, retry_after: float):
+        super().__init__(f"{name} is temporarily unavailable")
+        self.name = name
+        self.retry_after = retry_after
+
+
+# Circuit breaker over a rolling window of call outcomes and latencies.
+# Trips on a high error rate or (optionally) a p95 latency above slow_p95; after the
+# cooldown a single half-open probe decides whether to close again.
+class ProviderHealth:
+    def __init__(self, name: str, slow_p95: float = None, window_seconds: float = BREAKER_WINDOW_SECONDS,
+                 min_calls: int = BREAKER_MIN_CALLS, error_rate: float = BREAKER_ERROR_RATE,
+                 cooldown_seconds: float = BREAKER_COOLDOWN_SECONDS):
+        self.name = name
+        self.slow_p95 = slow_p95
+        self.window_seconds = window_seconds
+        self.min_calls = min_calls
+        self.error_rate_threshold = error_rate
+        self.cooldown_seconds = cooldown_seconds
+        self._lock = threading.Lock()
+        self._samples = deque(maxlen=500)  # (timestamp, ok, latency)
+        self._state = CLOSED
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._probe_started = 0.0
+        self.trips = 0
+        self.rejected = 0
+
+    def _trim(self, now: float) -> None:
+        while self._samples and now - self._samples[0][0] > self.window_seconds:
+            self._samples.popleft()
+
+    def _error_rate(self) -> float:
+        if not self._samples:
+            return 0.0
+        return sum(1 for _, ok, _ in self._samples if not ok) / len(self._samples)
+
+    def _p95(self):
+        latencies = sorted(latency for _, ok, latency in self._samples if ok)
+        if not latencies:
+            return None
+        return latencies[min(len(latencies) - 1, int(len(latencies) * 0.95))]
+
+    @property
+    def state(self) -> str:
+        with self._lock:
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown_seconds:
+                return HALF_OPEN
+            return self._state
+
+    def retry_after(self) -> float:
+        with self._lock:
+            return max(0.0, self.cooldown_seconds - (time.monotonic() - self._opened_at))
+
+    def allow(self) -> bool:
+        """Whether a call should go to this provider right now."""
+        with self._lock:
+            if self._state == CLOSED:
+                return True
+            if self._state == OPEN and time.monotonic() - self._opened_at >= self.cooldown_seconds:
+                self._state = HALF_OPEN
+            # A probe that never reported back (hung, or lost without release()) stops blocking
+            # the next one after another cooldown
+            if self._state == HALF_OPEN and (not self._probe_in_flight or
+                                             time.monotonic() - self._probe_started >= self.cooldown_seconds):
+                self._probe_in_flight = True
+                self._probe_started = time.monotonic()
+                return True
+            self.rejected += 1
+        metrics.inc("aidoctor_provider_rejected_total", provider=self.name)
+        return False
+
+    def release(self) -> None:
+        """Hand back a half-open probe that ended without an outcome (cancelled, caller gone), so
+        the next call probes instead of the breaker staying half-open."""
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+
+    def record(self, ok: bool, latency: float) -> None:
+        # Every provider call ends up here, so this is also where provider latency is exported
+        metrics.observe("aidoctor_provider_seconds", latency, provider=self.name, outcome="ok" if ok else "error")
+        if not ok:
+            metrics.inc("aidoctor_provider_errors_total", provider=self.name)
+        now = time.monotonic()
+        with self._lock:
+            if self._state == HALF_OPEN:
+                self._probe_in_flight = False
+                if ok and (self.slow_p95 is None or latency <= self.slow_p95):
+                    self._state = CLOSED
+                    self._samples.clear()
+                else:
+                    self._trip(now)
+                return
+            self._samples.append((now, ok, latency))
+            self._trim(now)
+            if self._state == CLOSED and len(self._samples) >= self.min_calls:
+                p95 = self._p95()
+                if self._error_rate() >= self.error_rate_threshold or (
+                        self.slow_p95 is not None and p95 is not None and p95 > self.slow_p95):
+                    self._trip(now)
+
+    def _trip(self, now: float) -> None:
+        self._state = OPEN
+        self._opened_at = now
+        self.trips += 1
+        log("HEALTH", f"{self.name} circuit opened for {self.cooldown_seconds:.0f}s")
+
+    def call(self, func, *args, **kwargs):
+        """Run func through the breaker, raising ProviderUnavailable while it is open."""
+        if not self.allow():
+            raise ProviderUnavailable(self.name, self.retry_after())
+        return self.measure(func, *args, **kwargs)
+
+    def measure(self, func, *args, **kwargs):
+        """Run func and record its outcome without consulting the breaker first."""
+        start = time.perf_counter()
+        try:
+            result = func(*args, **kwargs)
+        except Exception:
+            self.record(False, time.perf_counter() - start)
+            raise
+        except BaseException:
+            self.release()
+            raise
+        self.record(True, time.perf_counter() - start)
+        return result
+
+    def stats(self) -> dict:
+        state = self.state
+        with self._lock:
+            self._trim(time.monotonic())
+            return {
+                "state": state,
+                "calls": len(self._samples),
+                "error_rate": round(self._error_rate(), 3),
+                "p95_seconds": self._p95(),
+                "trips": self.trips,
+                "rejected": self.rejected,
+            }
+
+
+def _env_float(name: str):
+    value = os.environ.get(name)
+    return float(value) if value else None
+
+
+elevenlabs_health = ProviderHealth("elevenlabs", slow_p95=_env_float("ELEVENLABS_SLOW_P95"))
+gtts_health = ProviderHealth("gtts")
+groq_stt_health = ProviderHealth("groq-stt", slow_p95=_env_float("GROQ_STT_SLOW_P95"))
+groq_vision_health = ProviderHealth("groq-vision", slow_p95=_env_float("GROQ_VISION_SLOW_P95"))
+
+PROVIDERS = [elevenlabs_health, gtts_health, groq_stt_health, groq_vision_health]
+
+
+def health_stats() -> dict:
+    return {provider.name: provider.stats() for provider in PROVIDERS}
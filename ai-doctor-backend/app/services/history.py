@@ -0,0 +1,92 @@
+# app/services/history.py
+
+import base64
+import json
+import os
+from datetime import datetime
+
+from bson.objectid import ObjectId
+
+from app.db import db
+
+HISTORY_PAGE_SIZE = int(os.environ.get("HISTORY_PAGE_SIZE", "20"))
+HISTORY_MAX_PAGE_SIZE = int(os.environ.get("HISTORY_MAX_PAGE_SIZE", "100"))
+HISTORY_BATCH_SIZE = 200  # documents per round trip when streaming NDJSON
+
+HISTORY_FIELDS = {"userId", "frontendId", "createdAt", "symptom", "diagnosis", "transcript",
+                  "audioUrl", "imageUrl", "ttsUrl"}
+# What the history list needs; transcripts are only fetched when asked for
+LIST_FIELDS = {"frontendId", "createdAt", "symptom", "diagnosis", "audioUrl", "imageUrl", "ttsUrl"}
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def projection_for(fields) -> dict:
+    fields = set(fields) if fields else LIST_FIELDS
+    unknown = fields - HISTORY_FIELDS
+    if unknown:
+        raise ValueError(f"Unknown fields: {', '.join(sorted(unknown))}")
+    # createdAt and _id are always returned: they are the page cursor
+    return {field: 1 for field in fields | {"createdAt", "_id"}}
+
+
+def encode_cursor(doc: dict) -> str:
+    raw = json.dumps([doc["createdAt"].isoformat(), str(doc["_id"])])
+    return base64.urlsafe_b64encode(raw.encode("utf-8")).decode("ascii").rstrip("=")
+
+
+def decode_cursor(cursor: str):
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        created_at, object_id = json.loads(raw)
+        return datetime.fromisoformat(created_at), ObjectId(object_id)
+    except Exception:
+        raise InvalidCursor("Invalid cursor")
+
+
+def _query(user_id: str, cursor: str = None) -> dict:
+    query = {"userId": user_id}
+    if cursor:
+        # Keyset pagination: strictly older than the last item of the previous page, with _id
+        # breaking ties, so pages stay stable while new diagnoses are being added
+        created_at, object_id = decode_cursor(cursor)
+        query["$or"] = [
+            {"createdAt": {"$lt": created_at}},
+            {"createdAt": created_at, "_id": {"$lt": object_id}},
+        ]
+    return query
+
+
+def serialize(doc: dict) -> dict:
+    doc["_id"] = str(doc["_id"])
+    if isinstance(doc.get("createdAt"), datetime):
+        doc["createdAt"] = doc["createdAt"].isoformat()
+    return doc
+
+
+async def history_page(user_id: str, limit: int = HISTORY_PAGE_SIZE, cursor: str = None, fields=None) -> dict:
+    """Newest first. nextCursor is None on the last page."""
+    limit = max(1, min(limit, HISTORY_MAX_PAGE_SIZE))
+    docs = await (db.diagnoses.find(_query(user_id, cursor), projection_for(fields))
+                  .sort([("createdAt", -1), ("_id", -1)])
+                  .limit(limit + 1)
+                  .to_list(length=limit + 1))
+    next_cursor = encode_cursor(docs[limit - 1]) if len(docs) > limit else None
+    return {"items": [serialize(doc) for doc in docs[:limit]], "nextCursor": next_cursor}
+
+
+async def history_list(user_id: str, fields=None) -> list:
+    """Every diagnosis of the user, newest first, as one list (the original unpaged response)."""
+    cursor = (db.diagnoses.find(_query(user_id), projection_for(fields or HISTORY_FIELDS))
+              .sort([("createdAt", -1), ("_id", -1)])
+              .batch_size(HISTORY_BATCH_SIZE))
+    return [serialize(doc) async for doc in cursor]
+
+
+async def history_ndjson(user_id: str, cursor: str = None, fields=None):
+    """Every matching diagnosis as one JSON object per line, read in batches as the client consumes them."""
+    query = db.diagnoses.find(_query(user_id, cursor), projection_for(fields), batch_size=HISTORY_BATCH_SIZE)
+    async for doc in query.sort([("createdAt", -1), ("_id", -1)]):
+        yield (json.dumps(serialize(doc)) + "\n").encode("utf-8")
@@ -0,0 +1,104 @@
+# app/services/image_prep.py
+
+import base64
+import hashlib
+import io
+import mimetypes
+import os
+import threading
+from collections import OrderedDict
+
+from app.utils.trace import log
+
+# The vision model doesn't need full-resolution phone photos
+IMAGE_MAX_SIDE = int(os.environ.get("IMAGE_MAX_SIDE", "1024"))
+IMAGE_FORMAT = os.environ.get("IMAGE_FORMAT", "JPEG").upper()  # JPEG or WEBP
+IMAGE_QUALITY = int(os.environ.get("IMAGE_QUALITY", "85"))
+IMAGE_CACHE_ENTRIES = int(os.environ.get("IMAGE_CACHE_ENTRIES", "64"))
+
+_MIME_TYPES = {"JPEG": "image/jpeg", "PNG": "image/png", "WEBP": "image/webp"}
+# Formats the vision API accepts as-is, so a small original can be passed through untouched
+_PASSTHROUGH_FORMATS = {"JPEG", "PNG", "WEBP"}
+
+
+class ImageTooLarge(Exception):
+    pass
+
+
+_cache = OrderedDict()  # content hash -> (base64 payload, mime type)
+_cache_lock = threading.Lock()
+
+
+def downsize(source, max_side: int, fmt: str, quality: int):
+    """Upright, shrunk to fit max_side, flattened and re-encoded as fmt. source is a file path or
+    the image bytes. Returns (encoded bytes, source format, whether the original was already upright
+    and small enough)."""
+    from PIL import Image, ImageOps  # imported on first use, in the blocking pool
+    try:
+        with Image.open(source if isinstance(source, str) else io.BytesIO(source)) as original:
+            source_format = original.format
+            orientation = original.getexif().get(0x0112, 1)  # EXIF Orientation tag
+            untouched = orientation == 1 and max(original.size) <= max_side
+            img = ImageOps.exif_transpose(original)
+            img.thumbnail((max_side, max_side), Image.LANCZOS)
+            if img.mode in ("RGBA", "LA") or "transparency" in img.info:
+                # Flatten transparency onto white; neither JPEG nor the model care about alpha
+                rgba = img.convert("RGBA")
+                img = Image.new("RGB", img.size, (255, 255, 255))
+                img.paste(rgba, mask=rgba.getchannel("A"))
+            elif img.mode not in ("RGB", "L"):
+                img = img.convert("RGB")
+            out = io.BytesIO()
+            img.save(out, format=fmt, quality=quality, optimize=True)
+    except Image.DecompressionBombError as e:
+        # More pixels than PIL will decode (a decompression bomb, or just a huge scan)
+        raise ImageTooLarge(str(e)) from e
+    return out.getvalue(), source_format, untouched
+
+
+def _reencode(data: bytes):
+    encoded, source_format, untouched = downsize(data, IMAGE_MAX_SIDE, IMAGE_FORMAT, IMAGE_QUALITY)
+    # Already small, upright and well compressed: re-encoding would only add bytes
+    if untouched and source_format in _PASSTHROUGH_FORMATS and len(data) <= len(encoded):
+        return data, _MIME_TYPES[source_format]
+    return encoded, _MIME_TYPES.get(IMAGE_FORMAT, "image/jpeg")
+
+
+def prepare_image_bytes(data: bytes, filename: str = None, digest: str = None):
+    """Return (base64 payload, mime type) for the vision model, downsized and re-encoded.
+
+    Results are cached by content hash, so re-submitting the same photo is free.
+    """
+    digest = digest or hashlib.sha256(data).hexdigest()
+    with _cache_lock:
+        if digest in _cache:
+            _cache.move_to_end(digest)
+            return _cache[digest]
+
+    try:
+        payload, mime = _reencode(data)
+    except ImageTooLarge:
+        raise  # the provider would choke on it too
+    except Exception as e:
+        # Unknown or corrupt image: send it as-is and let the provider decide
+        log("IMAGE", f"Could not preprocess {filename or 'image'}: {e}")
+        payload, mime = data, mimetypes.guess_type(filename or "")[0] or "image/jpeg"
+
+    result = (base64.b64encode(payload).decode("utf-8"), mime)
+    with _cache_lock:
+        _cache[digest] = result
+        while len(_cache) > IMAGE_CACHE_ENTRIES:
+            _cache.popitem(last=False)
+    return result
+
+
+def prepare_image(image_path: str, digest: str = None):
+    # Content-addressed uploads already know their hash: a repeat photo skips the disk read too
+    if digest:
+        with _cache_lock:
+            if digest in _cache:
+                _cache.move_to_end(digest)
+                return _cache[digest]
+    with open(image_path, "rb") as image_file:
+        data = image_file.read()
+    return prepare_image_bytes(data, filename=image_path, digest=digest)
@@ -0,0 +1,157 @@
+# app/services/image_resolver.py
+
+import hashlib
+import os
+import re
+import uuid
+from urllib.parse import unquote, urlsplit
+
+import httpx
+
+from app.services.image_prep import ImageTooLarge, downsize
+from app.services.media_store import API_BASE_URL, NAMESPACES, MediaNotFound, media_store
+from app.utils.executor import run_blocking
+from app.utils.trace import log
+
+# Origins whose media URLs are read straight from the media store instead of over HTTP
+MEDIA_ORIGINS = [o.rstrip("/") for o in os.environ.get("MEDIA_ORIGINS", API_BASE_URL or "").split(",") if o.strip()]
+IMAGE_FETCH_TIMEOUT = float(os.environ.get("IMAGE_FETCH_TIMEOUT", "10"))
+IMAGE_FETCH_MAX_BYTES = int(os.environ.get("IMAGE_FETCH_MAX_BYTES", str(10 * 1024 * 1024)))
+IMAGE_FETCH_CONNECTIONS = int(os.environ.get("IMAGE_FETCH_CONNECTIONS", "10"))
+# An A4 page is ~8 inches wide, so this is ~150 dpi for a full-width image
+REPORT_IMAGE_MAX_SIDE = int(os.environ.get("REPORT_IMAGE_MAX_SIDE", "1200"))
+REPORT_IMAGE_QUALITY = int(os.environ.get("REPORT_IMAGE_QUALITY", "85"))
+REPORT_IMAGE_DIR = os.path.join("temp", "report-images")
+
+# Path -> namespace for every URL form the media router serves
+_MEDIA_PATHS = [
+    (re.compile(r"^/media/([^/]+)/([^/]+)$"), None),
+    (re.compile(r"^/uploads/([^/]+)$"), "uploads"),
+    (re.compile(r"^/temp/tts/([^/]+)$"), "tts"),
+    (re.compile(r"^/temp/([^/]+)$"), "pdf"),
+]
+
+
+def media_location(url: str):
+    """(namespace, key) when url points at our own media, else None."""
+    path = None
+    if url.startswith("/"):
+        path = url
+    else:
+        for origin in MEDIA_ORIGINS:
+            if url.startswith(origin + "/"):
+                path = url[len(origin):]
+                break
+    if path is None:
+        return None
+    path = urlsplit(path).path
+    for pattern, namespace in _MEDIA_PATHS:
+        match = pattern.match(path)
+        if match:
+            if namespace is None:
+                namespace, key = match.group(1), match.group(2)
+            else:
+                key = match.group(1)
+            return (namespace, unquote(key)) if namespace in NAMESPACES else None
+    return None
+
+
+def _thumbnail(source, path: str) -> None:
+    # source is a file path or the image bytes
+    data, _, _ = downsize(source, REPORT_IMAGE_MAX_SIDE, "JPEG", REPORT_IMAGE_QUALITY)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+    try:
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+def _touch(path: str) -> bool:
+    try:
+        os.utime(path)
+        return True
+    except FileNotFoundError:
+        return False
+
+
+# Turns an image URL from a report into a small local JPEG ready for fpdf. Our own uploads are read
+# from the media store (no request to ourselves); other URLs go through one pooled client with a
+# timeout and a size cap. Thumbnails are kept on disk, keyed by where the image came from.
+class ImageResolver:
+    def __init__(self):
+        self._client = None
+        self.hits = 0
+        self.local = 0
+        self.remote = 0
+        self.failures = 0
+
+    def _http(self) -> httpx.AsyncClient:
+        if self._client is None:
+            self._client = httpx.AsyncClient(
+                timeout=IMAGE_FETCH_TIMEOUT,
+                limits=httpx.Limits(max_connections=IMAGE_FETCH_CONNECTIONS),
+                follow_redirects=True
+            )
+        return self._client
+
+    async def _read_media(self, namespace: str, key: str):
+        path = media_store.local_path(namespace, key)
+        if path and os.path.exists(path):
+            return path
+        info, chunks = await media_store.open(namespace, key)
+        if info["size"] > IMAGE_FETCH_MAX_BYTES:
+            raise ImageTooLarge(f"{info['size']} bytes")
+        return b"".join([chunk async for chunk in chunks])
+
+    async def _download(self, url: str) -> bytes:
+        async with self._http().stream("GET", url) as response:
+            response.raise_for_status()
+            if int(response.headers.get("content-length") or 0) > IMAGE_FETCH_MAX_BYTES:
+                raise ImageTooLarge(response.headers["content-length"] + " bytes")
+            data = bytearray()
+            async for chunk in response.aiter_bytes():
+                data += chunk
+                if len(data) > IMAGE_FETCH_MAX_BYTES:
+                    raise ImageTooLarge(f"over {IMAGE_FETCH_MAX_BYTES} bytes")
+            return bytes(data)
+
+    async def resolve(self, url: str):
+        """Path of a report-sized JPEG for url, or None if it can't be fetched or decoded."""
+        location = media_location(url)
+        # Own media keys are content hashes, so the location alone identifies the image
+        source = f"{location[0]}/{location[1]}" if location else url
+        path = os.path.join(REPORT_IMAGE_DIR, hashlib.sha256(source.encode("utf-8")).hexdigest() + ".jpg")
+        if await run_blocking(_touch, path):
+            self.hits += 1
+            return path
+
+        try:
+            if location:
+                image = await self._read_media(*location)
+                self.local += 1
+            elif urlsplit(url).scheme in ("http", "https"):
+                image = await self._download(url)
+                self.remote += 1
+            else:
+                raise ValueError("unsupported URL")
+            await run_blocking(_thumbnail, image, path)
+            return path
+        except (MediaNotFound, ImageTooLarge, httpx.HTTPError, ValueError, OSError) as e:
+            self.failures += 1
+            log("PDF", f"Could not resolve image {url}: {e!r}")
+            return None
+
+    async def close(self) -> None:
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+
+    def stats(self) -> dict:
+        return {"hits": self.hits, "local": self.local, "remote": self.remote, "failures": self.failures}
+
+
+image_resolver = ImageResolver()
@@ -0,0 +1,247 @@
+# app/services/jobs.py
+
+import asyncio
+import math
+import os
+import socket
+import uuid
+from datetime import datetime, timedelta, timezone
+
+from fastapi import UploadFile
+
+from app.db import db
+from app.services.chat_pipeline import run_chat
+from app.services.upload_store import store_upload
+from app.utils.trace import current_trace_id, log, new_trace_id, reset_trace_id, set_trace_id
+
+JOB_WORKERS = int(os.environ.get("JOB_WORKERS", "4"))
+JOB_QUEUE_LIMIT = int(os.environ.get("JOB_QUEUE_LIMIT", "100"))
+# A running job is renewed every third of this; once it lapses the job is assumed orphaned
+# (its worker died) and any worker may run it again
+JOB_LEASE_SECONDS = float(os.environ.get("JOB_LEASE_SECONDS", "60"))
+
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+
+
+class JobQueueFull(Exception):
+    def __init__(self, retry_after: int):
+        super().__init__("Diagnosis queue is full")
+        self.retry_after = retry_after
+
+
+def _now():
+    return datetime.now(timezone.utc)
+
+
+# In-process diagnosis queue. Job state lives in Mongo (db.chat_jobs) so results survive a
+# restart; no external broker needed. A worker owns the jobs it runs through a lease it keeps
+# renewing, so with several app workers sharing the database only jobs whose owner is gone get
+# picked up again.
+class JobQueue:
+    def __init__(self, workers: int = JOB_WORKERS, limit: int = JOB_QUEUE_LIMIT):
+        self.workers = workers
+        self.limit = limit
+        self.owner = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._queue = None
+        self._queued = set()  # ids in self._queue
+        self._tasks = []
+        self._finished = {}  # job id -> [asyncio.Event, waiters], while clients long-poll a pending job
+        self._avg_seconds = 10.0
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue else 0
+
+    def _retry_after(self) -> int:
+        return max(1, math.ceil(self.depth / max(1, self.workers) * self._avg_seconds))
+
+    def _enqueue(self, job_id: str) -> None:
+        self._queued.add(job_id)
+        self._queue.put_nowait(job_id)
+
+    @staticmethod
+    def _lease():
+        return _now() + timedelta(seconds=JOB_LEASE_SECONDS)
+
+    async def _recover(self) -> int:
+        """Queue every job nobody is working on: queued ones, and running ones whose lease lapsed."""
+        now = _now()
+        # Running jobs without a lease were started before leases existed
+        await db.chat_jobs.update_many(
+            {"status": RUNNING, "$or": [{"leaseUntil": {"$lt": now}}, {"leaseUntil": {"$exists": False}}]},
+            {"$set": {"status": QUEUED, "updatedAt": now}, "$unset": {"owner": "", "leaseUntil": ""}},
+        )
+        # Another worker may hold some of these too; whichever claims a job first runs it
+        recovered = 0
+        async for job in db.chat_jobs.find({"status": QUEUED}, {"_id": 1}).sort("createdAt", 1):
+            if job["_id"] not in self._queued:
+                self._enqueue(job["_id"])
+                recovered += 1
+        return recovered
+
+    async def _watch_leases(self) -> None:
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS)
+            try:
+                recovered = await self._recover()
+            except Exception as e:
+                print(f"[JOBS] Recovery failed: {e}")
+                continue
+            if recovered:
+                print(f"[JOBS] Picked up {recovered} job(s) nobody was running")
+
+    async def start(self) -> None:
+        self._queue = asyncio.Queue()
+        # Anything a previous process accepted but never finished
+        recovered = await self._recover()
+        if recovered:
+            print(f"[JOBS] Recovered {recovered} unfinished job(s)")
+        self._tasks = [asyncio.create_task(self._worker()) for _ in range(self.workers)]
+        self._tasks.append(asyncio.create_task(self._watch_leases()))
+
+    async def stop(self) -> None:
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        # Hand back what this worker was running, so others don't wait out the lease
+        await db.chat_jobs.update_many(
+            {"status": RUNNING, "owner": self.owner},
+            {"$set": {"status": QUEUED, "updatedAt": _now()}, "$unset": {"owner": "", "leaseUntil": ""}},
+        )
+
+    async def submit(self, audio: UploadFile, image: UploadFile = None, symptom: str = None, frontendId: str = None,
+                     tts_mode: str = "whole") -> str:
+        # Backpressure before touching the request body
+        if self.depth >= self.limit:
+            raise JobQueueFull(self._retry_after())
+
+        # Let both uploads settle before reporting a rejection, so no write is left running
+        stored_audio, stored_image = await asyncio.gather(
+            store_upload(audio, "audio"),
+            store_upload(image, "image") if image else asyncio.sleep(0),
+            return_exceptions=True,
+        )
+        for stored in (stored_audio, stored_image):
+            if isinstance(stored, Exception):
+                raise stored
+        audio_path = stored_audio["path"]
+        image_path = stored_image["path"] if stored_image else None
+        job_id = uuid.uuid4().hex
+        await db.chat_jobs.insert_one({
+            "_id": job_id,
+            "status": QUEUED,
+            "frontendId": frontendId,
+            "symptom": symptom,
+            "ttsMode": tts_mode,
+            "audioPath": audio_path,
+            "imagePath": image_path,
+            "result": None,
+            "error": None,
+            "traceId": current_trace_id(),
+            "createdAt": _now(),
+            "updatedAt": _now(),
+        })
+        self._enqueue(job_id)
+        return job_id
+
+    async def _worker(self) -> None:
+        while True:
+            job_id = await self._queue.get()
+            self._queued.discard(job_id)
+            try:
+                await self._run(job_id)
+            except asyncio.CancelledError:
+                raise
+            except Exception as e:
+                log("JOBS", f"Job {job_id} crashed: {e}")
+            finally:
+                self._queue.task_done()
+
+    async def _run(self, job_id: str) -> None:
+        job = await db.chat_jobs.find_one_and_update(
+            {"_id": job_id, "status": QUEUED},
+            {"$set": {"status": RUNNING, "owner": self.owner, "leaseUntil": self._lease(),
+                      "startedAt": _now(), "updatedAt": _now()}},
+        )
+        if job is None:
+            return  # claimed by another worker
+        heartbeat = asyncio.create_task(self._renew(job_id))
+
+        # The worker outlives the request that submitted the job, so its trace id is carried over
+        token = set_trace_id(job.get("traceId") or new_trace_id())
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        try:
+            result = await run_chat(job["audioPath"], image=job.get("imagePath"),
+                                    symptom=job.get("symptom"), frontendId=job.get("frontendId"),
+                                    tts_mode=job.get("ttsMode", "whole"))
+            update = {"status": DONE, "result": result}
+        except Exception as e:
+            log("JOBS", f"Job {job_id} failed: {e}")
+            update = {"status": FAILED, "error": str(e) or type(e).__name__}
+        finally:
+            heartbeat.cancel()
+            reset_trace_id(token)
+        self._avg_seconds = 0.8 * self._avg_seconds + 0.2 * (loop.time() - started)
+
+        stored = await db.chat_jobs.update_one(
+            {"_id": job_id, "owner": self.owner},
+            {"$set": dict(update, updatedAt=_now()), "$unset": {"leaseUntil": ""}},
+        )
+        if not stored.modified_count:
+            log("JOBS", f"Job {job_id} lost its lease while running; another worker took it over")
+        if job_id in self._finished:
+            self._finished[job_id][0].set()
+
+    async def _renew(self, job_id: str) -> None:
+        while True:
+            await asyncio.sleep(JOB_LEASE_SECONDS / 3)
+            try:
+                await db.chat_jobs.update_one({"_id": job_id, "status": RUNNING, "owner": self.owner},
+                                              {"$set": {"leaseUntil": self._lease()}})
+            except Exception as e:
+                log("JOBS", f"Couldn't renew the lease on job {job_id}: {e}")
+
+    async def _wait_finished(self, job_id: str, wait: float) -> None:
+        entry = self._finished.setdefault(job_id, [asyncio.Event(), 0])
+        entry[1] += 1
+        try:
+            # It may have finished between the caller's read and registering here
+            job = await db.chat_jobs.find_one({"_id": job_id}, {"status": 1})
+            if job and job["status"] in (QUEUED, RUNNING):
+                await asyncio.wait_for(entry[0].wait(), timeout=wait)
+        except asyncio.TimeoutError:
+            pass
+        finally:
+            # The last waiter out drops the event, whether or not the job finished (maybe elsewhere)
+            entry[1] -= 1
+            if not entry[1]:
+                self._finished.pop(job_id, None)
+
+    async def get(self, job_id: str, wait: float = 0) -> dict:
+        """Return the job, optionally long-polling up to `wait` seconds for it to finish."""
+        job = await db.chat_jobs.find_one({"_id": job_id})
+        if job and wait > 0 and job["status"] in (QUEUED, RUNNING):
+            await self._wait_finished(job_id, wait)
+            job = await db.chat_jobs.find_one({"_id": job_id})
+        if job is None:
+            return None
+        return {
+            "job_id": job["_id"],
+            "status": job["status"],
+            "result": job.get("result"),
+            "error": job.get("error"),
+            "createdAt": job["createdAt"],
+            "updatedAt": job["updatedAt"],
+        }
+
+    def stats(self) -> dict:
+        return {"workers": self.workers, "depth": self.depth, "limit": self.limit,
+                "avg_job_seconds": round(self._avg_seconds, 2)}
+
+
+job_queue = JobQueue()
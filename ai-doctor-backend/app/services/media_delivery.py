@@ -0,0 +1,152 @@
+# app/services/media_delivery.py
+
+import hashlib
+import os
+import re
+from email.utils import formatdate, parsedate_to_datetime
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+
+from app.services.media_store import MediaNotFound, media_store
+
+# Content-addressed media never changes once written, so clients may keep it for a long time
+MEDIA_MAX_AGE = int(os.environ.get("MEDIA_MAX_AGE", str(365 * 24 * 3600)))
+MEDIA_SHORT_MAX_AGE = int(os.environ.get("MEDIA_SHORT_MAX_AGE", "3600"))
+# Internal nginx location serving the media directories, e.g. /_media. When set, local files are
+# handed to nginx via X-Accel-Redirect and sent with sendfile instead of passing through Python.
+MEDIA_ACCEL_REDIRECT = os.environ.get("MEDIA_ACCEL_REDIRECT")
+
+# Uploads are named after the SHA-256 of their bytes and PDFs after that of their inputs, so the
+# name alone pins the content. TTS clips are named after their text and can be re-rendered with
+# different bytes, so they are revalidated instead.
+CONTENT_ADDRESSED_NAMESPACES = {"uploads", "pdf"}
+_CONTENT_ADDRESSED = re.compile(r"^[0-9a-f]{64}\.")
+_RANGE = re.compile(r"^bytes=(\d*)-(\d*)$")
+
+
+class RangeNotSatisfiable(Exception):
+    pass
+
+
+def content_addressed(namespace: str, key: str) -> bool:
+    return namespace in CONTENT_ADDRESSED_NAMESPACES and bool(_CONTENT_ADDRESSED.match(key))
+
+
+async def etag_for(namespace: str, key: str, info: dict) -> str:
+    if content_addressed(namespace, key):
+        return f'"{key[:32]}"'
+    digest = info.get("sha256") or await media_store.digest(namespace, key)
+    if digest:
+        return f'"{digest[:32]}"'
+    # Stored before content hashes were recorded: good enough to revalidate, not for If-Range
+    return 'W/"' + hashlib.sha256(f"{namespace}/{key}:{info['size']}:{info['modified']}".encode()).hexdigest()[:32] + '"'
+
+
+def cache_control_for(namespace: str, key: str) -> str:
+    # private: these are patients' recordings, photos and reports, so no shared caches
+    if content_addressed(namespace, key):
+        return f"private, max-age={MEDIA_MAX_AGE}, immutable"
+    return f"private, max-age={MEDIA_SHORT_MAX_AGE}"
+
+
+def _not_modified(request: Request, etag: str, modified: float) -> bool:
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or etag.removeprefix("W/") in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since:
+        try:
+            return int(modified) <= parsedate_to_datetime(if_modified_since).timestamp()
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def byte_range(request: Request, etag: str, last_modified: str, size: int):
+    """(start, end) of the single range asked for, or None to send the whole object."""
+    header = request.headers.get("range")
+    if not header:
+        return None
+    if_range = request.headers.get("if-range")
+    strong = None if etag.startswith("W/") else etag
+    if if_range and if_range.strip() not in (strong, last_modified):
+        return None  # the client's partial copy is stale: send it everything
+    match = _RANGE.match(header.replace(" ", ""))
+    if not match or match.groups() == ("", ""):
+        return None  # multiple ranges or another unit; sending the full body is always allowed
+    first, last = match.groups()
+    if not first:
+        suffix = int(last)
+        if suffix == 0 or size == 0:
+            raise RangeNotSatisfiable()
+        return max(0, size - suffix), size - 1
+    start = int(first)
+    if last and int(last) < start:
+        return None
+    if start >= size:
+        raise RangeNotSatisfiable()
+    return start, min(int(last), size - 1) if last else size - 1
+
+
+# ASGI zero-copy: the server sends the file itself (Granian, NGINX Unit). Only offered when
+# the server advertises the extension; uvicorn falls back to chunked reads.
+class PathSendResponse(Response):
+    def __init__(self, path: str, status_code: int, headers: dict, media_type: str):
+        super().__init__(status_code=status_code, headers=headers, media_type=media_type)
+        self.path = os.path.abspath(path)
+
+    async def __call__(self, scope, receive, send):
+        await send({"type": "http.response.start", "status": self.status_code, "headers": self.raw_headers})
+        await send({"type": "http.response.pathsend", "path": self.path})
+
+
+# Serves a stored object with Range/206, content-hash ETags, conditional GET and caching,
+# from whichever media backend holds it
+async def media_response(request: Request, namespace: str, key: str) -> Response:
+    try:
+        info = await media_store.stat(namespace, key)
+    except MediaNotFound:
+        raise HTTPException(status_code=404, detail="Media not found")
+
+    size = info["size"]
+    try:
+        etag = await etag_for(namespace, key, info)
+    except MediaNotFound:
+        raise HTTPException(status_code=404, detail="Media not found")
+    last_modified = formatdate(info["modified"], usegmt=True)
+    headers = {
+        "ETag": etag,
+        "Last-Modified": last_modified,
+        "Cache-Control": cache_control_for(namespace, key),
+        "Accept-Ranges": "bytes",
+    }
+    if _not_modified(request, etag, info["modified"]):
+        return Response(status_code=304, headers=headers)
+
+    local_path = media_store.local_path(namespace, key)
+    if local_path and MEDIA_ACCEL_REDIRECT:
+        # nginx answers Range itself on the internal redirect
+        headers["X-Accel-Redirect"] = f"{MEDIA_ACCEL_REDIRECT}/{local_path.replace(os.sep, '/')}"
+        return Response(headers=headers, media_type=info["content_type"])
+
+    try:
+        requested = byte_range(request, etag, last_modified, size)
+    except RangeNotSatisfiable:
+        return Response(status_code=416, headers=dict(headers, **{"Content-Range": f"bytes */{size}"}))
+    start, end = requested or (0, size - 1)
+    status_code = 206 if requested else 200
+    if requested:
+        headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    headers["Content-Length"] = str(end - start + 1)
+
+    if request.method == "HEAD":
+        return Response(status_code=status_code, headers=headers, media_type=info["content_type"])
+    if local_path and not requested and "http.response.pathsend" in request.scope.get("extensions", {}):
+        return PathSendResponse(local_path, status_code, headers, info["content_type"])
+    try:
+        _, chunks = await media_store.open(namespace, key, start, end)
+    except MediaNotFound:
+        raise HTTPException(status_code=404, detail="Media not found")
+    return StreamingResponse(chunks, status_code=status_code, headers=headers, media_type=info["content_type"])
@@ -0,0 +1,433 @@
+# app/services/media_store.py
+
+import hashlib
+from abc import ABC, abstractmethod
+import mimetypes
+import os
+import re
+import shutil
+import uuid
+from collections import OrderedDict
+
+import aiofiles
+
+from app.services.tts_cache import TTS_CACHE_DIR
+from app.utils.executor import iterate_blocking, run_blocking
+
+# Where uploads, TTS clips and PDFs live once written: "local" (this node's disk), "gridfs"
+# (the app's Mongo database) or "s3" (any S3-compatible endpoint, e.g. MinIO)
+MEDIA_BACKEND = os.environ.get("MEDIA_BACKEND", "local").lower()
+API_BASE_URL = os.environ.get("API_BASE_URL")
+MEDIA_CHUNK_SIZE = 256 * 1024
+LOCAL_DIGEST_ENTRIES = 10000  # content hashes of local files remembered for ETags
+
+GRIDFS_BUCKET = os.environ.get("GRIDFS_BUCKET", "media")
+
+S3_BUCKET = os.environ.get("S3_BUCKET", "ai-doctor-media")
+S3_ENDPOINT_URL = os.environ.get("S3_ENDPOINT_URL")  # unset = AWS
+S3_REGION = os.environ.get("S3_REGION", "us-east-1")
+S3_PREFIX = os.environ.get("S3_PREFIX", "")
+
+# Namespace -> local directory. These are also the working directories every backend writes to
+# first, since the providers and PDF libraries need real files.
+NAMESPACES = {
+    "uploads": "uploads",
+    "tts": TTS_CACHE_DIR,
+    "pdf": "temp",
+}
+
+# A single file name: no separators, no dot-files (older uploads keep their original names)
+_KEY_PATTERN = re.compile(r"^[^/\\\x00.][^/\\\x00]*$")
+
+
+class MediaNotFound(Exception):
+    pass
+
+
+def _check(namespace: str, key: str) -> None:
+    if namespace not in NAMESPACES or not _KEY_PATTERN.match(key):
+        raise MediaNotFound(f"{namespace}/{key}")
+
+
+def _content_type(key: str, content_type: str = None) -> str:
+    return content_type or mimetypes.guess_type(key)[0] or "application/octet-stream"
+
+
+def _file_digest(path: str) -> str:
+    hasher = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(MEDIA_CHUNK_SIZE):
+            hasher.update(chunk)
+    return hasher.hexdigest()
+
+
+class MediaStore(ABC):
+    """Common interface: put_file/put_bytes to publish, open() to stream back, fetch() to pull
+    an object down into a local working file, url() for the link handed to clients."""
+
+    name = None
+
+    @abstractmethod
+    async def put_file(self, namespace: str, key: str, path: str, content_type: str = None) -> None:
+        ...
+
+    @abstractmethod
+    async def put_bytes(self, namespace: str, key: str, data: bytes, content_type: str = None) -> None:
+        ...
+
+    @abstractmethod
+    async def stat(self, namespace: str, key: str) -> dict:
+        """size, content_type, modified and (when recorded) sha256 of an object; raises MediaNotFound."""
+        ...
+
+    async def digest(self, namespace: str, key: str):
+        """SHA-256 of the object's bytes as recorded when it was written; None for older objects."""
+        return (await self.stat(namespace, key)).get("sha256")
+
+    @abstractmethod
+    async def open(self, namespace: str, key: str, start: int = 0, end: int = None):
+        """Return (info, chunks) for bytes start..end (inclusive, end=None for the rest of the object)."""
+        ...
+
+    def local_path(self, namespace: str, key: str):
+        """A file on this node's disk holding the object, if the backend keeps one."""
+        return None
+
+    @abstractmethod
+    async def delete(self, namespace: str, key: str) -> None:
+        ...
+
+    async def fetch(self, namespace: str, key: str, path: str) -> bool:
+        """Copy the object to a local path; False if the backend doesn't have it."""
+        try:
+            _, chunks = await self.open(namespace, key)
+        except MediaNotFound:
+            return False
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            async with aiofiles.open(tmp_path, "wb") as f:
+                async for chunk in chunks:
+                    await f.write(chunk)
+            os.replace(tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+        return True
+
+    def url(self, namespace: str, key: str) -> str:
+        return f"{API_BASE_URL}/media/{namespace}/{key}"
+
+
+# The working directories are the store: nothing to copy, and the old /uploads and /temp
+# static URLs keep working
+class LocalMediaStore(MediaStore):
+    name = "local"
+
+    def __init__(self):
+        self._digests = OrderedDict()  # path -> (size, mtime_ns, sha256)
+
+    def _record_digest(self, path: str, digest: str = None, source: str = None) -> str:
+        # source: a temp file about to be renamed to path, which keeps its size and mtime
+        stat = os.stat(source or path)
+        digest = digest or _file_digest(source or path)
+        self._digests[path] = (stat.st_size, stat.st_mtime_ns, digest)
+        self._digests.move_to_end(path)
+        while len(self._digests) > LOCAL_DIGEST_ENTRIES:
+            self._digests.popitem(last=False)
+        return digest
+
+    def _known_digest(self, path: str, stat) -> str:
+        size, mtime_ns, digest = self._digests.get(path, (None, None, None))
+        return digest if (size, mtime_ns) == (stat.st_size, stat.st_mtime_ns) else None
+
+    def _path(self, namespace: str, key: str) -> str:
+        _check(namespace, key)
+        return os.path.join(NAMESPACES[namespace], key)
+
+    async def put_file(self, namespace, key, path, content_type=None):
+        target = self._path(namespace, key)
+        # Already inside the namespace directory (or a temp file about to be renamed into it)
+        if os.path.dirname(os.path.abspath(path)) == os.path.abspath(NAMESPACES[namespace]):
+            await run_blocking(self._record_digest, target, None, path)
+            return
+        await run_blocking(self._copy, path, target)
+        await run_blocking(self._record_digest, target)
+
+    @staticmethod
+    def _copy(source: str, target: str) -> None:
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        shutil.copyfile(source, tmp_path)
+        os.replace(tmp_path, target)
+
+    async def put_bytes(self, namespace, key, data, content_type=None):
+        target = self._path(namespace, key)
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        tmp_path = f"{target}.{uuid.uuid4().hex}.tmp"
+        async with aiofiles.open(tmp_path, "wb") as f:
+            await f.write(data)
+        os.replace(tmp_path, target)
+        self._record_digest(target, hashlib.sha256(data).hexdigest())
+
+    async def stat(self, namespace, key):
+        path = self._path(namespace, key)
+        try:
+            stat = os.stat(path)
+        except FileNotFoundError:
+            raise MediaNotFound(f"{namespace}/{key}")
+        return {"size": stat.st_size, "content_type": _content_type(key), "modified": stat.st_mtime,
+                "sha256": self._known_digest(path, stat)}
+
+    async def digest(self, namespace, key):
+        # Files written before this process started (or by the TTS cache directly) are hashed once
+        info = await self.stat(namespace, key)
+        if info["sha256"]:
+            return info["sha256"]
+        try:
+            return await run_blocking(self._record_digest, self._path(namespace, key))
+        except FileNotFoundError:
+            raise MediaNotFound(f"{namespace}/{key}")
+
+    async def open(self, namespace, key, start=0, end=None):
+        info = await self.stat(namespace, key)
+        end = info["size"] - 1 if end is None else end
+        return info, self._chunks(self._path(namespace, key), start, end - start + 1)
+
+    @staticmethod
+    async def _chunks(path: str, start: int, length: int):
+        async with aiofiles.open(path, "rb") as f:
+            await f.seek(start)
+            while length > 0 and (chunk := await f.read(min(MEDIA_CHUNK_SIZE, length))):
+                length -= len(chunk)
+                yield chunk
+
+    def local_path(self, namespace, key):
+        return self._path(namespace, key)
+
+    async def delete(self, namespace, key):
+        try:
+            os.remove(self._path(namespace, key))
+        except FileNotFoundError:
+            pass
+
+    async def fetch(self, namespace, key, path):
+        source = self._path(namespace, key)
+        if not os.path.exists(source):
+            return False
+        if os.path.abspath(source) != os.path.abspath(path):
+            await run_blocking(self._copy, source, path)
+        return True
+
+    def url(self, namespace, key):
+        self._path(namespace, key)
+        return f"{API_BASE_URL}/{NAMESPACES[namespace].replace(os.sep, '/')}/{key}"
+
+
+# Objects live in the app's own Mongo database, so every node sharing the database can serve them
+class GridFSMediaStore(MediaStore):
+    name = "gridfs"
+
+    def __init__(self, bucket_name: str = GRIDFS_BUCKET):
+        self.bucket_name = bucket_name
+        self._bucket = None
+        self._files = None
+
+    # Built on first use so the bucket binds to whatever database app.db ends up holding
+    def _connect(self) -> None:
+        if self._bucket is None:
+            from motor.motor_asyncio import AsyncIOMotorGridFSBucket
+            from app.db import get_db
+            database = get_db()
+            self._bucket = AsyncIOMotorGridFSBucket(database, bucket_name=self.bucket_name)
+            self._files = database[f"{self.bucket_name}.files"]
+
+    @property
+    def bucket(self):
+        self._connect()
+        return self._bucket
+
+    @property
+    def files(self):
+        self._connect()
+        return self._files
+
+    @staticmethod
+    def _name(namespace: str, key: str) -> str:
+        _check(namespace, key)
+        return f"{namespace}/{key}"
+
+    async def _exists(self, name: str) -> bool:
+        return await self.files.find_one({"filename": name}, {"_id": 1}) is not None
+
+    async def _upload(self, name: str, chunks, metadata: dict) -> None:
+        from gridfs.errors import FileExists
+        from pymongo.errors import DuplicateKeyError
+        grid_in = self.bucket.open_upload_stream(name, chunk_size_bytes=MEDIA_CHUNK_SIZE, metadata=metadata)
+        try:
+            async for chunk in chunks:
+                await grid_in.write(chunk)
+            await grid_in.close()
+        except (FileExists, DuplicateKeyError):
+            # Another request stored the same key meanwhile (filename is unique); drop our chunks
+            await grid_in.abort()
+        except BaseException:
+            await grid_in.abort()
+            raise
+
+    @staticmethod
+    async def _file_chunks(path: str):
+        async with aiofiles.open(path, "rb") as f:
+            while chunk := await f.read(MEDIA_CHUNK_SIZE):
+                yield chunk
+
+    @staticmethod
+    async def _single(data: bytes):
+        yield data
+
+    async def put_file(self, namespace, key, path, content_type=None):
+        name = self._name(namespace, key)
+        # Keys are content hashes or unique names, so an existing object is already the right one
+        if await self._exists(name):
+            return
+        digest = await run_blocking(_file_digest, path)
+        await self._upload(name, self._file_chunks(path),
+                           {"contentType": _content_type(key, content_type), "sha256": digest})
+
+    async def put_bytes(self, namespace, key, data, content_type=None):
+        name = self._name(namespace, key)
+        if await self._exists(name):
+            return
+        await self._upload(name, self._single(data),
+                           {"contentType": _content_type(key, content_type), "sha256": hashlib.sha256(data).hexdigest()})
+
+    @staticmethod
+    def _info(key: str, size: int, metadata: dict, uploaded) -> dict:
+        return {
+            "size": size,
+            "content_type": (metadata or {}).get("contentType") or _content_type(key),
+            "modified": uploaded.timestamp(),
+            "sha256": (metadata or {}).get("sha256"),
+        }
+
+    async def stat(self, namespace, key):
+        stored = await self.files.find_one({"filename": self._name(namespace, key)},
+                                           sort=[("uploadDate", -1)])
+        if stored is None:
+            raise MediaNotFound(f"{namespace}/{key}")
+        return self._info(key, stored["length"], stored.get("metadata"), stored["uploadDate"])
+
+    async def open(self, namespace, key, start=0, end=None):
+        from gridfs.errors import NoFile
+        try:
+            grid_out = await self.bucket.open_download_stream_by_name(self._name(namespace, key))
+        except NoFile:
+            raise MediaNotFound(f"{namespace}/{key}")
+        info = self._info(key, grid_out.length, grid_out.metadata, grid_out.upload_date)
+        end = info["size"] - 1 if end is None else end
+        grid_out.seek(start)
+        return info, self._chunks(grid_out, end - start + 1)
+
+    @staticmethod
+    async def _chunks(grid_out, length: int):
+        while length > 0 and (chunk := await grid_out.read(min(MEDIA_CHUNK_SIZE, length))):
+            length -= len(chunk)
+            yield chunk
+
+    async def delete(self, namespace, key):
+        async for stored in self.files.find({"filename": self._name(namespace, key)}, {"_id": 1}):
+            await self.bucket.delete(stored["_id"])
+
+
+# Any S3-compatible endpoint (AWS, MinIO, a local moto server). boto3 is only needed when selected.
+class S3MediaStore(MediaStore):
+    name = "s3"
+
+    def __init__(self, bucket: str = S3_BUCKET, endpoint_url: str = S3_ENDPOINT_URL, prefix: str = S3_PREFIX):
+        try:
+            import boto3
+            from botocore.config import Config
+        except ImportError:
+            raise RuntimeError("MEDIA_BACKEND=s3 needs boto3 installed (pipenv install)")
+        from app.utils.executor import BLOCKING_POOL_SIZE
+        self.bucket = bucket
+        self.prefix = prefix
+        self.client = boto3.client(
+            "s3", endpoint_url=endpoint_url, region_name=S3_REGION,
+            config=Config(max_pool_connections=BLOCKING_POOL_SIZE),
+        )
+
+    def _key(self, namespace: str, key: str) -> str:
+        _check(namespace, key)
+        return f"{self.prefix}{namespace}/{key}"
+
+    def _call(self, method, object_key: str, **kwargs):
+        from botocore.exceptions import ClientError
+        try:
+            return method(Bucket=self.bucket, Key=object_key, **kwargs)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") in ("404", "NoSuchKey", "NotFound"):
+                return None
+            raise
+
+    def _upload_file(self, object_key: str, path: str, content_type: str) -> None:
+        if self._call(self.client.head_object, object_key) is None:
+            self.client.upload_file(path, self.bucket, object_key, ExtraArgs={
+                "ContentType": content_type, "Metadata": {"sha256": _file_digest(path)}})
+
+    async def put_file(self, namespace, key, path, content_type=None):
+        await run_blocking(self._upload_file, self._key(namespace, key), path, _content_type(key, content_type))
+
+    async def put_bytes(self, namespace, key, data, content_type=None):
+        await run_blocking(self.client.put_object, Bucket=self.bucket, Key=self._key(namespace, key),
+                           Body=data, ContentType=_content_type(key, content_type),
+                           Metadata={"sha256": hashlib.sha256(data).hexdigest()})
+
+    @staticmethod
+    def _info(key: str, response: dict, size: int) -> dict:
+        return {
+            "size": size,
+            "content_type": response.get("ContentType") or _content_type(key),
+            "modified": response["LastModified"].timestamp(),
+            "sha256": response.get("Metadata", {}).get("sha256"),
+        }
+
+    async def stat(self, namespace, key):
+        response = await run_blocking(self._call, self.client.head_object, self._key(namespace, key))
+        if response is None:
+            raise MediaNotFound(f"{namespace}/{key}")
+        return self._info(key, response, response["ContentLength"])
+
+    async def open(self, namespace, key, start=0, end=None):
+        kwargs = {}
+        if start or end is not None:
+            kwargs["Range"] = f"bytes={start}-{'' if end is None else end}"
+        response = await run_blocking(self._call, self.client.get_object, self._key(namespace, key), **kwargs)
+        if response is None:
+            raise MediaNotFound(f"{namespace}/{key}")
+        # A ranged GET reports the full size in ContentRange ("bytes 0-99/1234")
+        size = int(response["ContentRange"].rsplit("/", 1)[1]) if "ContentRange" in response else response["ContentLength"]
+        return self._info(key, response, size), self._chunks(response["Body"])
+
+    @staticmethod
+    async def _chunks(body):
+        try:
+            async for chunk in iterate_blocking(body.iter_chunks, MEDIA_CHUNK_SIZE):
+                yield chunk
+        finally:
+            body.close()
+
+    async def delete(self, namespace, key):
+        await run_blocking(self.client.delete_object, Bucket=self.bucket, Key=self._key(namespace, key))
+
+
+_BACKENDS = {"local": LocalMediaStore, "gridfs": GridFSMediaStore, "s3": S3MediaStore}
+
+
+def _build_store() -> MediaStore:
+    if MEDIA_BACKEND not in _BACKENDS:
+        raise RuntimeError(f"Unknown MEDIA_BACKEND {MEDIA_BACKEND!r} (expected one of {', '.join(_BACKENDS)})")
+    return _BACKENDS[MEDIA_BACKEND]()
+
+
+media_store = _build_store()
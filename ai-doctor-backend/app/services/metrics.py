@@ -0,0 +1,245 @@
+# app/services/metrics.py
+#
+# In-process metrics: counters, latency/size summaries with p50/p95/p99 over recent samples, and
+# gauges read from the services' existing stats() dicts. GET /metrics renders them in the
+# Prometheus text format; nothing here needs a client library.
+
+import math
+import os
+import re
+import threading
+import time
+from collections import deque
+from contextvars import ContextVar
+
+METRICS_WINDOW = int(os.environ.get("METRICS_WINDOW", "1024"))  # recent samples per series kept for quantiles
+QUANTILES = (0.5, 0.95, 0.99)
+PREFIX = "aidoctor_"
+
+# HELP text for the metrics recorded around the app; anything else is exported without one
+HELP = {
+    "aidoctor_http_request_seconds": "HTTP request duration by route template, including streamed bodies",
+    "aidoctor_stage_seconds": "Time spent in each pipeline stage",
+    "aidoctor_provider_seconds": "Provider call latency as seen by its circuit breaker",
+    "aidoctor_provider_errors_total": "Failed provider calls",
+    "aidoctor_provider_rejected_total": "Calls refused because the provider's circuit was open",
+    "aidoctor_tts_fallbacks_total": "Speech served by gTTS instead of ElevenLabs, by reason",
+    "aidoctor_tts_first_byte_seconds": "Time to the first audio byte of /api/tts/stream, by source",
+    "aidoctor_payload_bytes": "Size of uploads, provider payloads and generated files",
+    "aidoctor_cache_requests_total": "Lookups in the in-process result caches",
+    "aidoctor_admission_rejected_total": "Requests turned away by admission control, by limit and reason",
+}
+
+_timings = ContextVar("stage_timings", default=None)
+_LABEL_ESCAPES = str.maketrans({"\\": "\\\\", "\"": "\\\"", "\n": "\\n"})
+_NAME = re.compile(r"[^a-zA-Z0-9_]")
+
+
+def _percentile(ordered: list, fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+class Summary:
+    def __init__(self, window: int = METRICS_WINDOW):
+        self.count = 0
+        self.sum = 0.0
+        self._recent = deque(maxlen=window)
+
+    def observe(self, value: float) -> None:
+        self.count += 1
+        self.sum += value
+        self._recent.append(value)
+
+    def snapshot(self) -> dict:
+        ordered = sorted(self._recent)
+        snapshot = {"count": self.count, "sum": self.sum}
+        if ordered:
+            snapshot.update({f"p{round(q * 100)}": _percentile(ordered, q) for q in QUANTILES})
+            snapshot["max"] = ordered[-1]
+        return snapshot
+
+
+# Times a block (with or async with) into aidoctor_stage_seconds, labelled ok/error, and adds it
+# to the current request's stage breakdown when one is being collected
+class Span:
+    def __init__(self, registry, stage: str, labels: dict):
+        self.registry = registry
+        self.stage = stage
+        self.labels = labels
+        self.started = None
+
+    def __enter__(self):
+        self.started = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        seconds = time.perf_counter() - self.started
+        outcome = "ok" if exc_type is None or exc_type is GeneratorExit else "error"
+        self.registry.observe("aidoctor_stage_seconds", seconds, stage=self.stage, outcome=outcome, **self.labels)
+        timings = _timings.get()
+        if timings is not None:
+            timings.append((self.stage, seconds))
+        return False
+
+    async def __aenter__(self):
+        return self.__enter__()
+
+    async def __aexit__(self, exc_type, exc, tb):
+        return self.__exit__(exc_type, exc, tb)
+
+
+class Metrics:
+    def __init__(self):
+        self._lock = threading.Lock()  # recorded from worker threads as well as the loop
+        self._counters = {}   # (name, labels) -> value
+        self._summaries = {}  # (name, labels) -> Summary
+        self._collectors = []  # (prefix, stats function, label for top-level keys)
+
+    def inc(self, name: str, amount: float = 1, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + amount
+
+    def observe(self, name: str, value: float, **labels) -> None:
+        key = (name, tuple(sorted(labels.items())))
+        with self._lock:
+            summary = self._summaries.get(key)
+            if summary is None:
+                summary = self._summaries[key] = Summary()
+            summary.observe(value)
+
+    def span(self, stage: str, **labels) -> Span:
+        return Span(self, stage, labels)
+
+    def series(self, name: str) -> dict:
+        """{labels dict as a tuple of pairs: snapshot} for one summary, e.g. for a JSON stats endpoint."""
+        with self._lock:
+            return {labels: summary.snapshot() for (series, labels), summary in self._summaries.items() if series == name}
+
+    def register_stats(self, prefix: str, stats, label: str = None) -> None:
+        """Export the numbers in stats() as gauges named aidoctor_<prefix>_<key>. With label, the
+        top-level keys (e.g. provider names) become that label's values instead of name parts."""
+        self._collectors.append((prefix, stats, label))
+
+    def _gauges(self) -> dict:
+        gauges = {}
+
+        def flatten(name: str, value, labels: tuple) -> None:
+            if isinstance(value, dict):
+                for key, child in value.items():
+                    flatten(f"{name}_{key}", child, labels)
+            elif isinstance(value, (bool, int, float)) and not (isinstance(value, float) and math.isnan(value)):
+                gauges.setdefault(_NAME.sub("_", name), []).append((labels, float(value)))
+
+        for prefix, stats, label in self._collectors:
+            try:
+                values = stats()
+            except Exception as e:
+                print(f"[METRICS] Could not read {prefix} stats: {e}")
+                continue
+            if label:
+                for key, child in values.items():
+                    flatten(PREFIX + prefix, child, ((label, str(key)),))
+            else:
+                flatten(PREFIX + prefix, values, ())
+        return gauges
+
+    def render(self) -> str:
+        with self._lock:
+            counters = dict(self._counters)
+            summaries = {key: summary.snapshot() for key, summary in self._summaries.items()}
+        lines = []
+
+        def header(name: str, kind: str) -> None:
+            help_text = HELP.get(name)
+            if help_text:
+                lines.append(f"# HELP {name} {help_text}")
+            lines.append(f"# TYPE {name} {kind}")
+
+        for name in sorted({name for name, _ in counters}):
+            header(name, "counter")
+            for (series, labels), value in sorted(counters.items()):
+                if series == name:
+                    lines.append(f"{name}{_labels(labels)} {_number(value)}")
+
+        for name in sorted({name for name, _ in summaries}):
+            header(name, "summary")
+            for (series, labels), snapshot in sorted(summaries.items()):
+                if series != name:
+                    continue
+                for q in QUANTILES:
+                    if f"p{round(q * 100)}" in snapshot:
+                        lines.append(f"{name}{_labels(labels + (('quantile', str(q)),))} "
+                                     f"{_number(snapshot[f'p{round(q * 100)}'])}")
+                lines.append(f"{name}_sum{_labels(labels)} {_number(snapshot['sum'])}")
+                lines.append(f"{name}_count{_labels(labels)} {snapshot['count']}")
+
+        for name, samples in sorted(self._gauges().items()):
+            header(name, "gauge")
+            for labels, value in samples:
+                lines.append(f"{name}{_labels(labels)} {_number(value)}")
+        return "\n".join(lines) + "\n"
+
+
+def _labels(labels: tuple) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{key}="{str(value).translate(_LABEL_ESCAPES)}"' for key, value in labels) + "}"
+
+
+def _number(value: float) -> str:
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+def collect_timings() -> list:
+    """Start collecting (stage, seconds) for every span in the current task and the tasks and
+    pool threads it starts from here on; returns the list they are appended to."""
+    timings = []
+    _timings.set(timings)
+    return timings
+
+
+def describe_timings(timings: list) -> str:
+    totals = {}
+    for stage, seconds in timings:
+        totals[stage] = totals.get(stage, 0.0) + seconds
+    return ", ".join(f"{stage} {seconds * 1000:.0f}ms" for stage, seconds in totals.items())
+
+
+metrics = Metrics()
+
+
+# Records aidoctor_http_request_seconds per route template (never the raw path, which would
+# create a series per diagnosis id)
+class MetricsMiddleware:
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        started = time.perf_counter()
+        status = {"code": 500}
+
+        async def send_with_status(message):
+            if message["type"] == "http.response.start":
+                status["code"] = message["status"]
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_with_status)
+        finally:
+            metrics.observe("aidoctor_http_request_seconds", time.perf_counter() - started,
+                            method=scope["method"], route=_route_template(scope), status=str(status["code"]))
+
+
+def _route_template(scope) -> str:
+    # Put the path parameters back in place of their values: /api/diagnosis/{diagnosis_id}.
+    # (route.path alone misses the prefix of routers included with one.)
+    if scope.get("route") is None:
+        return "unmatched"
+    path = scope["path"]
+    for name, value in (scope.get("path_params") or {}).items():
+        path = re.sub(r"(?<=/)" + re.escape(str(value)) + r"(?=/|$)", "{" + name + "}", path, count=1)
+    return path
@@ -0,0 +1,75 @@
+# app/services/mp3.py
+#
+# Joining MP3 clips at the frame level: tags and the VBR info frame are dropped from each clip
+# and the audio frames are appended as they are, so nothing gets decoded or re-encoded.
+
+_BITRATES = {
+    "1": [0, 32, 40, 48, 56, 64, 80, 96, 112, 128, 160, 192, 224, 256, 320],
+    "2": [0, 8, 16, 24, 32, 40, 48, 56, 64, 80, 96, 112, 128, 144, 160],
+}
+_SAMPLE_RATES = {3: [44100, 48000, 32000], 2: [22050, 24000, 16000], 0: [11025, 12000, 8000]}
+_INFO_TAGS = (b"Xing", b"Info", b"VBRI")
+
+
+def _frame(data: bytes, offset: int):
+    """(length, sample rate) of the Layer III frame starting at offset, or None if there isn't one."""
+    if offset + 4 > len(data) or data[offset] != 0xFF or data[offset + 1] & 0xE0 != 0xE0:
+        return None
+    version = (data[offset + 1] >> 3) & 3
+    layer = (data[offset + 1] >> 1) & 3
+    bitrate_index = data[offset + 2] >> 4
+    rate_index = (data[offset + 2] >> 2) & 3
+    if version == 1 or layer != 1 or bitrate_index in (0, 15) or rate_index == 3:
+        return None
+    bitrate = _BITRATES["1" if version == 3 else "2"][bitrate_index] * 1000
+    sample_rate = _SAMPLE_RATES[version][rate_index]
+    padding = (data[offset + 2] >> 1) & 1
+    length = (144 if version == 3 else 72) * bitrate // sample_rate + padding
+    return length, sample_rate
+
+
+def _synced(data: bytes, offset: int) -> bool:
+    # A real frame is followed by another frame (or the end), which rules out stray 0xFF bytes
+    frame = _frame(data, offset)
+    if frame is None:
+        return False
+    following = offset + frame[0]
+    return following >= len(data) or _frame(data, following) is not None
+
+
+def _skip_id3v2(data: bytes) -> bytes:
+    while data[:3] == b"ID3" and len(data) >= 10:
+        size = (data[6] << 21) | (data[7] << 14) | (data[8] << 7) | data[9]
+        footer = 10 if data[5] & 0x10 else 0
+        data = data[10 + size + footer:]
+    return data
+
+
+def audio_frames(data: bytes):
+    """Strip ID3v2/ID3v1 tags and the Xing/Info/VBRI header frame. Returns (frames, sample rate)."""
+    data = _skip_id3v2(data)
+    if len(data) >= 128 and data[-128:-125] == b"TAG":
+        data = data[:-128]
+
+    start = 0
+    while start < len(data) and not _synced(data, start):
+        start += 1
+    if start >= len(data):
+        raise ValueError("no MPEG audio frames found")
+    length, sample_rate = _frame(data, start)
+    # The info frame describes a single clip's length; left in the middle it would confuse players
+    if any(tag in data[start:start + min(length, 64)] for tag in _INFO_TAGS):
+        start += length
+    return data[start:], sample_rate
+
+
+def concat_mp3(clips: list) -> bytes:
+    parts = []
+    rates = set()
+    for clip in clips:
+        frames, sample_rate = audio_frames(clip)
+        parts.append(frames)
+        rates.add(sample_rate)
+    if len(rates) > 1:
+        raise ValueError(f"clips use different sample rates: {sorted(rates)}")
+    return b"".join(parts)
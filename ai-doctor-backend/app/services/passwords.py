@@ -0,0 +1,58 @@
+# app/services/passwords.py
+
+import asyncio
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+import bcrypt
+
+# bcrypt work factor for new hashes; each +1 doubles the cost (12 is ~250 ms on one core)
+BCRYPT_ROUNDS = int(os.environ.get("BCRYPT_ROUNDS", "12"))
+# Hashes running at once. bcrypt releases the GIL, so these use real cores without touching the loop;
+# more logins than this simply queue instead of starving everything else of CPU.
+PASSWORD_HASH_CONCURRENCY = int(os.environ.get("PASSWORD_HASH_CONCURRENCY", str(min(4, os.cpu_count() or 1))))
+
+# Separate from the blocking pool so a login burst can't hold up provider calls and file I/O
+_executor = ThreadPoolExecutor(max_workers=PASSWORD_HASH_CONCURRENCY, thread_name_prefix="bcrypt")
+
+_ROUNDS = re.compile(r"^\$2[aby]?\$(\d\d)\$")
+
+
+def _secret(password: str) -> bytes:
+    # bcrypt only ever looked at the first 72 bytes; newer releases raise instead of truncating
+    return password.encode("utf-8")[:72]
+
+
+def _hash(password: str, rounds: int) -> str:
+    return bcrypt.hashpw(_secret(password), bcrypt.gensalt(rounds)).decode("ascii")
+
+
+def _verify(password: str, hashed: str) -> bool:
+    try:
+        return bcrypt.checkpw(_secret(password), hashed.encode("ascii"))
+    except ValueError:
+        return False  # not a bcrypt hash
+
+
+async def _run(func, *args):
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(_executor, func, *args)
+
+
+async def hash_password(password: str) -> str:
+    return await _run(_hash, password, BCRYPT_ROUNDS)
+
+
+async def verify_password(password: str, hashed: str) -> bool:
+    return await _run(_verify, password, hashed)
+
+
+def needs_rehash(hashed: str) -> bool:
+    """True when the hash was made with a different work factor than BCRYPT_ROUNDS."""
+    match = _ROUNDS.match(hashed or "")
+    return not match or int(match.group(1)) != BCRYPT_ROUNDS
+
+
+def shutdown_password_pool() -> None:
+    _executor.shutdown(wait=False, cancel_futures=True)
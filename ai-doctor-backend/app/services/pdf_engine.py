@@ -0,0 +1,182 @@
+# app/services/pdf_engine.py
+
+import asyncio
+import hashlib
+import json
+import multiprocessing
+import os
+import tempfile
+import uuid
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from functools import partial
+
+from app.services.image_resolver import image_resolver
+from app.services.media_store import MediaNotFound, media_store
+from app.services.metrics import metrics
+from app.services.pdf_generator import LOGO_PATH, draw_combined_report, draw_report
+from app.utils.single_flight import SingleFlight
+
+PDF_WORKERS = int(os.environ.get("PDF_WORKERS", "2"))
+PDF_CACHE_ENTRIES = int(os.environ.get("PDF_CACHE_ENTRIES", "64"))
+# The logo is drawn 40mm wide, so this is still ~380 dpi
+LOGO_MAX_SIDE = int(os.environ.get("LOGO_MAX_SIDE", "600"))
+
+LAYOUTS = {}  # layout name -> (document class, function that draws the report into it)
+_assets = {}  # filled once in each worker process
+
+
+def _load_layouts() -> None:
+    # Only the worker processes import fpdf; the API process never needs it
+    from fpdf import FPDF
+    from app.services.pdf_service import PDFReportGenerator, draw_enhanced_report
+    LAYOUTS.update({
+        "report": (FPDF, draw_report),
+        "combined": (FPDF, draw_combined_report),
+        "enhanced": (PDFReportGenerator, draw_enhanced_report),
+    })
+
+
+def _prepare_logo() -> str:
+    # fpdf splits a PNG's alpha channel pixel by pixel in Python, ~1.5s for our logo in every report.
+    # A flattened RGB copy at print size is embedded without decoding, so each report can go
+    # through the public image() call. The copy is named after the logo's content and shared.
+    from app.services.image_prep import downsize
+    with open(LOGO_PATH, "rb") as f:
+        source = f.read()
+    path = os.path.join(tempfile.gettempdir(), f"ai-doctor-logo-{hashlib.sha256(source).hexdigest()[:16]}.png")
+    if not os.path.exists(path):
+        data, _, _ = downsize(source, LOGO_MAX_SIDE, "PNG", 100)
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        with open(tmp_path, "wb") as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+    return path
+
+
+def _init_worker() -> None:
+    _load_layouts()
+    if os.path.exists(LOGO_PATH):
+        _assets["logo"] = _prepare_logo()
+
+
+# Minimal data for each layout, drawn once per worker by _warm
+_WARM_DATA = {"report": {}, "combined": {"diagnoses": [{}]}, "enhanced": {}}
+
+
+def _warm() -> None:
+    # Draw every layout once, so fonts, the logo and fpdf's own first-use work are paid for here
+    for layout, data in _WARM_DATA.items():
+        _render(layout, data)
+
+
+def _render(layout: str, data: dict, image_path: str = None) -> bytes:
+    document, draw = LAYOUTS[layout]
+    pdf = document()
+    draw(pdf, data, _assets, image_path)
+    # fpdf builds the file as a latin-1 str; encoding it gives the exact bytes it would write to disk
+    return pdf.output(dest="S").encode("latin-1")
+
+
+def report_key(layout: str, data: dict) -> str:
+    # The diagnosis id is part of data, so the key covers both the report and its content version
+    payload = json.dumps([layout, data], sort_keys=True, default=str, ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Renders reports in a process pool (fpdf is pure Python and would otherwise hold the GIL) and keeps
+# recent results in memory, backed by the media store, so repeat downloads skip rendering entirely.
+class PDFEngine:
+    def __init__(self, workers: int = PDF_WORKERS, max_entries: int = PDF_CACHE_ENTRIES):
+        self.workers = workers
+        self.max_entries = max_entries
+        self._pool = None
+        self._entries = OrderedDict()  # key -> PDF bytes, least recently used first
+        self._flights = SingleFlight()
+        self.hits = 0
+        self.misses = 0
+        self.renders = 0
+
+    def _executor(self) -> ProcessPoolExecutor:
+        if self._pool is None:
+            # spawn, not fork: the parent has an event loop and worker threads that must not be copied
+            self._pool = ProcessPoolExecutor(
+                max_workers=self.workers,
+                mp_context=multiprocessing.get_context("spawn"),
+                initializer=_init_worker
+            )
+        return self._pool
+
+    def start(self) -> None:
+        # Spawn and warm the workers in the background so the first download doesn't pay for it
+        executor = self._executor()
+        for _ in range(self.workers):
+            executor.submit(_warm)
+
+    async def _stored(self, name: str):
+        try:
+            _, chunks = await media_store.open("pdf", name)
+        except MediaNotFound:
+            return None
+        return b"".join([chunk async for chunk in chunks])
+
+    async def _create(self, name: str, layout: str, data: dict, image_url: str = None) -> bytes:
+        # Another node (or this one before a restart) may already have rendered this version
+        pdf = await self._stored(name)
+        if pdf is not None:
+            return pdf
+
+        # Thumbnailed, cached local copy; our own uploads never go over HTTP
+        async with metrics.span("pdf_image"):
+            image_path = await image_resolver.resolve(image_url) if image_url else None
+        try:
+            loop = asyncio.get_running_loop()
+            async with metrics.span("pdf_render", layout=layout):
+                pdf = await loop.run_in_executor(self._executor(), _render, layout, data, image_path)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); start a fresh pool for the next request
+            self._pool = None
+            raise
+        self.renders += 1
+        metrics.observe("aidoctor_payload_bytes", len(pdf), kind="pdf")
+        await media_store.put_bytes("pdf", name, pdf, "application/pdf")
+        return pdf
+
+    async def _create_and_keep(self, key: str, name: str, layout: str, data: dict, image_url: str = None) -> bytes:
+        self.misses += 1
+        pdf = await self._create(name, layout, data, image_url)
+        self._entries[key] = pdf
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+        return pdf
+
+    async def render(self, layout: str, data: dict, image_url: str = None):
+        """Return (media key, PDF bytes) for data drawn with layout, rendering it only on a miss."""
+        key = report_key(layout, data)
+        name = f"{key}.pdf"
+        if key in self._entries:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return name, self._entries[key]
+
+        # Single flight: a double-clicked download renders once
+        return name, await self._flights.run(key, partial(self._create_and_keep, key, name, layout, data, image_url))
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": sum(len(pdf) for pdf in self._entries.values()),
+            "hits": self.hits,
+            "misses": self.misses,
+            "renders": self.renders,
+            "inflight": len(self._flights),
+        }
+
+
+pdf_engine = PDFEngine()
@@ -0,0 +1,80 @@
+# app/services/pdf_export.py
+
+import asyncio
+import os
+import re
+import time
+import zipfile
+from datetime import datetime
+
+from app.services.pdf_engine import pdf_engine
+from app.utils.trace import log
+
+EXPORT_MAX_REPORTS = int(os.environ.get("EXPORT_MAX_REPORTS", "100"))
+
+
+class _ZipBuffer:
+    # Write-only sink for ZipFile; without tell/seek it writes streaming-friendly local headers
+    def __init__(self):
+        self.parts = []
+
+    def write(self, data: bytes) -> int:
+        self.parts.append(bytes(data))
+        return len(data)
+
+    def flush(self) -> None:
+        pass
+
+    def drain(self) -> bytes:
+        data = b"".join(self.parts)
+        self.parts.clear()
+        return data
+
+
+def report_filename(diagnosis: dict) -> str:
+    safe_id = re.sub(r"[^\w.-]", "_", str(diagnosis.get("frontendId", "unknown")))
+    return f"diagnosis-report-{safe_id}.pdf"
+
+
+async def combined_pdf(diagnoses: list):
+    """(media key, PDF bytes) of one document with every diagnosis, rendered by a single worker."""
+    return await pdf_engine.render("combined", {"diagnoses": diagnoses})
+
+
+async def zip_stream(diagnoses: list):
+    """Yield a ZIP of one PDF per diagnosis. Reports render in parallel on the PDF pool and each
+    entry goes out as soon as its render finishes, so only a few PDFs are in memory at a time."""
+    semaphore = asyncio.Semaphore(pdf_engine.workers * 2)
+
+    async def render(diagnosis: dict):
+        async with semaphore:
+            try:
+                _, pdf = await pdf_engine.render("report", diagnosis)
+                return diagnosis, pdf, None
+            except Exception as e:
+                log("PDF", f"Export of {diagnosis.get('frontendId')} failed: {e}")
+                return diagnosis, None, e
+
+    tasks = [asyncio.ensure_future(render(diagnosis)) for diagnosis in diagnoses]
+    buffer = _ZipBuffer()
+    failed = []
+    try:
+        # PDFs are already compressed internally; deflating them again costs CPU for ~nothing
+        with zipfile.ZipFile(buffer, "w", compression=zipfile.ZIP_STORED) as archive:
+            for finished in asyncio.as_completed(tasks):
+                diagnosis, pdf, error = await finished
+                if error:
+                    failed.append(f"{report_filename(diagnosis)}: {error}")
+                    continue
+                created = diagnosis.get("createdAt")
+                stamp = created.timetuple()[:6] if isinstance(created, datetime) else time.localtime()[:6]
+                entry = zipfile.ZipInfo(report_filename(diagnosis), date_time=stamp)
+                archive.writestr(entry, pdf)
+                yield buffer.drain()
+            if failed:
+                archive.writestr("errors.txt", "\n".join(failed))
+        yield buffer.drain()
+    finally:
+        # Client went away (or we're done): don't keep rendering for nobody
+        for task in tasks:
+            task.cancel()
@@ -1,25 +1,24 @@
-from fpdf import FPDF
 import os
-import uuid
 from datetime import datetime
 
-def generate_pdf_report(diagnosis):
-    # print(f"DEBUG: Diagnosis data received by PDF generator: {diagnosis}")
-    filename = f"diagnosis_report_{uuid.uuid4().hex}.pdf"
-    filepath = os.path.join("temp", filename)
-    
-    os.makedirs("temp", exist_ok=True)
+LOGO_PATH = os.path.join("sample-assets", "MediCare-AI-logo1.png")
+# The diagnosis fields the report shows; fetching only these keeps the cache key stable too
+REPORT_FIELDS = {"_id": 0, "userId": 1, "frontendId": 1, "symptom": 1, "transcript": 1,
+                 "diagnosis": 1, "audioUrl": 1, "imageUrl": 1, "createdAt": 1}
 
-    pdf = FPDF()
+# Layout of the downloadable diagnosis report. Runs inside a pdf_engine worker; assets holds
+# what the worker prepared once at startup (the logo, as an fpdf-friendly copy).
+def draw_report(pdf, diagnosis: dict, assets: dict, image_path: str = None):
+    # print(f"DEBUG: Diagnosis data received by PDF generator: {diagnosis}")
     pdf.add_page()
     pdf.set_auto_page_break(auto=True, margin=15)
 
     # Add logo
-    logo_path = os.path.join("sample-assets", "MediCare-AI-logo1.png")
-    if os.path.exists(logo_path):
+    logo = assets.get("logo")
+    if logo and os.path.exists(logo):
         logo_width = 40 # Adjust as needed
         x_pos = (pdf.w - logo_width) / 2
-        pdf.image(logo_path, x=x_pos, y=10, w=logo_width)
+        pdf.image(logo, x=x_pos, y=10, w=logo_width)
     pdf.ln(30) # Move cursor down after logo
 
     # Header
@@ -90,8 +89,8 @@ def generate_pdf_report(diagnosis):
     pdf.set_text_color(150, 150, 150)
     pdf.multi_cell(0, 5, "Disclaimer: This AI-generated report is for informational purposes only and should not be considered medical advice. Always consult with a qualified healthcare professional for any health concerns.", align="C")
 
-    # Final step - write file in binary-safe way
-    pdf.output(filepath, "F")
 
-    print(f"[PDF] Report saved at: {filepath}")
-    return filepath
+# Several diagnoses in one document, each starting on its own page
+def draw_combined_report(pdf, data: dict, assets: dict, image_path: str = None):
+    for diagnosis in data["diagnoses"]:
+        draw_report(pdf, diagnosis, assets)
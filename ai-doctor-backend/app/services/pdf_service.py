@@ -1,6 +1,3 @@
-import os
-import uuid
-import requests
 from fpdf import FPDF
 from datetime import datetime
 
@@ -15,11 +12,8 @@ class PDFReportGenerator(FPDF):
         self.set_font("Arial", "I", 8)
         self.cell(0, 10, f"Page {self.page_no()}", 0, 0, "C")
 
-def generate_enhanced_pdf_report(data):
-    temp_dir = "temp"
-    os.makedirs(temp_dir, exist_ok=True)
-
-    pdf = PDFReportGenerator()
+# Layout behind /api/pdf-report; rendered by pdf_engine. image_path is the already downloaded image.
+def draw_enhanced_report(pdf: PDFReportGenerator, data: dict, assets: dict, image_path: str = None):
     pdf.add_page()
     pdf.set_auto_page_break(auto=True, margin=15)
 
@@ -56,21 +50,10 @@ def generate_enhanced_pdf_report(data):
 
     if data.get("image_url"):
         pdf.cell(0, 8, f"Image URL: {data.get('image_url')}", ln=True)
-        try:
-            # Construct the full URL for the image
-            image_response = requests.get(data["image_url"], stream=True)   
-            if image_response.status_code == 200:
-                image_path = os.path.join(temp_dir, f"temp_image_{uuid.uuid4().hex}.jpg")
-                with open(image_path, "wb") as f:
-                    f.write(image_response.content)
+        if image_path is None:
+            pdf.cell(0, 8, "Could not embed image.", ln=True)
+        else:
+            try:
                 pdf.image(image_path, x=15, w=pdf.w - 30)
-                os.remove(image_path)
-        except Exception as e:
-            pdf.cell(0, 8, f"Could not embed image: {e}", ln=True)
-
-    # Save the PDF
-    filename = f"diagnosis_report_{uuid.uuid4().hex}.pdf"
-    filepath = os.path.join(temp_dir, filename)
-    pdf.output(filepath, "F")
-
-    return filepath, filename
+            except Exception as e:
+                pdf.cell(0, 8, f"Could not embed image: {e}", ln=True)
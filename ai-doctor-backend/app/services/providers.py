@@ -0,0 +1,148 @@
+# app/services/providers.py
+
+import os
+import threading
+from typing import TYPE_CHECKING
+
+import httpx
+
+# The SDKs take a few hundred ms to import, so they load when their client is first built
+# (pre-warmed in the background by the app lifespan) rather than with the app
+if TYPE_CHECKING:
+    from elevenlabs.client import ElevenLabs
+    from groq import Groq
+
+GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
+ELEVENLABS_API_KEY = os.environ.get("ELEVENLABS_API_KEY")
+# Alternative endpoint (e.g. the fake servers in benchmarks/); Groq reads GROQ_BASE_URL itself
+ELEVENLABS_BASE_URL = os.environ.get("ELEVENLABS_BASE_URL") or None
+
+# Connection pool tuning, shared by every provider client
+PROVIDER_POOL_SIZE = int(os.environ.get("PROVIDER_POOL_SIZE", "20"))
+PROVIDER_KEEPALIVE = int(os.environ.get("PROVIDER_KEEPALIVE", "10"))
+PROVIDER_KEEPALIVE_EXPIRY = float(os.environ.get("PROVIDER_KEEPALIVE_EXPIRY", "60"))
+PROVIDER_CONNECT_TIMEOUT = float(os.environ.get("PROVIDER_CONNECT_TIMEOUT", "5"))
+PROVIDER_READ_TIMEOUT = float(os.environ.get("PROVIDER_READ_TIMEOUT", "60"))
+PROVIDER_HTTP2 = os.environ.get("PROVIDER_HTTP2", "true").lower() == "true"
+
+try:
+    import h2  # noqa: F401  (httpx only speaks HTTP/2 when h2 is installed)
+    _HTTP2_AVAILABLE = True
+except ImportError:
+    _HTTP2_AVAILABLE = False
+
+
+class _PoolCounters:
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.requests = 0
+        self.connections_opened = 0
+        self.tls_handshakes = 0
+
+    def on_request(self, request: httpx.Request) -> None:
+        with self.lock:
+            self.requests += 1
+        # httpcore reports connection setup through the trace extension
+        request.extensions["trace"] = self.trace
+
+    def trace(self, event_name: str, info: dict) -> None:
+        if event_name == "connection.connect_tcp.complete":
+            with self.lock:
+                self.connections_opened += 1
+        elif event_name == "connection.start_tls.complete":
+            with self.lock:
+                self.tls_handshakes += 1
+
+
+# Long-lived provider clients with keep-alive pools, owned by the app lifespan
+class ProviderRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._http = {}
+        self._counters = {}
+        self._clients = {}
+
+    def _http_client(self, name: str) -> httpx.Client:
+        counters = _PoolCounters()
+        client = httpx.Client(
+            http2=PROVIDER_HTTP2 and _HTTP2_AVAILABLE,
+            limits=httpx.Limits(
+                max_connections=PROVIDER_POOL_SIZE,
+                max_keepalive_connections=PROVIDER_KEEPALIVE,
+                keepalive_expiry=PROVIDER_KEEPALIVE_EXPIRY,
+            ),
+            timeout=httpx.Timeout(PROVIDER_READ_TIMEOUT, connect=PROVIDER_CONNECT_TIMEOUT),
+            event_hooks={"request": [counters.on_request]},
+        )
+        self._http[name] = client
+        self._counters[name] = counters
+        return client
+
+    def _get(self, name: str, factory):
+        client = self._clients.get(name)
+        if client is None:
+            with self._lock:
+                client = self._clients.get(name)
+                if client is None:
+                    http = self._http.get(name) or self._http_client(name)
+                    client = factory(http)
+                    self._clients[name] = client
+        return client
+
+    def groq(self) -> "Groq":
+        from groq import Groq
+        return self._get("groq", lambda http: Groq(api_key=GROQ_API_KEY, http_client=http))
+
+    def elevenlabs(self) -> "ElevenLabs":
+        from elevenlabs.client import ElevenLabs
+        return self._get("elevenlabs", lambda http: ElevenLabs(api_key=ELEVENLABS_API_KEY, httpx_client=http,
+                                                                  base_url=ELEVENLABS_BASE_URL))
+
+    def startup(self) -> None:
+        # Import the SDKs and build the clients ahead of the first request that needs them
+        for name, build in (("groq", self.groq), ("elevenlabs", self.elevenlabs)):
+            try:
+                build()
+            except Exception as e:
+                print(f"[PROVIDERS] Could not initialise {name} client: {e}")
+
+    def close(self) -> None:
+        with self._lock:
+            for client in self._http.values():
+                client.close()
+            self._http.clear()
+            self._counters.clear()
+            self._clients.clear()
+
+    def stats(self) -> dict:
+        stats = {}
+        for name, client in list(self._http.items()):
+            counters = self._counters.get(name)
+            if counters is None:
+                continue
+            pool = getattr(client._transport, "_pool", None)
+            connections = pool.connections if pool else []
+            idle = sum(1 for c in connections if c.is_idle())
+            stats[name] = {
+                "http2": bool(pool and pool._http2),
+                "pool_size": PROVIDER_POOL_SIZE,
+                "max_keepalive": PROVIDER_KEEPALIVE,
+                "connections": len(connections),
+                "idle": idle,
+                "active": len(connections) - idle,
+                "requests": counters.requests,
+                "connections_opened": counters.connections_opened,
+                "tls_handshakes": counters.tls_handshakes,
+            }
+        return stats
+
+
+registry = ProviderRegistry()
+
+
+def get_groq_client() -> "Groq":
+    return registry.groq()
+
+
+def get_elevenlabs_client() -> "ElevenLabs":
+    return registry.elevenlabs()
@@ -0,0 +1,135 @@
+# app/services/stages.py
+
+import asyncio
+import math
+import os
+import time
+from contextvars import ContextVar
+
+from app.services.metrics import metrics
+
+# How many requests may be inside each stage at once, across inline and queued chats. The
+# *_requests stages hold whole chat/TTS requests and are entered before their uploads are read.
+STAGE_CONCURRENCY = {
+    "chat_requests": int(os.environ.get("CHAT_REQUEST_CONCURRENCY", "16")),
+    "tts_requests": int(os.environ.get("TTS_REQUEST_CONCURRENCY", "32")),
+    "stt": int(os.environ.get("STT_CONCURRENCY", "8")),
+    "vision": int(os.environ.get("VISION_CONCURRENCY", "4")),
+    "tts": int(os.environ.get("TTS_CONCURRENCY", "8")),
+}
+# Beyond this many waiters per slot, or this long waiting, a request is shed with a 503 instead
+STAGE_QUEUE_FACTOR = int(os.environ.get("STAGE_QUEUE_FACTOR", "4"))
+STAGE_MAX_WAIT = float(os.environ.get("STAGE_MAX_WAIT", "10"))
+
+# Absolute (monotonic) time by which the current request has to be answered; None for work
+# with nobody waiting on it, like queued jobs, which wait as long as it takes
+_deadline = ContextVar("deadline", default=None)
+
+
+# Turned into a fast 429 (client over its rate) or 503 (node or provider quota busy) with Retry-After
+class AdmissionRejected(Exception):
+    def __init__(self, status_code: int, detail: str, retry_after: float):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+        self.retry_after = retry_after
+
+
+def set_deadline(seconds: float):
+    """Give the current request seconds from now to finish; returns a token for reset_deadline."""
+    return _deadline.set(time.monotonic() + seconds)
+
+
+def reset_deadline(token) -> None:
+    _deadline.reset(token)
+
+
+def time_left():
+    deadline = _deadline.get()
+    return None if deadline is None else deadline - time.monotonic()
+
+
+class Stage:
+    def __init__(self, name: str, limit: int):
+        self.name = name
+        self.limit = limit
+        self.max_waiting = limit * STAGE_QUEUE_FACTOR
+        self._semaphore = asyncio.Semaphore(limit)
+        self.active = 0
+        self.waiting = 0
+        self.shed = 0
+        self.avg_seconds = None  # moving average of how long a request holds a slot
+
+    def retry_after(self) -> float:
+        return max(1, math.ceil((self.avg_seconds or 1) * (self.waiting + 1) / self.limit))
+
+    def _reject(self, reason: str):
+        self.shed += 1
+        metrics.inc("aidoctor_admission_rejected_total", scope=self.name, reason=reason)
+        return AdmissionRejected(503, f"Too busy to start {self.name} ({reason}), try again shortly",
+                                 self.retry_after())
+
+    async def acquire(self) -> None:
+        left = time_left()
+        if left is not None:
+            # Not worth queueing for work that can't finish in time anyway
+            if left <= 0 or (self.avg_seconds is not None and self.avg_seconds > left):
+                raise self._reject("deadline")
+            if self.waiting >= self.max_waiting:
+                raise self._reject("queue_full")
+        self.waiting += 1
+        try:
+            if left is None:
+                await self._semaphore.acquire()
+            else:
+                await asyncio.wait_for(self._semaphore.acquire(), min(left, STAGE_MAX_WAIT))
+        except asyncio.TimeoutError:
+            raise self._reject("wait_timeout") from None
+        finally:
+            self.waiting -= 1
+        self.active += 1
+
+    def release(self, held: float) -> None:
+        self.active -= 1
+        self._semaphore.release()
+        self.avg_seconds = held if self.avg_seconds is None else 0.8 * self.avg_seconds + 0.2 * held
+
+    def stats(self) -> dict:
+        return {
+            "limit": self.limit,
+            "active": self.active,
+            "waiting": self.waiting,
+            "max_waiting": self.max_waiting,
+            "shed": self.shed,
+            "avg_seconds": self.avg_seconds,
+        }
+
+
+# One slot in a stage for the duration of an `async with`
+class _Slot:
+    def __init__(self, stage: Stage):
+        self.stage = stage
+        self.started = None
+
+    async def __aenter__(self):
+        await self.stage.acquire()
+        self.started = time.monotonic()
+        return self
+
+    async def __aexit__(self, exc_type, exc, tb):
+        self.stage.release(time.monotonic() - self.started)
+        return False
+
+
+_stages = {}
+
+
+def stage(name: str) -> _Slot:
+    current = _stages.get(name)
+    if current is None:
+        current = _stages[name] = Stage(name, STAGE_CONCURRENCY[name])
+    return _Slot(current)
+
+
+def stage_stats() -> dict:
+    return {name: current.stats() for name, current in _stages.items()}
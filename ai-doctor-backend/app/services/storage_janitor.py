@@ -0,0 +1,191 @@
+# app/services/storage_janitor.py
+
+import asyncio
+import os
+import time
+
+from app.db import db
+from app.services.audio_prep import AUDIO_PREP_DIR
+from app.utils.executor import run_blocking
+
+API_BASE_URL = os.environ.get("API_BASE_URL")
+
+STORAGE_DIRS = ["temp", "uploads"]
+STORAGE_QUOTA_BYTES = int(os.environ.get("STORAGE_QUOTA_BYTES", str(2 * 1024 * 1024 * 1024)))
+STORAGE_SWEEP_INTERVAL = float(os.environ.get("STORAGE_SWEEP_INTERVAL", "600"))
+# Files younger than this are never touched: they may belong to a request that is still running
+STORAGE_MIN_AGE = float(os.environ.get("STORAGE_MIN_AGE", "600"))
+
+
+def _ttl(name: str, default: float):
+    value = float(os.environ.get(name, default))
+    return value if value > 0 else None
+
+
+# Time to live per artifact class, in seconds (0 = keep until the quota needs the space)
+ARTIFACT_TTLS = {
+    "tts": _ttl("STORAGE_TTL_TTS", 7 * 24 * 3600),
+    "pdf": _ttl("STORAGE_TTL_PDF", 24 * 3600),
+    "scratch": _ttl("STORAGE_TTL_SCRATCH", 3600),
+    "upload": _ttl("STORAGE_TTL_UPLOAD", 0),
+}
+
+
+def classify(directory: str, name: str, root: str = None) -> str:
+    if directory == "uploads":
+        return "upload"
+    if root and os.path.normpath(root) == os.path.normpath(AUDIO_PREP_DIR):
+        return "scratch"  # normalized copies of uploads, only ever sent to STT
+    if name.endswith(".mp3"):
+        return "tts"
+    if name.endswith(".pdf"):
+        return "pdf"
+    return "scratch"
+
+
+def _scan() -> list:
+    files = []
+    for directory in STORAGE_DIRS:
+        if not os.path.isdir(directory):
+            continue
+        for root, _, names in os.walk(directory):
+            for name in names:
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except FileNotFoundError:
+                    continue
+                files.append({
+                    "path": path,
+                    "directory": directory,
+                    "class": classify(directory, name, root),
+                    "size": stat.st_size,
+                    "mtime": stat.st_mtime,
+                })
+    return files
+
+
+def _remove(paths: list) -> int:
+    freed = 0
+    for path in paths:
+        try:
+            size = os.path.getsize(path)
+            os.remove(path)
+            freed += size
+        except FileNotFoundError:
+            pass
+    return freed
+
+
+def _url(path: str) -> str:
+    return f"{API_BASE_URL}/{path.replace(os.sep, '/')}"
+
+
+async def referenced_paths(candidates: list) -> set:
+    """Paths among candidates that a stored diagnosis or an unfinished job still points at."""
+    referenced = set()
+    for start in range(0, len(candidates), 500):
+        batch = candidates[start:start + 500]
+        by_url = {_url(f["path"]): f["path"] for f in batch}
+        urls = list(by_url)
+        cursor = db.diagnoses.find(
+            {"$or": [{"ttsUrl": {"$in": urls}}, {"audioUrl": {"$in": urls}}, {"imageUrl": {"$in": urls}}]},
+            {"ttsUrl": 1, "audioUrl": 1, "imageUrl": 1},
+        )
+        async for doc in cursor:
+            for field in ("ttsUrl", "audioUrl", "imageUrl"):
+                if doc.get(field) in by_url:
+                    referenced.add(by_url[doc[field]])
+
+        paths = [f["path"] for f in batch]
+        cursor = db.chat_jobs.find(
+            {"status": {"$in": ["queued", "running"]},
+             "$or": [{"audioPath": {"$in": paths}}, {"imagePath": {"$in": paths}}]},
+            {"audioPath": 1, "imagePath": 1},
+        )
+        async for job in cursor:
+            referenced.update(p for p in (job.get("audioPath"), job.get("imagePath")) if p)
+    return referenced
+
+
+# Expires generated artifacts per class and keeps temp/ + uploads/ under a byte quota,
+# evicting oldest first, without ever removing a file a live diagnosis still links to
+class StorageJanitor:
+    def __init__(self):
+        self._task = None
+        self.last_sweep = None
+        self.files_deleted = 0
+        self.bytes_freed = 0
+        self._usage = {}
+
+    async def sweep(self) -> dict:
+        files = await run_blocking(_scan)
+        now = time.time()
+        old_enough = [f for f in files if now - f["mtime"] >= STORAGE_MIN_AGE]
+        referenced = await referenced_paths(old_enough) if old_enough else set()
+        eligible = [f for f in old_enough if f["path"] not in referenced]
+
+        victims = {f["path"]: f for f in eligible
+                   if ARTIFACT_TTLS[f["class"]] is not None and now - f["mtime"] > ARTIFACT_TTLS[f["class"]]}
+        total = sum(f["size"] for f in files) - sum(f["size"] for f in victims.values())
+
+        # Still over quota: oldest unreferenced files go next, until enough bytes are freed
+        for f in sorted(eligible, key=lambda f: f["mtime"]):
+            if total <= STORAGE_QUOTA_BYTES:
+                break
+            if f["path"] not in victims:
+                victims[f["path"]] = f
+                total -= f["size"]
+
+        victims = list(victims)
+        freed = await run_blocking(_remove, victims) if victims else 0
+
+        self.files_deleted += len(victims)
+        self.bytes_freed += freed
+        self.last_sweep = now
+        deleted = set(victims)
+        self._usage = self._summarize(f for f in files if f["path"] not in deleted)
+        if victims:
+            print(f"[STORAGE] Removed {len(victims)} file(s), freed {freed} bytes "
+                  f"({len(referenced)} kept because they are still referenced)")
+        return {"deleted": len(victims), "bytes_freed": freed, "kept_referenced": len(referenced)}
+
+    @staticmethod
+    def _summarize(files) -> dict:
+        usage = {"directories": {}, "classes": {}}
+        for f in files:
+            for group, name in (("directories", f["directory"]), ("classes", f["class"])):
+                entry = usage[group].setdefault(name, {"files": 0, "bytes": 0})
+                entry["files"] += 1
+                entry["bytes"] += f["size"]
+        return usage
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await self.sweep()
+            except Exception as e:
+                print(f"[STORAGE] Sweep failed: {e}")
+            await asyncio.sleep(STORAGE_SWEEP_INTERVAL)
+
+    def start(self) -> None:
+        self._task = asyncio.create_task(self._run())
+
+    async def stop(self) -> None:
+        if self._task:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    def stats(self) -> dict:
+        return dict(
+            self._usage,
+            quota_bytes=STORAGE_QUOTA_BYTES,
+            ttl_seconds=ARTIFACT_TTLS,
+            last_sweep=self.last_sweep,
+            files_deleted=self.files_deleted,
+            bytes_freed=self.bytes_freed,
+        )
+
+
+janitor = StorageJanitor()
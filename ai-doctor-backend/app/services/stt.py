@@ -3,14 +3,50 @@ from dotenv import load_dotenv
 load_dotenv()
 
 import os
-from groq import Groq
+import threading
+from collections import OrderedDict
+
+from app.services.health import groq_stt_health
+from app.services.metrics import metrics
+from app.services.providers import get_groq_client
 
-# Extracted from .env
-GROQ_API_KEY = os.environ.get("GROQ_API_KEY")
 MODEL_NAME = "whisper-large-v3"
+TRANSCRIPT_CACHE_ENTRIES = int(os.environ.get("TRANSCRIPT_CACHE_ENTRIES", "256"))
+
+_transcripts = OrderedDict()  # upload content hash -> transcript
+_transcripts_lock = threading.Lock()
+
+# The same recording always gives the same transcript, so a resubmission skips Whisper
+def cached_transcript(digest: str):
+    if not digest:
+        return None
+    with _transcripts_lock:
+        if digest in _transcripts:
+            _transcripts.move_to_end(digest)
+            metrics.inc("aidoctor_cache_requests_total", cache="transcripts", result="hit")
+            return _transcripts[digest]
+    metrics.inc("aidoctor_cache_requests_total", cache="transcripts", result="miss")
+    return None
+
+def transcribe_audio(audio_path: str, digest: str = None) -> str:
+    transcript = cached_transcript(digest)
+    if transcript is None:
+        transcript = transcribe_uncached(audio_path, digest)
+    return transcript
+
+# Whisper call for a recording known not to be in the cache; stores the result under digest
+def transcribe_uncached(audio_path: str, digest: str = None) -> str:
+    transcript = groq_stt_health.call(_transcribe, audio_path)
+
+    if digest:
+        with _transcripts_lock:
+            _transcripts[digest] = transcript
+            while len(_transcripts) > TRANSCRIPT_CACHE_ENTRIES:
+                _transcripts.popitem(last=False)
+    return transcript
 
-def transcribe_audio(audio_path: str) -> str:
-    client = Groq(api_key=GROQ_API_KEY)
+def _transcribe(audio_path: str) -> str:
+    client = get_groq_client()
 
     with open(audio_path, "rb") as audio_file:
         transcription = client.audio.transcriptions.create(
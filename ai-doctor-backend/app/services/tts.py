@@ -1,33 +1,263 @@
 # app/services/tts.py
 
+import asyncio
 import os
-from gtts import gTTS
-import elevenlabs
-from elevenlabs.client import ElevenLabs
+import re
+from functools import partial
+from app.services.admission import admit_provider, take_provider
+from app.services.health import elevenlabs_health, gtts_health
+from app.services.media_store import media_store
+from app.services.metrics import metrics
+from app.services.mp3 import concat_mp3
+from app.services.providers import get_elevenlabs_client
+from app.services.tts_cache import cache_key, tts_cache
+from app.utils.executor import run_blocking
+from app.utils.trace import log
 
-# Load API key from .env
-ELEVENLABS_API_KEY = os.environ.get("ELEVENLABS_API_KEY")
+ELEVENLABS_VOICE = "Aria"
+ELEVENLABS_FORMAT = "mp3_22050_32"
+ELEVENLABS_MODEL = "eleven_turbo_v2"
+GTTS_LANG = "en"
+
+# "whole" renders the text in one provider call; "sentences" renders each sentence separately
+# (in parallel, cached per sentence) and joins the clips in order
+TTS_MODES = ("whole", "sentences")
+TTS_SEGMENT_CONCURRENCY = int(os.environ.get("TTS_SEGMENT_CONCURRENCY", "4"))
+
+# Launch a gTTS hedge when ElevenLabs hasn't answered within this many seconds (unset disables hedging)
+TTS_HEDGE_AFTER = float(os.environ["TTS_HEDGE_AFTER"]) if os.environ.get("TTS_HEDGE_AFTER") else None
 
 
 # gTTS fallback (if ElevenLabs fails or not available)
 def synthesize_with_gtts(text: str, output_path: str) -> None:
-    tts = gTTS(text=text, lang="en", slow=False)
+    from gtts import gTTS  # imported on first use, like the provider SDKs
+    tts = gTTS(text=text, lang=GTTS_LANG, slow=False)
     tts.save(output_path)
 
 
-# ElevenLabs TTS
+def synthesize_with_elevenlabs(text: str, output_path: str) -> None:
+    from elevenlabs import save
+    client = get_elevenlabs_client()
+    audio = client.generate(
+        text=text,
+        voice=ELEVENLABS_VOICE,
+        output_format=ELEVENLABS_FORMAT,
+        model=ELEVENLABS_MODEL
+    )
+    save(audio, output_path)
+
+
+# ElevenLabs TTS, skipped straight to gTTS while its circuit is open
 def synthesize_speech(text: str, output_path: str) -> str:
+    if elevenlabs_health.allow():
+        try:
+            elevenlabs_health.measure(synthesize_with_elevenlabs, text, output_path)
+            return output_path
+        except Exception as e:
+            log("TTS", f"ElevenLabs error: {e} — falling back to gTTS.")
+            metrics.inc("aidoctor_tts_fallbacks_total", reason="error")
+    else:
+        metrics.inc("aidoctor_tts_fallbacks_total", reason="circuit_open")
+    gtts_health.measure(synthesize_with_gtts, text, output_path)
+    return output_path
+
+
+def _discard(path: str):
+    def callback(task):
+        if not task.cancelled():
+            task.exception()
+        if os.path.exists(path):
+            os.remove(path)
+    return callback
+
+
+# gTTS within its request quota; check_circuit=False for fallbacks, which go ahead even while
+# its breaker is open because there is nothing left to fall back to
+async def render_gtts(text: str, output_path: str, check_circuit: bool = True) -> None:
+    await admit_provider("gtts")
+    await run_blocking(gtts_health.call if check_circuit else gtts_health.measure,
+                       synthesize_with_gtts, text, output_path)
+
+
+# Raised out of an ElevenLabs render that ended up with gTTS audio. That audio is cached and
+# published under the gTTS key, so the ElevenLabs key stays a miss and is tried again next time.
+class FellBackToGTTS(Exception):
+    def __init__(self, path: str):
+        super().__init__(path)
+        self.path = path
+
+
+async def _fallback_speech(text: str) -> str:
+    key = speech_cache_key(text, "gtts")
+    return await _cached(key, partial(render_gtts, text, check_circuit=False))
+
+
+def _forget(task) -> None:
+    if not task.cancelled():
+        task.exception()
+
+
+# Async counterpart of synthesize_speech with hedging: if ElevenLabs is slower than
+# TTS_HEDGE_AFTER, gTTS starts in parallel and whichever finishes first wins
+async def render_speech(text: str, output_path: str) -> None:
+    # Over ElevenLabs' quota is treated like an open circuit: straight to gTTS
+    if await take_provider("elevenlabs"):
+        metrics.inc("aidoctor_tts_fallbacks_total", reason="rate_limited")
+        raise FellBackToGTTS(await _fallback_speech(text))
+    if not elevenlabs_health.allow():
+        metrics.inc("aidoctor_tts_fallbacks_total", reason="circuit_open")
+        raise FellBackToGTTS(await _fallback_speech(text))
+
+    primary_path = f"{output_path}.elevenlabs"
+    primary = asyncio.ensure_future(
+        run_blocking(elevenlabs_health.measure, synthesize_with_elevenlabs, text, primary_path))
+    # Cancelled before the pool ran it, nothing would record an outcome for a half-open probe
+    primary.add_done_callback(lambda task: task.cancelled() and elevenlabs_health.release())
+    hedge = None
+
+    done, pending = await asyncio.wait({primary}, timeout=TTS_HEDGE_AFTER)
+    if not done:
+        log("TTS", f"ElevenLabs exceeded {TTS_HEDGE_AFTER}s — hedging with gTTS.")
+        hedge = asyncio.ensure_future(_fallback_speech(text))
+        pending = {primary, hedge}
+
+    error = None
     try:
-        client = ElevenLabs(api_key=ELEVENLABS_API_KEY)
-        audio = client.generate(
-            text=text,
-            voice="Aria",
-            output_format="mp3_22050_32",
-            model="eleven_turbo_v2"
-        )
-        elevenlabs.save(audio, output_path)
-        return output_path
-    except Exception as e:
-        print(f"ElevenLabs error: {e} — falling back to gTTS.")
-        synthesize_with_gtts(text, output_path)
-        return output_path
+        while True:
+            for task in done:
+                if task.exception() is None:
+                    if task is primary:
+                        os.replace(primary_path, output_path)
+                        return
+                    metrics.inc("aidoctor_tts_fallbacks_total", reason="hedge")
+                    raise FellBackToGTTS(task.result())
+                error = task.exception()
+            if not pending:
+                break
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        # A losing ElevenLabs call keeps running in the pool; clean up its output whenever it
+        # finishes. A losing hedge is left to finish too, its clip is a valid gTTS cache entry.
+        if primary.done():
+            _discard(primary_path)(primary)
+        else:
+            primary.add_done_callback(_discard(primary_path))
+        if hedge is not None and not hedge.done():
+            hedge.add_done_callback(_forget)
+
+    if hedge is not None:
+        raise error
+    log("TTS", f"ElevenLabs error: {error} — falling back to gTTS.")
+    metrics.inc("aidoctor_tts_fallbacks_total", reason="error")
+    raise FellBackToGTTS(await _fallback_speech(text))
+
+
+_SENTENCE_END = re.compile(r"(?<=[.!?])\s+")
+
+
+def split_sentences(text: str) -> list:
+    return [sentence.strip() for sentence in _SENTENCE_END.split(text.strip()) if sentence.strip()]
+
+
+def stitched(text: str, mode: str) -> bool:
+    return mode == "sentences" and len(split_sentences(text)) > 1
+
+
+def speech_cache_key(text: str, engine: str = "elevenlabs", mode: str = "whole") -> str:
+    # A stitched clip is a different file from a single-call render of the same text
+    suffix = ":sentences" if stitched(text, mode) else ""
+    if engine == "gtts":
+        return cache_key(text, "gtts" + suffix, GTTS_LANG, "mp3")
+    return cache_key(text, "elevenlabs" + suffix, ELEVENLABS_VOICE, ELEVENLABS_FORMAT)
+
+
+def _whole_render(text: str, engine: str):
+    if engine == "gtts":
+        return partial(render_gtts, text)
+    return partial(render_speech, text)
+
+
+def _read(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+def _write(path: str, data: bytes) -> None:
+    with open(path, "wb") as f:
+        f.write(data)
+
+
+async def segment_audio(segment: str, engine: str) -> tuple:
+    """(engine that rendered it, MP3 bytes) of one sentence."""
+    # A cached segment can be evicted between lookup and read; render it again in that case
+    try:
+        path, used = await speak_with_engine(segment, engine)
+        return used, await run_blocking(_read, path)
+    except FileNotFoundError:
+        path, used = await speak_with_engine(segment, engine)
+        return used, await run_blocking(_read, path)
+
+
+# Sentences are synthesized concurrently (bounded per text) through the cache, so a sentence
+# that shows up in many diagnoses is rendered once, then joined frame by frame in order
+async def render_sentences(text: str, engine: str, output_path: str) -> None:
+    semaphore = asyncio.Semaphore(TTS_SEGMENT_CONCURRENCY)
+
+    async def bounded(segment: str) -> tuple:
+        async with semaphore:
+            return await segment_audio(segment, engine)
+
+    rendered = await asyncio.gather(*(bounded(segment) for segment in split_sentences(text)))
+    if any(used != engine for used, _ in rendered):
+        # Some sentences fell back to gTTS: stitch the whole text from gTTS, kept under its own key
+        raise FellBackToGTTS(await speak(text, "gtts", "sentences"))
+    try:
+        audio = concat_mp3([clip for _, clip in rendered])
+    except ValueError as e:
+        # e.g. cached clips rendered at different sample rates
+        log("TTS", f"Can't join sentence clips ({e}) — rendering the text in one call.")
+        render = _whole_render(text, engine)
+        if asyncio.iscoroutinefunction(render):
+            await render(output_path)
+        else:
+            await run_blocking(render, output_path)
+        return
+    await run_blocking(_write, output_path, audio)
+
+
+# A cache miss first checks the shared media backend (another node may have rendered the clip),
+# and a fresh render is published there before it lands in the local cache
+async def _render_shared(name: str, render, output_path: str) -> None:
+    if await media_store.fetch("tts", name, output_path):
+        return
+    if asyncio.iscoroutinefunction(render):
+        await render(output_path)
+    else:
+        await run_blocking(render, output_path)
+    metrics.observe("aidoctor_payload_bytes", os.path.getsize(output_path), kind="tts_audio")
+    await media_store.put_file("tts", name, output_path, "audio/mpeg")
+
+
+async def _cached(key: str, render) -> str:
+    name = os.path.basename(tts_cache.path(key))
+    return await tts_cache.get_or_create(key, partial(_render_shared, name, render))
+
+
+async def speak_with_engine(text: str, engine: str = "elevenlabs", mode: str = "whole") -> tuple:
+    """(path, engine) of the rendered MP3; engine is "gtts" when an ElevenLabs render fell back."""
+    if mode not in TTS_MODES:
+        raise ValueError(f"Unknown TTS mode: {mode}")
+    if stitched(text, mode):
+        render = partial(render_sentences, text, engine)
+    else:
+        render = _whole_render(text, engine)
+    try:
+        return await _cached(speech_cache_key(text, engine, mode), render), engine
+    except FellBackToGTTS as e:
+        return e.path, "gtts"
+
+
+# Cached synthesis shared by /api/tts and the chat pipeline; returns the path of the rendered MP3
+async def speak(text: str, engine: str = "elevenlabs", mode: str = "whole") -> str:
+    path, _ = await speak_with_engine(text, engine, mode)
+    return path
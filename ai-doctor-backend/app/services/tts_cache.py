@@ -0,0 +1,192 @@
+# app/services/tts_cache.py
+
+import asyncio
+import hashlib
+import json
+import os
+import uuid
+from collections import OrderedDict
+from functools import partial
+
+from app.services.storage_janitor import referenced_paths
+from app.utils.executor import run_blocking
+from app.utils.single_flight import SingleFlight
+from app.utils.trace import log
+
+TTS_CACHE_DIR = os.environ.get("TTS_CACHE_DIR", os.path.join("temp", "tts"))
+TTS_CACHE_MAX_BYTES = int(os.environ.get("TTS_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+def cache_key(text: str, engine: str, voice: str, fmt: str) -> str:
+    payload = json.dumps([text, engine, voice, fmt], ensure_ascii=False)
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+# Content-addressed store of rendered MP3s with a byte budget and LRU eviction (sparing clips
+# that stored diagnoses link to).
+# All bookkeeping happens on the event loop; only rendering and disk work go to the pool.
+class TTSCache:
+    def __init__(self, directory: str = TTS_CACHE_DIR, max_bytes: int = TTS_CACHE_MAX_BYTES):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self._entries = OrderedDict()  # key -> size in bytes, least recently used first
+        self._bytes = 0
+        self._flights = SingleFlight()
+        self._loading = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.kept_referenced = 0
+
+    def path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.mp3")
+
+    def _load(self) -> None:
+        # Rebuild the index from disk so the cache survives restarts, oldest access first
+        os.makedirs(self.directory, exist_ok=True)
+        files = []
+        for entry in os.scandir(self.directory):
+            if entry.is_file() and entry.name.endswith(".mp3"):
+                stat = entry.stat()
+                files.append((stat.st_mtime, entry.name[:-4], stat.st_size))
+        for _, key, size in sorted(files):
+            self._entries[key] = size
+            self._bytes += size
+
+    async def _evict(self, keep: str) -> list:
+        """Drop least recently used entries until the cache is within budget; returns their paths.
+        Clips a stored diagnosis still links to stay (as if just used) so its ttsUrl keeps working."""
+        victims, kept = [], {keep}
+        while self._bytes > self.max_bytes:
+            candidates, planned = [], self._bytes
+            for key, size in self._entries.items():
+                if planned <= self.max_bytes:
+                    break
+                if key not in kept:
+                    candidates.append(key)
+                    planned -= size
+            if not candidates:
+                break
+            try:
+                referenced = await referenced_paths([{"path": self.path(key)} for key in candidates])
+            except Exception as e:
+                # Over budget for a while is better than breaking a diagnosis' voice
+                log("TTS-CACHE", f"Can't check which clips are referenced ({e}); not evicting")
+                break
+            for key in candidates:
+                if key not in self._entries or self._bytes <= self.max_bytes:
+                    continue
+                if self.path(key) in referenced:
+                    kept.add(key)
+                    self._entries.move_to_end(key)
+                    self.kept_referenced += 1
+                    continue
+                self._bytes -= self._entries.pop(key)
+                self.evictions += 1
+                victims.append(self.path(key))
+        return victims
+
+    @staticmethod
+    def _remove(paths: list) -> None:
+        for path in paths:
+            try:
+                os.remove(path)
+            except FileNotFoundError:
+                pass
+
+    @staticmethod
+    def _commit(tmp_path: str, path: str) -> int:
+        os.replace(tmp_path, path)
+        return os.path.getsize(path)
+
+    async def _store(self, render, path: str) -> int:
+        # Render to a private temp name and rename, so readers never see a partial file
+        tmp_path = f"{path}.{uuid.uuid4().hex}.tmp"
+        try:
+            if asyncio.iscoroutinefunction(render):
+                await render(tmp_path)
+            else:
+                await run_blocking(render, tmp_path)
+            return await run_blocking(self._commit, tmp_path, path)
+        finally:
+            if os.path.exists(tmp_path):
+                os.remove(tmp_path)
+
+    def _touch(self, path: str) -> bool:
+        try:
+            os.utime(path)
+            return True
+        except FileNotFoundError:
+            return False
+
+    async def _ready(self) -> None:
+        if self._loading is None:
+            self._loading = asyncio.ensure_future(run_blocking(self._load))
+        await self._loading
+
+    async def lookup(self, key: str):
+        """Path of the cached file for key, or None on a miss."""
+        await self._ready()
+        if key in self._entries:
+            path = self.path(key)
+            # mtime doubles as the LRU clock on disk
+            if await run_blocking(self._touch, path):
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return path
+            self._bytes -= self._entries.pop(key)
+        return None
+
+    def pending(self, key: str) -> bool:
+        return self._flights.pending(key)
+
+    def _account(self, key: str, size: int) -> None:
+        self._bytes += size - self._entries.pop(key, 0)
+        self._entries[key] = size
+
+    async def _shrink(self, keep: str) -> None:
+        victims = await self._evict(keep)
+        if victims:
+            await run_blocking(self._remove, victims)
+
+    async def put(self, key: str, tmp_path: str) -> str:
+        """Move a file rendered elsewhere (e.g. the tee of a streamed response) into the cache."""
+        await self._ready()
+        path = self.path(key)
+        self._account(key, await run_blocking(self._commit, tmp_path, path))
+        await self._shrink(key)
+        return path
+
+    async def _create(self, key: str, render) -> str:
+        self.misses += 1
+        path = self.path(key)
+        self._account(key, await self._store(render, path))
+        await self._shrink(key)
+        return path
+
+    async def get_or_create(self, key: str, render) -> str:
+        """Return the cached file for key, calling render(path) once to create it on a miss.
+
+        render may be a plain function (run in the blocking pool) or a coroutine function.
+        """
+        path = await self.lookup(key)
+        if path:
+            return path
+        # Identical concurrent requests wait for the first render
+        return await self._flights.run(key, partial(self._create, key, render))
+
+    def stats(self) -> dict:
+        return {
+            "entries": len(self._entries),
+            "bytes": self._bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self._flights.coalesced,
+            "evictions": self.evictions,
+            "kept_referenced": self.kept_referenced,
+            "inflight": len(self._flights),
+        }
+
+
+tts_cache = TTSCache()
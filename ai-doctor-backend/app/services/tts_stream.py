@@ -0,0 +1,229 @@
+# app/services/tts_stream.py
+
+import asyncio
+import io
+import os
+import time
+import uuid
+from contextlib import nullcontext
+
+import aiofiles
+
+from app.services.admission import admit_provider, take_provider
+from app.services.health import ProviderUnavailable, elevenlabs_health, gtts_health
+from app.services.media_store import media_store
+from app.services.metrics import metrics
+from app.services.mp3 import audio_frames
+from app.services.providers import get_elevenlabs_client
+from app.services.tts import (
+    ELEVENLABS_FORMAT, ELEVENLABS_MODEL, ELEVENLABS_VOICE, GTTS_LANG, TTS_SEGMENT_CONCURRENCY,
+    segment_audio, speak, speech_cache_key, split_sentences, stitched,
+)
+from app.services.tts_cache import tts_cache
+from app.utils.executor import iterate_blocking, run_blocking
+from app.utils.trace import log
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+def _stream_elevenlabs(text: str):
+    client = get_elevenlabs_client()
+    yield from client.generate(
+        text=text,
+        voice=ELEVENLABS_VOICE,
+        output_format=ELEVENLABS_FORMAT,
+        model=ELEVENLABS_MODEL,
+        stream=True
+    )
+
+
+# gTTS fetches the text in ~100 character parts; each part's audio is yielded as soon as it arrives
+def _stream_gtts(text: str):
+    from gtts import gTTS
+    yield from gTTS(text=text, lang=GTTS_LANG, slow=False).stream()
+
+
+def _measured(health, func, text: str):
+    start = time.perf_counter()
+    ok = False
+    try:
+        yield from func(text)
+        ok = True
+    except GeneratorExit:
+        # Listener went away; the provider itself was fine
+        ok = True
+        raise
+    finally:
+        health.record(ok, time.perf_counter() - start)
+
+
+async def _first(chunks, health) -> bytes:
+    try:
+        return await anext(chunks)
+    except asyncio.CancelledError:
+        # Listener left before the provider answered: don't leave a half-open probe hanging
+        health.release()
+        raise
+
+
+async def _chain(first: bytes, rest):
+    yield first
+    async for chunk in rest:
+        yield chunk
+
+
+async def _provider_stream(text: str, engine: str):
+    """(source, chunks) with the first chunk already received, so a dead provider fails before any
+    response bytes go out. ElevenLabs falls back to gTTS if it fails before producing audio."""
+    if engine == "elevenlabs" and await take_provider("elevenlabs"):
+        metrics.inc("aidoctor_tts_fallbacks_total", reason="rate_limited")
+    elif engine == "elevenlabs" and elevenlabs_health.allow():
+        chunks = iterate_blocking(_measured, elevenlabs_health, _stream_elevenlabs, text)
+        try:
+            return "elevenlabs", _chain(await _first(chunks, elevenlabs_health), chunks)
+        except Exception as e:
+            await chunks.aclose()
+            log("TTS", f"ElevenLabs error: {e} — falling back to gTTS.")
+            metrics.inc("aidoctor_tts_fallbacks_total", reason="error")
+    elif engine == "elevenlabs":
+        metrics.inc("aidoctor_tts_fallbacks_total", reason="circuit_open")
+    await admit_provider("gtts")
+    if not gtts_health.allow():
+        raise ProviderUnavailable(gtts_health.name, gtts_health.retry_after())
+    chunks = iterate_blocking(_measured, gtts_health, _stream_gtts, text)
+    return "gtts", _chain(await _first(chunks, gtts_health), chunks)
+
+
+def _resample(clip: bytes, rate: int) -> bytes:
+    # Decodes and re-encodes (pydub, so ffmpeg); only needed when a sentence came from another engine
+    from pydub import AudioSegment
+    out = io.BytesIO()
+    AudioSegment.from_file(io.BytesIO(clip), format="mp3").set_frame_rate(rate).export(out, format="mp3")
+    return out.getvalue()
+
+
+async def _sentence_stream(text: str, engine: str, rates: set, sources: set):
+    """Sentence clips rendered concurrently (and cached one by one), sent in order as each is ready.
+
+    The first sentence settles the stream's engine and sample rate: if it fell back to gTTS, the
+    rest is rendered with gTTS too. A later sentence that still comes back at another rate is
+    resampled to the stream's rate, since players mishandle one MP3 whose frames change rate.
+    """
+    semaphore = asyncio.Semaphore(TTS_SEGMENT_CONCURRENCY)
+
+    async def bounded(segment: str, engine: str) -> tuple:
+        async with semaphore:
+            return await segment_audio(segment, engine)
+
+    segments = split_sentences(text)
+    tasks = [asyncio.ensure_future(bounded(segment, engine)) for segment in segments]
+
+    def cancel_all():
+        for task in tasks:
+            task.cancel()
+
+    async def rest(rate: int):
+        try:
+            for task in tasks[1:]:
+                used, clip = await task
+                sources.add(used)
+                data, clip_rate = audio_frames(clip)
+                rates.add(clip_rate)
+                if clip_rate != rate:
+                    try:
+                        data, _ = audio_frames(await run_blocking(_resample, clip, rate))
+                    except Exception as e:
+                        # Better to end the speech early than to send audio that plays wrong
+                        log("TTS", f"Can't resample {used} sentence to {rate} Hz ({e}); ending the stream.")
+                        return
+                yield data
+        finally:
+            cancel_all()
+
+    try:
+        used, clip = await tasks[0]
+        if used != engine:
+            # The first sentence fell back: speak the whole text in the fallback's voice
+            for task in tasks[1:]:
+                task.cancel()
+            tasks[1:] = [asyncio.ensure_future(bounded(segment, used)) for segment in segments[1:]]
+        sources.add(used)
+        first, rate = audio_frames(clip)
+        rates.add(rate)
+    except BaseException:
+        cancel_all()
+        raise
+    return _chain(first, rest(rate))
+
+
+async def _file_stream(path: str):
+    async with aiofiles.open(path, "rb") as f:
+        while chunk := await f.read(STREAM_CHUNK_SIZE):
+            yield chunk
+
+
+# Passes chunks through to the listener; when tee is on, the same bytes are written to a temp file
+# that becomes the cache entry (and media object) once the whole clip has gone out
+async def _deliver(key: str, source: str, started: float, chunks, tee: bool, cacheable=lambda: True):
+    tmp_path = f"{tts_cache.path(key)}.{uuid.uuid4().hex}.tmp"
+    first = True
+    try:
+        async with (aiofiles.open(tmp_path, "wb") if tee else nullcontext()) as f:
+            async for chunk in chunks:
+                if first:
+                    metrics.observe("aidoctor_tts_first_byte_seconds", time.perf_counter() - started, source=source)
+                    first = False
+                if f:
+                    await f.write(chunk)
+                yield chunk
+        if tee and cacheable():
+            path = await tts_cache.put(key, tmp_path)
+            await media_store.put_file("tts", os.path.basename(path), path, "audio/mpeg")
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+
+async def open_speech_stream(text: str, engine: str = "gtts", mode: str = "whole"):
+    """Start speaking text and return an async iterator of MP3 bytes.
+
+    Served from the TTS cache when the clip exists; otherwise the provider's audio is forwarded as
+    it arrives and tee'd into the cache. Raises ProviderUnavailable before any byte is produced.
+    """
+    started = time.perf_counter()
+    key = speech_cache_key(text, engine, mode)
+    path = await tts_cache.lookup(key)
+    if path is None and tts_cache.pending(key):
+        # A non-streamed render of the same clip is under way; reuse its file
+        path = await speak(text, engine, mode)
+    if path is None:
+        tmp_path = f"{tts_cache.path(key)}.{uuid.uuid4().hex}.tmp"
+        if await media_store.fetch("tts", os.path.basename(tts_cache.path(key)), tmp_path):
+            path = await tts_cache.put(key, tmp_path)
+
+    if path is not None:
+        return _deliver(key, "cache", started, _file_stream(path), tee=False)
+    if stitched(text, mode):
+        rates, sources = set(), set()
+        chunks = await _sentence_stream(text, engine, rates, sources)
+        # A stream with sentences from another engine (resampled, or cut short) isn't kept as
+        # the stitched file
+        return _deliver(key, "sentences", started, chunks, tee=True,
+                        cacheable=lambda: len(rates) == 1 and sources == {engine})
+    source, chunks = await _provider_stream(text, engine)
+    # Fallback audio is kept under the gTTS key; the ElevenLabs key stays a miss
+    return _deliver(speech_cache_key(text, source, mode), source, started, chunks, tee=True)
+
+
+def stream_stats() -> dict:
+    ttfb = {}
+    for labels, snapshot in metrics.series("aidoctor_tts_first_byte_seconds").items():
+        if "max" in snapshot:
+            ttfb[dict(labels)["source"]] = {
+                "count": snapshot["count"],
+                "p50_ms": round(snapshot["p50"] * 1000, 1),
+                "p95_ms": round(snapshot["p95"] * 1000, 1),
+                "p99_ms": round(snapshot["p99"] * 1000, 1),
+                "max_ms": round(snapshot["max"] * 1000, 1),
+            }
+    return {"time_to_first_byte": ttfb}
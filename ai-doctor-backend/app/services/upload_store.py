@@ -0,0 +1,111 @@
+# app/services/upload_store.py
+
+import hashlib
+import mimetypes
+import os
+import uuid
+
+import aiofiles
+from fastapi import UploadFile
+
+from app.services.media_store import media_store
+
+UPLOADS_DIR = "uploads"
+INCOMING_DIR = os.path.join("temp", "incoming")  # partial uploads; swept as scratch if abandoned
+UPLOAD_CHUNK_SIZE = 1024 * 1024
+
+# Per-type size caps and accepted MIME types
+UPLOAD_LIMITS = {
+    "audio": {
+        "max_bytes": int(os.environ.get("UPLOAD_MAX_AUDIO_BYTES", str(25 * 1024 * 1024))),
+        "mime_types": {"audio/wav", "audio/x-wav", "audio/wave", "audio/webm", "video/webm", "audio/ogg",
+                       "audio/mpeg", "audio/mp3", "audio/mp4", "audio/x-m4a", "audio/flac"},
+    },
+    "image": {
+        "max_bytes": int(os.environ.get("UPLOAD_MAX_IMAGE_BYTES", str(10 * 1024 * 1024))),
+        "mime_types": {"image/jpeg", "image/png", "image/webp", "image/gif", "image/bmp", "image/tiff"},
+    },
+}
+
+# Most a multipart request may carry: every upload at its cap plus the form fields and part headers.
+# Bigger requests are turned away by the admission middleware before their body is read.
+MAX_UPLOAD_REQUEST_BYTES = sum(limits["max_bytes"] for limits in UPLOAD_LIMITS.values()) + 64 * 1024
+
+
+class UploadRejected(Exception):
+    def __init__(self, status_code: int, detail: str):
+        super().__init__(detail)
+        self.status_code = status_code
+        self.detail = detail
+
+
+def _content_type(upload: UploadFile) -> str:
+    content_type = (upload.content_type or "").split(";")[0].strip().lower()
+    if content_type in ("", "application/octet-stream"):
+        content_type = mimetypes.guess_type(upload.filename or "")[0] or content_type
+    return content_type
+
+
+def _extension(upload: UploadFile, content_type: str) -> str:
+    ext = os.path.splitext(upload.filename or "")[1].lower()
+    return ext or mimetypes.guess_extension(content_type) or ""
+
+
+def digest_of(path: str) -> str:
+    """The content hash a stored upload is named after."""
+    return os.path.basename(path).split(".")[0]
+
+
+def upload_url(path: str) -> str:
+    return media_store.url("uploads", os.path.basename(path))
+
+
+# Make a locally written upload (or a derived file next to it) visible to every node
+async def publish_upload(path: str, content_type: str = None) -> None:
+    await media_store.put_file("uploads", os.path.basename(path), path, content_type)
+
+
+# Working copy for a stored upload; pulled from the media backend when another node received it
+async def ensure_local(path: str) -> str:
+    if not os.path.exists(path):
+        await media_store.fetch("uploads", os.path.basename(path), path)
+    return path
+
+
+# Streams the multipart body to disk in chunks while hashing it, then stores the blob once
+# under its SHA-256 via an atomic rename. Identical re-uploads cost no extra disk.
+async def store_upload(upload: UploadFile, kind: str) -> dict:
+    limits = UPLOAD_LIMITS[kind]
+    content_type = _content_type(upload)
+    if content_type not in limits["mime_types"]:
+        raise UploadRejected(415, f"Unsupported {kind} type: {content_type or 'unknown'}")
+    if upload.size is not None and upload.size > limits["max_bytes"]:
+        raise UploadRejected(413, f"{kind.capitalize()} exceeds {limits['max_bytes']} bytes")
+
+    os.makedirs(INCOMING_DIR, exist_ok=True)
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    tmp_path = os.path.join(INCOMING_DIR, f"{uuid.uuid4().hex}.part")
+    hasher = hashlib.sha256()
+    size = 0
+    try:
+        async with aiofiles.open(tmp_path, "wb") as f:
+            while chunk := await upload.read(UPLOAD_CHUNK_SIZE):
+                size += len(chunk)
+                if size > limits["max_bytes"]:
+                    raise UploadRejected(413, f"{kind.capitalize()} exceeds {limits['max_bytes']} bytes")
+                hasher.update(chunk)
+                await f.write(chunk)
+
+        digest = hasher.hexdigest()
+        path = os.path.join(UPLOADS_DIR, f"{digest}{_extension(upload, content_type)}")
+        if os.path.exists(path):
+            os.remove(tmp_path)
+            os.utime(path)  # fresh again as far as the storage janitor is concerned
+        else:
+            os.replace(tmp_path, path)
+    finally:
+        if os.path.exists(tmp_path):
+            os.remove(tmp_path)
+
+    await publish_upload(path, content_type)
+    return {"digest": digest, "path": path, "url": upload_url(path), "size": size, "content_type": content_type}
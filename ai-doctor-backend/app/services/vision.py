@@ -1,7 +1,10 @@
 # app/services/vision.py
 
 import base64
-from groq import Groq
+import time
+from app.services.health import ProviderUnavailable, groq_vision_health
+from app.services.image_prep import prepare_image
+from app.services.providers import get_groq_client
 
 MODEL_NAME = "meta-llama/llama-4-scout-17b-16e-instruct"
 
@@ -12,10 +15,11 @@ def encode_image(image_path: str) -> str:
 
 # Step 2: Send to multimodal LLM
 def analyze_image(prompt: str, image_path: str) -> str:
-    encoded = encode_image(image_path)
-    client = Groq()
+    encoded, mime_type = prepare_image(image_path)
+    return analyze_encoded_image(prompt, encoded, mime_type)
 
-    messages = [
+def _build_messages(prompt: str, encoded: str, mime_type: str = "image/jpeg") -> list:
+    return [
         {
             "role": "user",
             "content": [
@@ -23,17 +27,50 @@ def analyze_image(prompt: str, image_path: str) -> str:
                 {
                     "type": "image_url",
                     "image_url": {
-                        "url": f"data:image/jpeg;base64,{encoded}",
+                        "url": f"data:{mime_type};base64,{encoded}",
                     },
                 },
             ],
         }
     ]
 
+def analyze_encoded_image(prompt: str, encoded: str, mime_type: str = "image/jpeg") -> str:
+    return groq_vision_health.call(_complete, prompt, encoded, mime_type)
+
+def _complete(prompt: str, encoded: str, mime_type: str) -> str:
+    client = get_groq_client()
+
     chat_completion = client.chat.completions.create(
-        messages=messages,
+        messages=_build_messages(prompt, encoded, mime_type),
         model=MODEL_NAME
     )
 
     return chat_completion.choices[0].message.content
 
+# Same call, but yields the diagnosis token by token as Groq streams it
+def stream_encoded_image(prompt: str, encoded: str, mime_type: str = "image/jpeg"):
+    if not groq_vision_health.allow():
+        raise ProviderUnavailable(groq_vision_health.name, groq_vision_health.retry_after())
+
+    start = time.perf_counter()
+    ok = False
+    try:
+        client = get_groq_client()
+
+        stream = client.chat.completions.create(
+            messages=_build_messages(prompt, encoded, mime_type),
+            model=MODEL_NAME,
+            stream=True
+        )
+
+        for chunk in stream:
+            token = chunk.choices[0].delta.content if chunk.choices else None
+            if token:
+                yield token
+        ok = True
+    except GeneratorExit:
+        # Consumer went away; the provider itself was fine
+        ok = True
+        raise
+    finally:
+        groq_vision_health.record(ok, time.perf_counter() - start)
@@ -1,34 +1,27 @@
-from datetime import datetime, timedelta
+from datetime import datetime, timedelta, timezone
 from typing import Optional
+import time
 from fastapi import Request, HTTPException, Depends
 from fastapi.security import HTTPBearer, HTTPAuthorizationCredentials
 from jose import JWTError, jwt
-from passlib.context import CryptContext
 from app.models.user import User
-from app.db import get_db
 from bson.objectid import ObjectId
+from app.services.auth_cache import is_revoked, load_user, token_cache
 
 SECRET_KEY = "your_secret_key_here"  # 🔐 Replace with a secure, env-based key
 ALGORITHM = "HS256"
 ACCESS_TOKEN_EXPIRE_MINUTES = 1440
 
-pwd_context = CryptContext(schemes=["bcrypt"], deprecated="auto")
-
-
-# 🔐 Hash and verify password
-def hash_password(password: str) -> str:
-    return pwd_context.hash(password)
-
-
-def verify_password(plain_password: str, hashed_password: str) -> bool:
-    return pwd_context.verify(plain_password, hashed_password)
+# 🔐 Password hashing lives in app/services/passwords.py (async, off the event loop)
 
 
 # 🔐 JWT token creation
 def create_access_token(data: dict, expires_delta: Optional[timedelta] = None) -> str:
     to_encode = data.copy()
-    expire = datetime.utcnow() + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
-    to_encode.update({"exp": expire})
+    now = datetime.now(timezone.utc)
+    expire = now + (expires_delta or timedelta(minutes=ACCESS_TOKEN_EXPIRE_MINUTES))
+    # iat lets a password change cut off every token issued before it
+    to_encode.update({"exp": expire, "iat": now})
     return jwt.encode(to_encode, SECRET_KEY, algorithm=ALGORITHM)
 
 
@@ -41,27 +34,41 @@ def verify_token(token: str) -> dict:
         raise HTTPException(status_code=401, detail="Invalid or expired token")
 
 
+# 🔐 Decode (or reuse the cached decode of) a token and make sure it wasn't logged out
+async def authenticate(token: str) -> dict:
+    payload = token_cache.get(token)
+    if payload is None:
+        payload = verify_token(token)
+        if await is_revoked(token):
+            raise HTTPException(status_code=401, detail="Token has been revoked")
+        # Never cached past the token's own expiry
+        token_cache.put(token, payload, ttl=payload.get("exp", 0) - time.time())
+    return payload
+
+
 # 👤 Dependency to get current user
 async def get_current_user(
     credentials: HTTPAuthorizationCredentials = Depends(HTTPBearer()),
-    db=Depends(get_db),
 ):
     token = credentials.credentials
-    payload = verify_token(token)
+    payload = await authenticate(token)
     user_id_str = payload.get("user_id")
 
     if not user_id_str:
         raise HTTPException(status_code=401, detail="Invalid token payload")
 
-    try:
-        user_id_obj = ObjectId(user_id_str)
-    except Exception:
+    if not ObjectId.is_valid(user_id_str):
         raise HTTPException(status_code=401, detail="Invalid user ID format")
 
-    user = await db["users"].find_one({"_id": user_id_obj})
+    user = await load_user(user_id_str)
     if not user:
         raise HTTPException(status_code=401, detail="User not found")
 
+    # Tokens issued before the last password change are no longer valid
+    changed = user.get("passwordChangedAt")
+    if changed and payload.get("iat", 0) < changed.replace(tzinfo=timezone.utc).timestamp():
+        raise HTTPException(status_code=401, detail="Session expired, please log in again")
+
     return user
 
 
@@ -73,7 +80,7 @@ class JWTBearer(HTTPBearer):
     async def __call__(self, request: Request):
         credentials: HTTPAuthorizationCredentials = await super(JWTBearer, self).__call__(request)
         if credentials and credentials.scheme == "Bearer":
-            verify_token(credentials.credentials)
+            await authenticate(credentials.credentials)
             return credentials.credentials
         else:
             raise HTTPException(status_code=403, detail="Invalid or missing token")
@@ -0,0 +1,37 @@
+# app/utils/single_flight.py
+
+import asyncio
+from functools import partial
+
+
+# Identical concurrent work runs once: the first caller for a key starts it as its own task and
+# everyone arriving meanwhile awaits the same result (or exception). Nothing is remembered once it
+# finishes.
+class SingleFlight:
+    def __init__(self):
+        self._inflight = {}  # key -> task doing the work, shared by the callers waiting on it
+        self.coalesced = 0
+
+    def __len__(self) -> int:
+        return len(self._inflight)
+
+    def pending(self, key) -> bool:
+        return key in self._inflight
+
+    def _finished(self, key, task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if not task.cancelled():
+            task.exception()  # mark retrieved when every caller had already given up
+
+    async def run(self, key, work):
+        """Return await work(), unless the same key is already running; then share its outcome."""
+        task = self._inflight.get(key)
+        if task is not None:
+            self.coalesced += 1
+        else:
+            task = asyncio.create_task(work())
+            self._inflight[key] = task
+            task.add_done_callback(partial(self._finished, key))
+        # Any caller may give up (disconnect, deadline) without cancelling the work the others want
+        return await asyncio.shield(task)
@@ -0,0 +1,62 @@
+# app/utils/trace.py
+
+import os
+import re
+import uuid
+from contextvars import ContextVar
+
+# Every request gets a trace id (the caller's X-Request-ID if it sent a sane one), echoed back in
+# the response, attached to log lines and stored on the Diagnosis it produces
+TRACE_REQUESTS = os.environ.get("TRACE_REQUESTS", "true").lower() == "true"
+TRACE_HEADER = os.environ.get("TRACE_HEADER", "X-Request-ID")
+
+_trace_id = ContextVar("trace_id", default=None)
+_VALID = re.compile(r"^[A-Za-z0-9._-]{1,64}$")
+
+
+def new_trace_id() -> str:
+    return uuid.uuid4().hex[:16]
+
+
+def current_trace_id():
+    return _trace_id.get()
+
+
+def set_trace_id(trace_id):
+    """Make trace_id current for this task (and anything it starts); returns a token for reset_trace_id."""
+    return _trace_id.set(trace_id)
+
+
+def reset_trace_id(token) -> None:
+    _trace_id.reset(token)
+
+
+def log(tag: str, message: str) -> None:
+    trace_id = _trace_id.get()
+    print(f"[{tag}] [{trace_id}] {message}" if trace_id else f"[{tag}] {message}")
+
+
+# Plain ASGI middleware rather than @app.middleware("http"): it doesn't buffer streaming
+# responses and the context var it sets is seen by the endpoint itself
+class TraceMiddleware:
+    def __init__(self, app):
+        self.app = app
+        self.header = TRACE_HEADER.lower().encode("latin-1")
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not TRACE_REQUESTS:
+            return await self.app(scope, receive, send)
+
+        incoming = dict(scope.get("headers") or []).get(self.header, b"").decode("latin-1")
+        trace_id = incoming if _VALID.match(incoming) else new_trace_id()
+
+        async def send_with_header(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = list(message.get("headers", [])) + [(self.header, trace_id.encode("latin-1"))]
+            await send(message)
+
+        token = _trace_id.set(trace_id)
+        try:
+            await self.app(scope, receive, send_with_header)
+        finally:
+            _trace_id.reset(token)
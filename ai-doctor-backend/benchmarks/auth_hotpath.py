@@ -0,0 +1,120 @@
+# benchmarks/auth_hotpath.py
+#
+# Login throughput with bcrypt on the event loop (as login/signup used to do it) versus the
+# bounded password pool, plus how long a cheap request waits meanwhile; then authenticated-request
+# latency with and without the token/user cache. Mongo is mongomock behind a fixed round-trip delay.
+# Run from ai-doctor-backend/:  python -m benchmarks.auth_hotpath [concurrent logins] [rtt ms]
+
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+os.environ.setdefault("MONGO_URI", "mongodb://localhost:27017")
+
+import httpx  # noqa: E402
+from mongomock_motor import AsyncMongoMockClient  # noqa: E402
+
+from app.db import use_database  # noqa: E402
+from app.main import app  # noqa: E402
+from app.services import auth_cache, passwords  # noqa: E402
+
+LOGINS = 16
+RTT_MS = 1.0
+AUTHED_REQUESTS = 300
+
+
+class _Slow:
+    # Delays every awaited call by one round trip; cursors and sync attributes pass straight through
+    def __init__(self, target, rtt: float):
+        self._target = target
+        self._rtt = rtt
+
+    def __getitem__(self, name):
+        return _Slow(self._target[name], self._rtt)
+
+    def __getattr__(self, name):
+        attr = getattr(self._target, name)
+        if asyncio.iscoroutinefunction(attr):
+            async def delayed(*args, **kwargs):
+                await asyncio.sleep(self._rtt)
+                return await attr(*args, **kwargs)
+            return delayed
+        if hasattr(attr, "find_one"):  # a collection
+            return _Slow(attr, self._rtt)
+        return attr
+
+
+async def _inline(func, *args):
+    return func(*args)
+
+
+def _ms(samples: list) -> str:
+    ordered = sorted(samples)
+    p95 = ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+    return f"p50 {statistics.median(ordered) * 1000:7.1f} ms  p95 {p95 * 1000:7.1f} ms  max {ordered[-1] * 1000:7.1f} ms"
+
+
+async def _logins(client, logins: int):
+    probes = []
+    done = asyncio.Event()
+
+    async def probe():
+        # A request every 10 ms; time spent waiting for a blocked loop to wake it up counts as latency
+        while not done.is_set():
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            await client.get("/api/tts/cache/stats")
+            probes.append(time.perf_counter() - start - 0.01)
+
+    prober = asyncio.ensure_future(probe())
+    start = time.perf_counter()
+    responses = await asyncio.gather(*(
+        client.post("/api/auth/login", json={"email": f"user{i}@example.com", "password": f"password-{i}"})
+        for i in range(logins)
+    ))
+    elapsed = time.perf_counter() - start
+    done.set()
+    await prober
+    assert all(r.status_code == 200 for r in responses), [r.status_code for r in responses]
+    return logins / elapsed, probes, responses[0].json()["token"]
+
+
+async def _authed(client, token: str):
+    samples = []
+    headers = {"Authorization": f"Bearer {token}"}
+    for _ in range(AUTHED_REQUESTS):
+        start = time.perf_counter()
+        response = await client.get("/api/diagnosis", params={"limit": 1}, headers=headers)
+        samples.append(time.perf_counter() - start)
+        assert response.status_code == 200, response.text
+    return samples
+
+
+async def main(logins: int, rtt_ms: float):
+    database = _Slow(AsyncMongoMockClient().ai_doctor, rtt_ms / 1000)
+    use_database(database)
+    for i in range(logins):
+        hashed = passwords._hash(f"password-{i}", passwords.BCRYPT_ROUNDS)
+        await database.users.insert_one({"name": f"User {i}", "email": f"user{i}@example.com", "password": hashed})
+
+    print(f"bcrypt rounds {passwords.BCRYPT_ROUNDS}, pool size {passwords.PASSWORD_HASH_CONCURRENCY}, "
+          f"{os.cpu_count()} CPUs, {logins} concurrent logins, Mongo RTT {rtt_ms} ms")
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        pooled_run = passwords._run
+        for name, runner in (("bcrypt on loop", _inline), ("password pool", pooled_run)):
+            passwords._run = runner
+            rate, probes, token = await _logins(client, logins)
+            print(f"{name:16} {rate:7.1f} logins/s   other requests meanwhile: {_ms(probes)}  ({len(probes)} probes)")
+        passwords._run = pooled_run
+
+        for name, ttl in (("no auth cache", 0), ("auth cache", auth_cache.AUTH_CACHE_TTL)):
+            auth_cache.token_cache.ttl = auth_cache.user_cache.ttl = ttl
+            samples = await _authed(client, token)
+            print(f"{name:16} authenticated GET /api/diagnosis: {_ms(samples)}")
+
+
+if __name__ == "__main__":
+    args = sys.argv[1:]
+    asyncio.run(main(int(args[0]) if args else LOGINS, float(args[1]) if len(args) > 1 else RTT_MS))
@@ -0,0 +1,131 @@
+# benchmarks/chat_concurrency.py
+#
+# Concurrency check for /api/chat: with every provider stubbed at the same fixed latency, N chats
+# sent at once should finish in roughly the time of one, and the event loop should keep answering
+# other requests meanwhile. Runs the real app under uvicorn against benchmarks/fake_providers.py and
+# mongomock, with unique uploads and symptoms so no cache helps. Exits non-zero when N concurrent
+# chats take more than --tolerance times a single one.
+# Run from ai-doctor-backend/:  python -m benchmarks.chat_concurrency [--chats 8] [--latency 0.5]
+
+import argparse
+import asyncio
+import os
+import shutil
+import sys
+import tempfile
+import time
+import uuid
+import warnings
+from contextlib import redirect_stdout
+
+import httpx
+
+from benchmarks.fake_providers import DEFAULT_PROFILES, FakeProviders, Profile, ServerThread
+from benchmarks.load import AUDIO_FIXTURE, BACKEND_DIR, IMAGE_FIXTURE
+
+PROBE_INTERVAL = 0.05
+
+
+async def _chat(client, audio: bytes, image: bytes, n: int) -> float:
+    files = {
+        "audio": ("patient_voice_test.mp3", audio + uuid.uuid4().bytes, "audio/mpeg"),
+        "image": ("wound.jpg", image + uuid.uuid4().bytes, "image/jpeg"),
+    }
+    data = {"frontendId": f"concurrency-{uuid.uuid4().hex}", "symptom": f"ankle pain {uuid.uuid4().hex[:8]} {n}"}
+    started = time.perf_counter()
+    response = await client.post("/api/chat", files=files, data=data)
+    response.raise_for_status()
+    return time.perf_counter() - started
+
+
+async def _probe(client, samples: list, stop: asyncio.Event) -> None:
+    # A cheap endpoint on the same worker; it stalls if a chat blocks the app's event loop
+    while not stop.is_set():
+        started = time.perf_counter()
+        (await client.get("/api/tts/cache/stats")).raise_for_status()
+        samples.append(time.perf_counter() - started)
+        await asyncio.sleep(PROBE_INTERVAL)
+
+
+async def _run(url: str, chats: int) -> dict:
+    with open(AUDIO_FIXTURE, "rb") as f:
+        audio = f.read()
+    with open(IMAGE_FIXTURE, "rb") as f:
+        image = f.read()
+    limits = httpx.Limits(max_connections=chats + 4)
+    async with httpx.AsyncClient(base_url=url, limits=limits, timeout=120) as client:
+        await _chat(client, audio, image, 0)  # first request pays for imports and pool start-up
+        single = await _chat(client, audio, image, 1)
+
+        samples, stop = [], asyncio.Event()
+        probe = asyncio.create_task(_probe(client, samples, stop))
+        started = time.perf_counter()
+        each = await asyncio.gather(*(_chat(client, audio, image, n) for n in range(2, chats + 2)))
+        concurrent = time.perf_counter() - started
+        stop.set()
+        await probe
+    return {"single": single, "concurrent": concurrent, "slowest": max(each), "probe_max": max(samples or [0])}
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chats", type=int, default=8, help="chats sent at once")
+    parser.add_argument("--latency", type=float, default=0.5, help="fixed seconds every fake provider call takes")
+    parser.add_argument("--tolerance", type=float, default=2.0,
+                        help="fail when the concurrent batch takes longer than this many single chats")
+    args = parser.parse_args()
+
+    fakes = FakeProviders({name: Profile(args.latency) for name in DEFAULT_PROFILES}, open(AUDIO_FIXTURE, "rb").read())
+    fakes.start()
+
+    workdir = tempfile.mkdtemp(prefix="ai-doctor-concurrency-")
+    os.chdir(workdir)
+    os.environ.update({
+        "GROQ_API_KEY": "concurrency-test", "GROQ_BASE_URL": fakes.url,
+        "ELEVENLABS_API_KEY": "concurrency-test", "ELEVENLABS_BASE_URL": fakes.url,
+        "MONGO_URI": "mongodb://localhost:27017",
+        "API_BASE_URL": os.environ.get("API_BASE_URL", "http://concurrency-test"),
+        "NO_PROXY": "127.0.0.1,localhost",
+    })
+    # Rate limits and stage slots would queue the batch on purpose; this measures the pipeline itself
+    for prefix in ("CHAT", "TTS", "GROQ_STT", "GROQ_VISION", "ELEVENLABS", "GTTS"):
+        os.environ.setdefault(f"{prefix}_RATE_PER_MINUTE", "0")
+    for name in ("CHAT_REQUEST", "STT", "VISION", "TTS"):
+        os.environ.setdefault(f"{name}_CONCURRENCY", str(max(args.chats, 16)))
+
+    import gtts.tts
+    gtts.tts._translate_url = lambda tld="com", path="": f"{fakes.url}/{path}"
+    warnings.filterwarnings("ignore", category=RuntimeWarning, module="pydub")
+    sys.path.insert(0, BACKEND_DIR)
+    from mongomock_motor import AsyncMongoMockClient
+    from app.db import use_database
+    from app.main import app
+    use_database(AsyncMongoMockClient().ai_doctor_concurrency)
+
+    log = open(os.devnull, "w")
+    app_server = ServerThread(app, lifespan="on")
+    try:
+        with redirect_stdout(log):
+            app_server.start_and_wait()
+            result = asyncio.run(_run(app_server.url, args.chats))
+    finally:
+        with redirect_stdout(log):
+            app_server.stop()
+            fakes.stop()
+        log.close()
+        os.chdir(BACKEND_DIR)
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    ratio = result["concurrent"] / result["single"]
+    print(f"providers fixed at {args.latency * 1000:.0f}ms per call")
+    print(f"  1 chat:                {result['single'] * 1000:7.0f}ms")
+    print(f"  {args.chats} chats at once:  {result['concurrent'] * 1000:7.0f}ms  ({ratio:.2f}x one chat, "
+          f"slowest {result['slowest'] * 1000:.0f}ms)")
+    print(f"  probe during the batch: max {result['probe_max'] * 1000:.0f}ms")
+    if ratio > args.tolerance:
+        sys.exit(f"FAIL: {args.chats} concurrent chats took {ratio:.2f}x one chat (tolerance {args.tolerance}x)")
+    print("OK")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,40 @@
+# benchmarks/checks.py
+#
+# The pass/fail checks among the benchmarks, run one after another, each in its own process. Needs
+# no Mongo, S3 or provider accounts (mongomock, moto and the fake providers stand in). Exits
+# non-zero if any of them fails, so it can gate a commit or a CI job.
+# Run from ai-doctor-backend/:  python -m benchmarks.checks [name ...]
+
+import subprocess
+import sys
+import time
+
+CHECKS = {
+    # Every hot query in app/indexes.py is answered by a declared index
+    "index_plans": ["benchmarks.index_plans", "--mongomock"],
+    # Local, GridFS and S3 media backends behave the same
+    "media_backends": ["benchmarks.media_backends"],
+    # N concurrent /api/chat requests take about as long as one
+    "chat_concurrency": ["benchmarks.chat_concurrency"],
+}
+
+
+def main(names: list) -> int:
+    failed = []
+    for name in names:
+        started = time.perf_counter()
+        result = subprocess.run([sys.executable, "-m", *CHECKS[name]], capture_output=True, text=True)
+        elapsed = time.perf_counter() - started
+        print(f"{'ok  ' if result.returncode == 0 else 'FAIL'} {name:18} {elapsed:6.1f}s")
+        if result.returncode != 0:
+            failed.append(name)
+            print(result.stdout[-4000:] + result.stderr[-4000:])
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    names = sys.argv[1:] or list(CHECKS)
+    unknown = [name for name in names if name not in CHECKS]
+    if unknown:
+        sys.exit(f"Unknown check(s) {', '.join(unknown)}; expected {', '.join(CHECKS)}")
+    sys.exit(main(names))
@@ -0,0 +1,117 @@
+# benchmarks/cold_start.py
+#
+# Cold start of the API in fresh interpreters: time to import app.main, to get through the
+# lifespan, to answer the first request, and until the provider clients are built; plus which
+# heavy SDKs the import alone pulls in. Mongo is mongomock, so no server is needed.
+# --eager imports the SDKs before the app, which is what importing app.main used to cost.
+# Run from ai-doctor-backend/:  python -m benchmarks.cold_start [--runs 5] [--eager] [--no-prewarm]
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+HEAVY_MODULES = ["groq", "elevenlabs", "gtts", "motor", "pymongo", "fpdf", "PIL", "pydub", "httpx"]
+EAGER_IMPORTS = ["groq", "elevenlabs.client", "gtts", "motor.motor_asyncio"]
+
+
+def _child(eager: bool) -> None:
+    started = time.perf_counter()
+    if eager:
+        for name in EAGER_IMPORTS:
+            __import__(name)
+    from app.main import app
+    imported = time.perf_counter()
+    loaded = [name for name in HEAVY_MODULES if name in sys.modules]
+
+    import asyncio
+    import httpx
+    from mongomock_motor import AsyncMongoMockClient
+    from app.db import use_database
+    from app.services.providers import get_elevenlabs_client, get_groq_client
+    use_database(AsyncMongoMockClient().ai_doctor)
+
+    async def run() -> dict:
+        lifespan_start = time.perf_counter()
+        started_app = started + (lifespan_start - imported)  # leave the benchmark's own setup out
+        async with app.router.lifespan_context(app):
+            ready = time.perf_counter()
+            transport = httpx.ASGITransport(app=app)
+            async with httpx.AsyncClient(transport=transport, base_url="http://cold-start") as client:
+                response = await client.get("/api/tts/cache/stats")
+                assert response.status_code == 200, response.text
+            first_response = time.perf_counter()
+            # Waits on the background pre-warm if it is still importing
+            await asyncio.to_thread(lambda: (get_groq_client(), get_elevenlabs_client()))
+            clients = time.perf_counter()
+        return {
+            "lifespan": ready - lifespan_start,
+            "ready": ready - started_app,
+            "first_response": first_response - started_app,
+            "provider_clients": clients - started_app,
+        }
+
+    timings = asyncio.run(run())
+    timings["import"] = imported - started
+    print(json.dumps({"timings": timings, "loaded_on_import": loaded}))
+
+
+def _interpreter_startup() -> float:
+    started = time.perf_counter()
+    subprocess.run([sys.executable, "-c", "pass"], check=True)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--eager", action="store_true", help="import the SDKs up front, as the app used to")
+    parser.add_argument("--no-prewarm", action="store_true", help="run with PROVIDER_PREWARM=false")
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        return _child(args.eager)
+
+    env = dict(os.environ)
+    env.setdefault("MONGO_URI", "mongodb://localhost:27017")
+    # The clients are built but never called
+    env.setdefault("GROQ_API_KEY", "cold-start")
+    env.setdefault("ELEVENLABS_API_KEY", "cold-start")
+    env["PYTHONPATH"] = os.pathsep.join(filter(None, [BACKEND_DIR, env.get("PYTHONPATH")]))
+    if args.no_prewarm:
+        env["PROVIDER_PREWARM"] = "false"
+    command = [sys.executable, "-m", "benchmarks.cold_start", "--child"] + (["--eager"] if args.eager else [])
+
+    runs, loaded = [], None
+    for _ in range(args.runs):
+        # A fresh, empty working directory each time: startup has to create temp/ and uploads/,
+        # and the storage janitor never sees the checked-in files
+        workdir = tempfile.mkdtemp(prefix="ai-doctor-cold-")
+        try:
+            child = subprocess.run(command, env=env, cwd=workdir, capture_output=True, text=True)
+        finally:
+            shutil.rmtree(workdir, ignore_errors=True)
+        if child.returncode != 0:
+            sys.exit(child.stderr)
+        result = json.loads(child.stdout.strip().splitlines()[-1])
+        runs.append(result["timings"])
+        loaded = result["loaded_on_import"]
+
+    print(f"{args.runs} runs, eager SDK imports {args.eager}, provider pre-warm {not args.no_prewarm}, "
+          f"interpreter startup {_interpreter_startup() * 1000:.0f}ms")
+    for key in ("import", "lifespan", "ready", "first_response", "provider_clients"):
+        values = [run[key] * 1000 for run in runs]
+        print(f"  {key:17} median {statistics.median(values):7.0f}ms   min {min(values):7.0f}ms   max {max(values):7.0f}ms")
+    print(f"  loaded by import: {', '.join(loaded) or 'none'}")
+    print(f"  not loaded:       {', '.join(name for name in HEAVY_MODULES if name not in loaded) or 'none'}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,202 @@
+# benchmarks/fake_providers.py
+#
+# Local stand-ins for the Groq (Whisper + chat completions), ElevenLabs and gTTS endpoints the app
+# calls, with per-provider latency, jitter and error rate, so load tests don't spend real quota.
+# The audio they return is patient_voice_test.mp3, so the app's MP3 handling sees real frames.
+# Used by benchmarks/load.py; the app is pointed here with GROQ_BASE_URL / ELEVENLABS_BASE_URL.
+
+import asyncio
+import base64
+import hashlib
+import json
+import random
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI, Request, Response
+from fastapi.responses import JSONResponse, StreamingResponse
+
+VOICE_ID = "fakevoiceAria0000000"
+TRANSCRIPT = "I twisted my ankle while running yesterday and it is swollen and hurts when I walk."
+DIAGNOSIS = ("With what I see and hear, I think you have a mild ankle sprain. Rest it, keep it elevated "
+             "and use ice for twenty minutes a few times a day.")
+AUDIO_CHUNK = 4096
+
+
+class Profile:
+    """latency and jitter in seconds (uniform latency ± jitter), error_rate as a fraction of calls."""
+
+    def __init__(self, latency: float, jitter: float = 0.0, error_rate: float = 0.0):
+        self.latency = latency
+        self.jitter = jitter
+        self.error_rate = error_rate
+
+    @classmethod
+    def parse(cls, spec: str) -> "Profile":
+        # "latency[,jitter[,error_rate]]", e.g. "0.8,0.3,0.05"
+        values = [float(part) for part in spec.split(",")]
+        return cls(*values)
+
+    def delay(self) -> float:
+        return max(0.0, random.uniform(self.latency - self.jitter, self.latency + self.jitter))
+
+    def fails(self) -> bool:
+        return random.random() < self.error_rate
+
+    def as_dict(self) -> dict:
+        return {"latency": self.latency, "jitter": self.jitter, "error_rate": self.error_rate}
+
+
+# Roughly what the real services take for one diagnosis-sized request
+DEFAULT_PROFILES = {
+    "groq-stt": Profile(0.6, 0.2),
+    "groq-vision": Profile(1.5, 0.5),
+    "elevenlabs": Profile(0.8, 0.3),
+    "gtts": Profile(0.4, 0.1),
+}
+
+
+def create_app(profiles: dict, audio: bytes, counts: dict) -> FastAPI:
+    app = FastAPI()
+
+    async def gate(provider: str):
+        """Wait out the provider's latency; returns an error response when this call should fail."""
+        counts[provider]["calls"] += 1
+        await asyncio.sleep(profiles[provider].delay())
+        if profiles[provider].fails():
+            counts[provider]["errors"] += 1
+            return JSONResponse({"error": {"message": f"fake {provider} failure"}}, status_code=500)
+        return None
+
+    @app.post("/openai/v1/audio/transcriptions")
+    async def transcriptions(request: Request):
+        await request.body()
+        failure = await gate("groq-stt")
+        return failure or {"text": TRANSCRIPT}
+
+    @app.post("/openai/v1/chat/completions")
+    async def completions(request: Request):
+        body = await request.json()
+        profile = profiles["groq-vision"]
+        counts["groq-vision"]["calls"] += 1
+        total = profile.delay()
+        # Time to first token is most of the latency, then the rest streams in
+        await asyncio.sleep(total * 0.4)
+        if profile.fails():
+            counts["groq-vision"]["errors"] += 1
+            return JSONResponse({"error": {"message": "fake groq-vision failure"}}, status_code=500)
+        # Same prompt and image, same answer (like temperature 0), so warm runs can hit the TTS cache
+        text = f"{DIAGNOSIS} Reference {hashlib.sha256(json.dumps(body['messages']).encode()).hexdigest()[:8]}."
+        created = int(time.time())
+        if not body.get("stream"):
+            await asyncio.sleep(total * 0.6)
+            return {
+                "id": "chatcmpl-fake", "object": "chat.completion", "created": created, "model": body.get("model"),
+                "choices": [{"index": 0, "message": {"role": "assistant", "content": text}, "finish_reason": "stop"}],
+            }
+
+        words = text.split(" ")
+
+        async def events():
+            for i, word in enumerate(words):
+                chunk = {
+                    "id": "chatcmpl-fake", "object": "chat.completion.chunk", "created": created,
+                    "model": body.get("model"),
+                    "choices": [{"index": 0, "delta": {"content": word if i == 0 else " " + word}, "finish_reason": None}],
+                }
+                yield f"data: {json.dumps(chunk)}\n\n"
+                await asyncio.sleep(total * 0.6 / len(words))
+            yield "data: [DONE]\n\n"
+
+        return StreamingResponse(events(), media_type="text/event-stream")
+
+    # ElevenLabs' generate() looks the voice up by name on every call
+    @app.get("/v1/voices")
+    async def voices():
+        return {"voices": [{"voice_id": VOICE_ID, "name": "Aria", "category": "premade"}]}
+
+    @app.post("/v1/text-to-speech/{voice_id}")
+    async def text_to_speech(voice_id: str):
+        failure = await gate("elevenlabs")
+        return failure or Response(audio, media_type="audio/mpeg")
+
+    @app.post("/v1/text-to-speech/{voice_id}/stream")
+    async def text_to_speech_stream(voice_id: str):
+        failure = await gate("elevenlabs")
+        if failure:
+            return failure
+
+        async def chunks():
+            for start in range(0, len(audio), AUDIO_CHUNK):
+                yield audio[start:start + AUDIO_CHUNK]
+                await asyncio.sleep(0.01)
+
+        return StreamingResponse(chunks(), media_type="audio/mpeg")
+
+    # gTTS posts each ~100 character part of the text to Google Translate's batchexecute RPC
+    @app.post("/_/TranslateWebserverUi/data/batchexecute")
+    async def batchexecute(request: Request):
+        await request.body()
+        failure = await gate("gtts")
+        if failure:
+            return failure
+        encoded = base64.b64encode(audio).decode("ascii")
+        # gTTS pulls the audio out with a regex that expects Google's compact JSON
+        line = json.dumps([["wrb.fr", "jQ1olc", json.dumps([encoded]), None, None, None, "generic"]],
+                          separators=(",", ":"))
+        return Response(f")]}}'\n\n{len(line)}\n{line}\n", media_type="application/json")
+
+    return app
+
+
+class ServerThread(threading.Thread):
+    """Runs an ASGI app under uvicorn on its own event loop, on a free localhost port."""
+
+    def __init__(self, app, lifespan: str = "off"):
+        super().__init__(daemon=True)
+        self.socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+        self.socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        self.socket.bind(("127.0.0.1", 0))
+        self.port = self.socket.getsockname()[1]
+        self.url = f"http://127.0.0.1:{self.port}"
+        self.server = uvicorn.Server(uvicorn.Config(app, log_level="warning", lifespan=lifespan, access_log=False))
+        self.loop = None
+
+    def run(self) -> None:
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+        self.loop.run_until_complete(self.server.serve(sockets=[self.socket]))
+
+    def start_and_wait(self, timeout: float = 60) -> None:
+        self.start()
+        deadline = time.monotonic() + timeout
+        while not self.server.started:
+            if not self.is_alive() or time.monotonic() > deadline:
+                raise RuntimeError("server did not start")
+            time.sleep(0.02)
+
+    def stop(self) -> None:
+        self.server.should_exit = True
+        self.join(timeout=30)
+
+
+class FakeProviders:
+    def __init__(self, profiles: dict, audio: bytes):
+        self.profiles = profiles
+        self.counts = {name: {"calls": 0, "errors": 0} for name in profiles}
+        self.thread = ServerThread(create_app(profiles, audio, self.counts))
+
+    @property
+    def url(self) -> str:
+        return self.thread.url
+
+    def start(self) -> None:
+        self.thread.start_and_wait()
+
+    def stop(self) -> None:
+        self.thread.stop()
+
+    def snapshot(self) -> dict:
+        return {name: dict(count) for name, count in self.counts.items()}
@@ -0,0 +1,51 @@
+# benchmarks/image_prep.py
+#
+# Payload size and encode time of the vision request, before and after preprocessing.
+# Run from ai-doctor-backend/:  python -m benchmarks.image_prep [image ...]
+
+import base64
+import glob
+import os
+import sys
+import time
+
+from app.services import image_prep
+from app.services.vision import encode_image
+
+DEFAULT_IMAGES = ["wound.jpg"] + sorted(glob.glob(os.path.join("sample-assets", "*")))
+ROUNDS = 5
+
+
+def _timed(func, *args):
+    best = None
+    for _ in range(ROUNDS):
+        start = time.perf_counter()
+        result = func(*args)
+        elapsed = time.perf_counter() - start
+        best = elapsed if best is None else min(best, elapsed)
+    return result, best
+
+
+def _prepare_uncached(path):
+    with open(path, "rb") as f:
+        data = f.read()
+    image_prep._cache.clear()
+    return image_prep.prepare_image_bytes(data, filename=path)
+
+
+def main(paths):
+    print(f"max side {image_prep.IMAGE_MAX_SIDE}px, {image_prep.IMAGE_FORMAT} q{image_prep.IMAGE_QUALITY}, best of {ROUNDS}")
+    print(f"{'image':40} {'file':>10} {'before b64':>11} {'ms':>7} {'after b64':>10} {'ms':>7} {'mime':>11} {'saved':>6}")
+    for path in paths:
+        if not os.path.isfile(path):
+            continue
+        before, before_s = _timed(encode_image, path)
+        (after, mime), after_s = _timed(_prepare_uncached, path)
+        saved = 1 - len(after) / len(before)
+        print(f"{path:40} {os.path.getsize(path):>10} {len(before):>11} {before_s * 1000:>7.1f} "
+              f"{len(after):>10} {after_s * 1000:>7.1f} {mime:>11} {saved:>6.0%}")
+        assert base64.b64decode(after)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:] or DEFAULT_IMAGES)
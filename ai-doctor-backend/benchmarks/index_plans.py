@@ -0,0 +1,89 @@
+# benchmarks/index_plans.py
+#
+# Checks that every hot query in app/indexes.py is answered by an index. Seeds a scratch database,
+# runs the startup index bootstrap against it and asserts each winning plan is an IXSCAN, then
+# drops the indexes and asserts the same queries are reported as COLLSCAN (so the check itself works).
+# Against a real server the plans come from explain(); mongomock can't explain, so there the
+# declared indexes are matched against each query shape instead.
+# Run from ai-doctor-backend/:
+#   MONGO_URI=mongodb://localhost:27017 python -m benchmarks.index_plans
+#   python -m benchmarks.index_plans --mongomock
+
+import asyncio
+import os
+import random
+import sys
+from datetime import datetime, timedelta
+
+from bson.objectid import ObjectId
+
+os.environ.setdefault("INDEX_MODE", "warn")
+
+from app.indexes import INDEXES, check_query_plans, ensure_indexes  # noqa: E402
+
+SCRATCH_DB = "ai_doctor_plancheck"
+
+
+def _client(use_mongomock: bool):
+    if use_mongomock:
+        from mongomock_motor import AsyncMongoMockClient
+        return AsyncMongoMockClient()
+    from motor.motor_asyncio import AsyncIOMotorClient
+    return AsyncIOMotorClient(os.environ.get("MONGO_URI", "mongodb://localhost:27017"), serverSelectionTimeoutMS=5000)
+
+
+async def _seed(database) -> None:
+    # Enough documents that the planner has a real choice between scanning and an index
+    now = datetime.utcnow()
+    users = [{"_id": ObjectId(), "email": f"user{i}@example.com", "name": f"User {i}"} for i in range(200)]
+    await database.users.insert_many(users)
+    await database.diagnoses.insert_many([
+        {"userId": str(random.choice(users)["_id"]), "frontendId": f"report-{i}", "diagnosis": "Rest and ice.",
+         "transcript": "my ankle hurts", "createdAt": now - timedelta(minutes=i),
+         "ttsUrl": f"http://localhost:8000/temp/tts/{i}.mp3", "imageUrl": f"http://localhost:8000/uploads/{i}.jpg"}
+        for i in range(2000)
+    ])
+    await database.chat_jobs.insert_many([
+        {"status": random.choice(["queued", "running", "done", "failed"]), "createdAt": now - timedelta(seconds=i),
+         "leaseUntil": now + timedelta(seconds=random.randint(-60, 60))}
+        for i in range(300)
+    ])
+
+
+def _report(title: str, results: list) -> None:
+    print(title)
+    for name, stages, uses_index in results:
+        print(f"  {'IXSCAN ' if uses_index else 'SCAN   '} {name:24} {' <- '.join(stages)}")
+
+
+async def main(use_mongomock: bool) -> int:
+    client = _client(use_mongomock)
+    await client.drop_database(SCRATCH_DB)
+    database = client[SCRATCH_DB]
+    try:
+        await _seed(database)
+        await ensure_indexes(database)
+        indexed = await check_query_plans(database)
+        _report("With the declared indexes:", indexed)
+
+        for collection in INDEXES:
+            await database[collection].drop_indexes()
+        unindexed = await check_query_plans(database)
+        _report("Without them (control):", unindexed)
+    finally:
+        await client.drop_database(SCRATCH_DB)
+
+    failures = [name for name, _, uses_index in indexed if not uses_index]
+    undetected = [name for name, _, uses_index in unindexed if uses_index]
+    assert len(indexed) == len(unindexed), "some queries could not be explained"
+    if failures:
+        print(f"FAIL: no index for {failures}")
+    if undetected:
+        print(f"FAIL: the check didn't notice missing indexes for {undetected}")
+    if not failures and not undetected:
+        print(f"OK: {len(indexed)} query shapes use an index")
+    return 1 if failures or undetected else 0
+
+
+if __name__ == "__main__":
+    sys.exit(asyncio.run(main("--mongomock" in sys.argv[1:])))
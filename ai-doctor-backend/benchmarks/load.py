@@ -0,0 +1,403 @@
+# benchmarks/load.py
+#
+# Throughput, tail latency and event-loop lag of the real app, without spending provider quota.
+# The app is served by uvicorn on a local port against the fake Groq/ElevenLabs/gTTS servers in
+# benchmarks/fake_providers.py and an in-memory Mongo (mongomock), or a scratch database on a
+# real server with --mongo-uri. Each scenario runs closed-loop at --concurrency for --duration
+# seconds using patient_voice_test.mp3 and wound.jpg as uploads; the app's event loop is probed
+# every 10 ms meanwhile. Results go to stdout and, with --json, to a file that --compare reads back.
+#
+# Everything runs in one process (app, fakes and client on separate threads and loops), so the
+# numbers are for comparing commits on the same machine rather than for capacity planning.
+#
+# Run from ai-doctor-backend/:
+#   python -m benchmarks.load --json before.json
+#   python -m benchmarks.load --scenarios chat,tts --concurrency 16 --json after.json --compare before.json
+#   python -m benchmarks.load --provider elevenlabs=0.8,0.3,0.2   # ElevenLabs failing 20% of the time
+#
+# Inputs are unique per request by default, so content-addressed caches miss; --warm repeats them.
+
+import argparse
+import asyncio
+import itertools
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import uuid
+import warnings
+from contextlib import redirect_stdout
+from datetime import datetime, timedelta, timezone
+
+import httpx
+
+from benchmarks.fake_providers import DEFAULT_PROFILES, FakeProviders, Profile, ServerThread
+
+BACKEND_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+AUDIO_FIXTURE = os.path.join(BACKEND_DIR, "patient_voice_test.mp3")
+IMAGE_FIXTURE = os.path.join(BACKEND_DIR, "wound.jpg")
+SCRATCH_DB = "ai_doctor_load"
+PASSWORD = "load-test-password"
+DIAGNOSES_PER_USER = 30
+EXPORT_REPORTS = 10
+LAG_INTERVAL = 0.01
+
+
+class Context:
+    def __init__(self, args):
+        self.warm = args.warm
+        self.tts_engine = args.tts_engine
+        with open(AUDIO_FIXTURE, "rb") as f:
+            self.audio = f.read()
+        with open(IMAGE_FIXTURE, "rb") as f:
+            self.image = f.read()
+        self.tokens = []       # one per seeded user
+        self.diagnoses = []    # (user index, frontendId)
+        self.image_url = None  # seeded upload the reports point at
+
+    def unique(self, data: bytes) -> bytes:
+        # Decoders ignore bytes after the last MP3 frame / JPEG end marker, but the content hash changes
+        return data if self.warm else data + uuid.uuid4().bytes
+
+    def headers(self, n: int) -> dict:
+        return {"Authorization": f"Bearer {self.tokens[n % len(self.tokens)]}"}
+
+
+async def _chat(ctx, client, n):
+    files = {
+        "audio": ("patient_voice_test.mp3", ctx.unique(ctx.audio), "audio/mpeg"),
+        "image": ("wound.jpg", ctx.unique(ctx.image), "image/jpeg"),
+    }
+    # The symptom ends up in the vision prompt, so cold runs get a different diagnosis (and voice clip) each time
+    data = {"frontendId": f"load-{uuid.uuid4().hex}", "symptom": "ankle pain" if ctx.warm else f"ankle pain {n}"}
+    return await client.post("/api/chat", files=files, data=data)
+
+
+async def _tts(ctx, client, n):
+    text = "Rest the ankle and keep it elevated." if ctx.warm else f"Rest the ankle and keep it elevated, note {n}."
+    return await client.post("/api/tts", json={"text": text, "engine": ctx.tts_engine})
+
+
+async def _login(ctx, client, n):
+    return await client.post("/api/auth/login", json={"email": f"load{n % len(ctx.tokens)}@example.com",
+                                                      "password": PASSWORD})
+
+
+async def _history(ctx, client, n):
+    return await client.get("/api/diagnosis", params={"limit": 20}, headers=ctx.headers(n))
+
+
+async def _pdf(ctx, client, n):
+    # Stored diagnoses: rendered on the first pass, then served from the PDF cache
+    _, frontend_id = ctx.diagnoses[n % len(ctx.diagnoses)]
+    return await client.get(f"/api/diagnosis/pdf/{frontend_id}")
+
+
+async def _pdf_report(ctx, client, n):
+    data = {
+        "type": "Image + voice",
+        "symptom": "ankle pain",
+        "transcript": "I twisted my ankle while running yesterday.",
+        "diagnosis": "A mild sprain; rest, ice and elevate it." + ("" if ctx.warm else f" Note {n}."),
+        "image_url": ctx.image_url,
+    }
+    return await client.post("/api/pdf-report", json=data)
+
+
+async def _export(ctx, client, n):
+    user = n % len(ctx.tokens)
+    ids = [frontend_id for owner, frontend_id in ctx.diagnoses if owner == user][:EXPORT_REPORTS]
+    return await client.post("/api/diagnosis/export", json={"ids": ids, "format": "zip"}, headers=ctx.headers(n))
+
+
+SCENARIOS = {
+    "chat": _chat,
+    "tts": _tts,
+    "login": _login,
+    "history": _history,
+    "pdf": _pdf,
+    "pdf-report": _pdf_report,
+    "export": _export,
+}
+
+
+def _percentile(ordered: list, fraction: float) -> float:
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))] if ordered else 0.0
+
+
+def _ms(samples: list) -> dict:
+    ordered = sorted(samples)
+    return {name: round(_percentile(ordered, fraction) * 1000, 2)
+            for name, fraction in (("p50", 0.5), ("p95", 0.95), ("p99", 0.99), ("max", 1.0))}
+
+
+async def _lag_probe(samples: list, stop: threading.Event) -> None:
+    # Runs on the app's loop: anything that blocks it shows up as oversleeping
+    while not stop.is_set():
+        start = time.perf_counter()
+        await asyncio.sleep(LAG_INTERVAL)
+        samples.append(time.perf_counter() - start - LAG_INTERVAL)
+
+
+async def _drive(ctx, client, scenario, concurrency: int, seconds: float, counter, latencies: list, statuses: dict):
+    deadline = time.perf_counter() + seconds
+
+    async def worker():
+        while time.perf_counter() < deadline:
+            n = next(counter)
+            start = time.perf_counter()
+            try:
+                response = await scenario(ctx, client, n)
+                status = str(response.status_code)
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            statuses[status] = statuses.get(status, 0) + 1
+            if status.startswith("2"):
+                latencies.append(time.perf_counter() - start)
+
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+
+
+async def _run_scenario(ctx, client, name: str, args, app_server: ServerThread, fakes: FakeProviders) -> dict:
+    counter = itertools.count()
+    if args.warmup > 0:
+        await _drive(ctx, client, SCENARIOS[name], args.concurrency, args.warmup, counter, [], {})
+
+    latencies, statuses, lag = [], {}, []
+    stop = threading.Event()
+    probe = asyncio.run_coroutine_threadsafe(_lag_probe(lag, stop), app_server.loop)
+    before = fakes.snapshot()
+    started = time.perf_counter()
+    await _drive(ctx, client, SCENARIOS[name], args.concurrency, args.duration, counter, latencies, statuses)
+    elapsed = time.perf_counter() - started
+    stop.set()
+    await asyncio.wrap_future(probe)
+    after = fakes.snapshot()
+
+    requests = sum(statuses.values())
+    return {
+        "requests": requests,
+        "ok": len(latencies),
+        "errors": requests - len(latencies),
+        "status": statuses,
+        "seconds": round(elapsed, 2),
+        "rps": round(len(latencies) / elapsed, 2),
+        "latency_ms": _ms(latencies),
+        "loop_lag_ms": _ms(lag),
+        "provider_calls": {provider: {key: after[provider][key] - before[provider][key] for key in counts}
+                           for provider, counts in after.items()
+                           if after[provider]["calls"] != before[provider]["calls"]},
+    }
+
+
+async def _seed_diagnoses(database, user_ids: list, image_url: str) -> list:
+    now = datetime.now(timezone.utc)
+    diagnoses, docs = [], []
+    for user, user_id in enumerate(user_ids):
+        for i in range(DIAGNOSES_PER_USER):
+            frontend_id = f"load-seed-{user}-{i}"
+            diagnoses.append((user, frontend_id))
+            docs.append({
+                "userId": user_id, "frontendId": frontend_id, "symptom": "ankle pain",
+                "transcript": "I twisted my ankle while running yesterday.",
+                "diagnosis": f"A mild sprain; rest, ice and elevate it. Visit {i}.",
+                "imageUrl": image_url, "createdAt": now - timedelta(hours=i),
+            })
+    await database.diagnoses.insert_many(docs)
+    return diagnoses
+
+
+async def _setup(ctx, client, args, app_server: ServerThread, database) -> None:
+    for i in range(args.users):
+        response = await client.post("/api/auth/signup", json={"name": f"Load {i}", "email": f"load{i}@example.com",
+                                                               "password": PASSWORD})
+        response.raise_for_status()
+        ctx.tokens.append(response.json()["token"])
+
+    from app.services.media_store import media_store
+    from app.services.upload_store import UPLOADS_DIR
+    os.makedirs(UPLOADS_DIR, exist_ok=True)
+    shutil.copy(IMAGE_FIXTURE, os.path.join(UPLOADS_DIR, "load-wound.jpg"))
+    ctx.image_url = media_store.url("uploads", "load-wound.jpg")
+
+    async def seed():
+        users = await database.users.find({"email": {"$regex": "^load"}}, {"email": 1}).to_list(length=None)
+        by_email = {user["email"]: str(user["_id"]) for user in users}
+        user_ids = [by_email[f"load{i}@example.com"] for i in range(args.users)]
+        return await _seed_diagnoses(database, user_ids, ctx.image_url)
+
+    # Motor binds to the loop it's first used on, so seeding happens on the app's loop
+    ctx.diagnoses = await asyncio.wrap_future(asyncio.run_coroutine_threadsafe(seed(), app_server.loop))
+
+
+def _git_revision() -> dict:
+    def git(*command):
+        return subprocess.run(["git", *command], cwd=BACKEND_DIR, capture_output=True, text=True).stdout.strip()
+    return {"commit": git("rev-parse", "HEAD") or None, "dirty": bool(git("status", "--porcelain", "--", "."))}
+
+
+def _print_results(results: dict) -> None:
+    print(f"{'scenario':12} {'req/s':>8} {'ok':>6} {'err':>5} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9}"
+          f" {'lag p50':>8} {'lag p99':>8} {'lag max':>8}")
+    for name, result in results["scenarios"].items():
+        latency, lag = result["latency_ms"], result["loop_lag_ms"]
+        print(f"{name:12} {result['rps']:8.1f} {result['ok']:6d} {result['errors']:5d} {latency['p50']:9.1f}"
+              f" {latency['p95']:9.1f} {latency['p99']:9.1f} {lag['p50']:8.1f} {lag['p99']:8.1f} {lag['max']:8.1f}")
+        if result["errors"]:
+            print(f"{'':12} status: {result['status']}")
+
+
+def _print_comparison(baseline: dict, results: dict) -> None:
+    old_commit = (baseline.get("git") or {}).get("commit") or "?"
+    print(f"\nAgainst {old_commit[:10]} (negative is better for latency and lag):")
+
+    def change(old, new):
+        return f"{(new - old) / old * 100:+6.1f}%" if old else "    n/a"
+
+    for name, result in results["scenarios"].items():
+        old = baseline.get("scenarios", {}).get(name)
+        if old is None:
+            continue
+        print(f"{name:12} req/s {old['rps']:8.1f} -> {result['rps']:8.1f} {change(old['rps'], result['rps'])}"
+              f"   p99 {old['latency_ms']['p99']:8.1f} -> {result['latency_ms']['p99']:8.1f} ms"
+              f" {change(old['latency_ms']['p99'], result['latency_ms']['p99'])}"
+              f"   lag p99 {old['loop_lag_ms']['p99']:6.1f} -> {result['loop_lag_ms']['p99']:6.1f} ms")
+
+
+async def _main(args, app_server: ServerThread, fakes: FakeProviders, database, log) -> dict:
+    ctx = Context(args)
+    limits = httpx.Limits(max_connections=args.concurrency * 2, max_keepalive_connections=args.concurrency * 2)
+    async with httpx.AsyncClient(base_url=app_server.url, limits=limits, timeout=120) as client:
+        with redirect_stdout(log):
+            await _setup(ctx, client, args, app_server, database)
+        scenarios = {}
+        for name in args.scenarios:
+            print(f"[LOAD] {name}: {args.concurrency} concurrent for {args.duration}s", file=sys.stderr)
+            with redirect_stdout(log):
+                scenarios[name] = await _run_scenario(ctx, client, name, args, app_server, fakes)
+    return scenarios
+
+
+def _parse_args():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS),
+                        type=lambda value: [name for name in value.split(",") if name])
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--duration", type=float, default=10.0, help="seconds measured per scenario")
+    parser.add_argument("--warmup", type=float, default=2.0, help="seconds run (and discarded) before each scenario")
+    parser.add_argument("--users", type=int, default=8)
+    parser.add_argument("--warm", action="store_true", help="repeat identical inputs so the caches hit")
+    parser.add_argument("--rate-limits", action="store_true",
+                        help="keep the app's client and provider rate limits (off by default: every virtual user is 127.0.0.1)")
+    parser.add_argument("--tts-engine", choices=["gtts", "elevenlabs"], default="gtts")
+    parser.add_argument("--provider", action="append", default=[], metavar="NAME=LATENCY[,JITTER[,ERRORS]]",
+                        help=f"fake provider profile; names: {', '.join(DEFAULT_PROFILES)}")
+    parser.add_argument("--mongo-uri", help=f"use the {SCRATCH_DB} database on this server instead of mongomock")
+    parser.add_argument("--json", help="write machine-readable results here")
+    parser.add_argument("--compare", help="results file from an earlier run to compare against")
+    args = parser.parse_args()
+    unknown = [name for name in args.scenarios if name not in SCENARIOS]
+    if unknown:
+        parser.error(f"unknown scenarios {unknown}; choose from {', '.join(SCENARIOS)}")
+    return args
+
+
+def main() -> None:
+    args = _parse_args()
+    profiles = dict(DEFAULT_PROFILES)
+    for spec in args.provider:
+        name, _, values = spec.partition("=")
+        if name not in profiles:
+            raise SystemExit(f"unknown provider {name}; choose from {', '.join(profiles)}")
+        profiles[name] = Profile.parse(values)
+    json_path = os.path.abspath(args.json) if args.json else None
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)
+
+    fakes = FakeProviders(profiles, open(AUDIO_FIXTURE, "rb").read())
+    fakes.start()
+
+    # uploads/ and temp/ are relative to the working directory, so the run gets a scratch one
+    workdir = tempfile.mkdtemp(prefix="ai-doctor-load-")
+    os.symlink(os.path.join(BACKEND_DIR, "sample-assets"), os.path.join(workdir, "sample-assets"))
+    os.chdir(workdir)
+    os.environ.update({
+        "GROQ_API_KEY": "load-test", "GROQ_BASE_URL": fakes.url,
+        "ELEVENLABS_API_KEY": "load-test", "ELEVENLABS_BASE_URL": fakes.url,
+        "MONGO_URI": args.mongo_uri or "mongodb://localhost:27017",
+        "API_BASE_URL": os.environ.get("API_BASE_URL", "http://load-test"),
+        "NO_PROXY": "127.0.0.1,localhost",
+    })
+    if not args.rate_limits:
+        for prefix in ("CHAT", "TTS", "GROQ_STT", "GROQ_VISION", "ELEVENLABS", "GTTS"):
+            os.environ.setdefault(f"{prefix}_RATE_PER_MINUTE", "0")
+
+    # gTTS has no endpoint setting; point its URL builder at the fake server
+    import gtts.tts
+    gtts.tts._translate_url = lambda tld="com", path="": f"{fakes.url}/{path}"
+
+    # pydub warns about the missing ffmpeg on every clip; audio prep then just skips normalization
+    warnings.filterwarnings("ignore", category=RuntimeWarning, module="pydub")
+    sys.path.insert(0, BACKEND_DIR)
+    from app.main import app
+
+    if args.mongo_uri:
+        from motor.motor_asyncio import AsyncIOMotorClient
+        mongo = AsyncIOMotorClient(args.mongo_uri)
+        database = mongo[SCRATCH_DB]
+    else:
+        from mongomock_motor import AsyncMongoMockClient
+        mongo = AsyncMongoMockClient()
+        database = mongo[SCRATCH_DB]
+    from app.db import use_database
+    use_database(database)
+
+    log_path = os.path.join(tempfile.gettempdir(), "ai-doctor-load.log")
+    log = open(log_path, "w")
+    app_server = ServerThread(app, lifespan="on")
+    try:
+        with redirect_stdout(log):
+            if args.mongo_uri:
+                asyncio.run(AsyncIOMotorClient(args.mongo_uri).drop_database(SCRATCH_DB))
+            app_server.start_and_wait()
+        print(f"[LOAD] app at {app_server.url}, fake providers at {fakes.url}, log in {log_path}", file=sys.stderr)
+        scenarios = asyncio.run(_main(args, app_server, fakes, database, log))
+    finally:
+        with redirect_stdout(log):
+            app_server.stop()
+            fakes.stop()
+            if args.mongo_uri:
+                asyncio.run(AsyncIOMotorClient(args.mongo_uri).drop_database(SCRATCH_DB))
+        log.close()
+
+    results = {
+        "git": _git_revision(),
+        "created": datetime.now(timezone.utc).isoformat(),
+        "machine": {"python": platform.python_version(), "platform": platform.platform(), "cpus": os.cpu_count()},
+        "config": {
+            "concurrency": args.concurrency, "duration": args.duration, "warmup": args.warmup, "users": args.users,
+            "warm": args.warm, "rate_limits": args.rate_limits, "tts_engine": args.tts_engine, "mongo": "server" if args.mongo_uri else "mongomock",
+            "providers": {name: profile.as_dict() for name, profile in profiles.items()},
+        },
+        "scenarios": scenarios,
+    }
+    _print_results(results)
+    if baseline:
+        _print_comparison(baseline, results)
+    if json_path:
+        with open(json_path, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nResults written to {json_path}")
+    os.chdir(BACKEND_DIR)
+    shutil.rmtree(workdir, ignore_errors=True)
+
+
+if __name__ == "__main__":
+    main()
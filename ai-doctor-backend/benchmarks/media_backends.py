@@ -0,0 +1,125 @@
+# benchmarks/media_backends.py
+#
+# Runs every media store backend through the same checks against a local stand-in: the local
+# backend in a scratch directory, GridFS on mongomock and S3 on moto (no server or account needed).
+# Each one stores a file and bytes, then stat, digest, whole and ranged reads, fetch, delete, and
+# several concurrent puts of one key, which must leave a single object behind.
+# Run from ai-doctor-backend/:  python -m benchmarks.media_backends [local,gridfs,s3]
+
+import asyncio
+import hashlib
+import os
+import sys
+import tempfile
+
+DATA = os.urandom(700 * 1024)  # a few chunks, so ranged reads cross chunk boundaries
+BYTES_DATA = b"%PDF-1.4 stand-in report"
+
+
+async def _read(store, namespace: str, key: str, start: int = 0, end: int = None) -> bytes:
+    _, chunks = await store.open(namespace, key, start, end)
+    return b"".join([chunk async for chunk in chunks])
+
+
+async def _exercise(store, count_objects) -> list:
+    from app.services.media_store import MediaNotFound
+    problems = []
+
+    def check(ok: bool, what: str) -> None:
+        if not ok:
+            problems.append(what)
+
+    key = hashlib.sha256(DATA).hexdigest() + ".jpg"
+    with open("upload.tmp", "wb") as f:
+        f.write(DATA)
+    await store.put_file("uploads", key, "upload.tmp", "image/jpeg")
+    await store.put_bytes("pdf", "report.pdf", BYTES_DATA, "application/pdf")
+
+    info = await store.stat("uploads", key)
+    check(info["size"] == len(DATA), f"stat size {info['size']}")
+    check(info["content_type"] == "image/jpeg", f"stat content type {info['content_type']}")
+    check(await store.digest("uploads", key) == hashlib.sha256(DATA).hexdigest(), "file digest")
+    check(await store.digest("pdf", "report.pdf") == hashlib.sha256(BYTES_DATA).hexdigest(), "bytes digest")
+    check(await _read(store, "uploads", key) == DATA, "whole read")
+    check(await _read(store, "uploads", key, 300000, 300099) == DATA[300000:300100], "ranged read")
+    check(await _read(store, "uploads", key, len(DATA) - 10) == DATA[-10:], "open-ended range")
+    check(await _read(store, "pdf", "report.pdf") == BYTES_DATA, "bytes read")
+
+    check(await store.fetch("pdf", "report.pdf", os.path.join("work", "report.pdf")), "fetch")
+    with open(os.path.join("work", "report.pdf"), "rb") as f:
+        check(f.read() == BYTES_DATA, "fetched content")
+    check(not await store.fetch("pdf", "missing.pdf", os.path.join("work", "missing.pdf")), "fetch of a missing key")
+
+    # Several nodes storing the same content at once
+    await asyncio.gather(*[store.put_bytes("tts", "clip.mp3", b"ID3 clip", "audio/mpeg") for _ in range(5)])
+    copies = await count_objects("tts", "clip.mp3")
+    check(copies == 1, f"{copies} objects after concurrent puts of one key")
+
+    await store.delete("uploads", key)
+    try:
+        await store.stat("uploads", key)
+        problems.append("stat after delete")
+    except MediaNotFound:
+        pass
+    return problems
+
+
+async def _local():
+    from app.services.media_store import LocalMediaStore, NAMESPACES
+    store = LocalMediaStore()
+
+    async def count(namespace, key):
+        return int(os.path.exists(os.path.join(NAMESPACES[namespace], key)))
+    return await _exercise(store, count)
+
+
+async def _gridfs():
+    from mongomock_motor import AsyncMongoMockClient, enabled_gridfs_integration
+    from app.db import use_database
+    from app.indexes import ensure_indexes
+    from app.services.media_store import GridFSMediaStore
+
+    with enabled_gridfs_integration():
+        database = AsyncMongoMockClient()["ai_doctor_media_check"]
+        use_database(database)
+        await ensure_indexes(database)
+        store = GridFSMediaStore()
+
+        async def count(namespace, key):
+            return await store.files.count_documents({"filename": f"{namespace}/{key}"})
+        return await _exercise(store, count)
+
+
+async def _s3():
+    from moto import mock_aws
+    with mock_aws():
+        from app.services.media_store import S3MediaStore
+        store = S3MediaStore(bucket="ai-doctor-media-check", endpoint_url=None)
+        store.client.create_bucket(Bucket=store.bucket)
+
+        async def count(namespace, key):
+            listing = store.client.list_objects_v2(Bucket=store.bucket, Prefix=store._key(namespace, key))
+            return listing.get("KeyCount", 0)
+        return await _exercise(store, count)
+
+
+BACKENDS = {"local": _local, "gridfs": _gridfs, "s3": _s3}
+
+
+async def main(names: list) -> int:
+    failed = 0
+    for name in names:
+        problems = await BACKENDS[name]()
+        print(f"{name:7} {'OK' if not problems else 'FAIL: ' + ', '.join(problems)}")
+        failed += bool(problems)
+    return 1 if failed else 0
+
+
+if __name__ == "__main__":
+    os.environ["MEDIA_BACKEND"] = "gridfs"  # so app.indexes declares the GridFS indexes
+    os.environ.setdefault("AWS_ACCESS_KEY_ID", "testing")
+    os.environ.setdefault("AWS_SECRET_ACCESS_KEY", "testing")
+    names = sys.argv[1].split(",") if len(sys.argv) > 1 else list(BACKENDS)
+    sys.path.insert(0, os.getcwd())
+    os.chdir(tempfile.mkdtemp(prefix="ai-doctor-media-"))
+    sys.exit(asyncio.run(main(names)))
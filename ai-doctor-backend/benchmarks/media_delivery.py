@@ -0,0 +1,127 @@
+# benchmarks/media_delivery.py
+#
+# Requests and body bytes per diagnosis replay, before and after the media router: the old
+# StaticFiles mounts, the first /media endpoint (whole-object streaming) and the router as it is now.
+# Each replay plays the voice clip, seeks to 60% and shows the image. "cached" is a client that keeps
+# bodies, honours max-age and revalidates with ETags (a browser); "player" caches nothing and only
+# sends Range requests (the app's audio player).
+# Run from ai-doctor-backend/:  python -m benchmarks.media_delivery [replays]
+
+import asyncio
+import os
+import re
+import sys
+import tempfile
+import time
+
+import httpx
+import starlette
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+from fastapi.staticfiles import StaticFiles
+
+from app.routes import media
+from app.services.media_store import media_store
+
+REPLAYS = 5
+CLIP_BYTES = 240 * 1024
+IMAGE_BYTES = 900 * 1024
+
+
+class ClientCache:
+    def __init__(self, client: httpx.AsyncClient, enabled: bool = True):
+        self.client = client
+        self.enabled = enabled
+        self.entries = {}  # url -> (etag, fresh until, body)
+        self.requests = 0
+        self.body_bytes = 0
+
+    async def get(self, url: str, range_start: int = None) -> None:
+        etag, fresh_until, body = self.entries.get(url, (None, 0, None))
+        if body is not None and time.time() < fresh_until:
+            return
+        headers = {}
+        if range_start is not None:
+            headers["Range"] = f"bytes={range_start}-"
+        if body is not None and etag:
+            headers["If-None-Match"] = etag
+        response = await self.client.get(url, headers=headers)
+        self.requests += 1
+        self.body_bytes += len(response.content)
+        if not self.enabled:
+            return
+        if response.status_code == 200:
+            body = response.content
+        elif response.status_code != 304:
+            return  # partial content isn't cached by this simple client
+        max_age = re.search(r"max-age=(\d+)", response.headers.get("cache-control", ""))
+        fresh_until = time.time() + int(max_age.group(1)) if max_age else 0
+        self.entries[url] = (response.headers.get("etag"), fresh_until, body)
+
+
+async def _replay(cache: ClientCache, clip_url: str, image_url: str) -> None:
+    await cache.get(clip_url)
+    await cache.get(clip_url, range_start=CLIP_BYTES * 6 // 10)  # seek to 60%
+    await cache.get(image_url)
+
+
+async def _run(app, prefix: str, clip: str, image: str, replays: int, cached: bool):
+    clip_url, image_url = f"{prefix[0]}/{clip}", f"{prefix[1]}/{image}"
+    async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://bench") as client:
+        cache = ClientCache(client, enabled=cached)
+        await _replay(cache, clip_url, image_url)
+        first = (cache.requests, cache.body_bytes)
+        for _ in range(replays):
+            await _replay(cache, clip_url, image_url)
+    return first, (cache.requests - first[0], cache.body_bytes - first[1])
+
+
+# The /media endpoint as first shipped: the whole object, no validators, no ranges
+def _stream_only_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/media/{namespace}/{key}")
+    async def get_media(namespace: str, key: str):
+        info, chunks = await media_store.open(namespace, key)
+        return StreamingResponse(chunks, media_type=info["content_type"], headers={"Content-Length": str(info["size"])})
+
+    return app
+
+
+def main(replays: int):
+    workdir = tempfile.mkdtemp(prefix="media-bench-")
+    os.chdir(workdir)
+    os.makedirs(os.path.join("temp", "tts"))
+    os.makedirs("uploads")
+    clip = "c" * 64 + ".mp3"
+    image = "d" * 64 + ".jpg"
+    with open(os.path.join("temp", "tts", clip), "wb") as f:
+        f.write(os.urandom(CLIP_BYTES))
+    with open(os.path.join("uploads", image), "wb") as f:
+        f.write(os.urandom(IMAGE_BYTES))
+
+    before = FastAPI()
+    before.mount("/temp", StaticFiles(directory="temp"), name="temp")
+    before.mount("/uploads", StaticFiles(directory="uploads"), name="uploads")
+    after = FastAPI()
+    after.include_router(media.router)
+
+    static_urls = ("/temp/tts", "/uploads")
+    media_urls = ("/media/tts", "/media/uploads")
+    variants = [
+        ("StaticFiles", before, static_urls),
+        ("/media stream", _stream_only_app(), media_urls),
+        ("router static", after, static_urls),
+        ("router /media", after, media_urls),
+    ]
+    print(f"starlette {starlette.__version__}, clip {CLIP_BYTES} B, image {IMAGE_BYTES} B, {replays} replays")
+    print(f"{'variant':14} {'client':>7} {'first req':>10} {'bytes':>9} {'replay req':>11} {'bytes/replay':>13}")
+    for cached in (True, False):
+        for name, app, prefix in variants:
+            first, rest = asyncio.run(_run(app, prefix, clip, image, replays, cached))
+            print(f"{name:14} {'cached' if cached else 'player':>7} {first[0]:>10} {first[1]:>9} "
+                  f"{rest[0] / replays:>11.1f} {rest[1] / replays:>13.0f}")
+
+
+if __name__ == "__main__":
+    main(int(sys.argv[1]) if len(sys.argv) > 1 else REPLAYS)
@@ -1,6 +1,7 @@
-from pymongo import MongoClient
 import os
 
 MONGO_URI = os.getenv("MONGO_URI")
-client = MongoClient(MONGO_URI)
-db = client["ai_doctor_db"]
+MONGO_DB = os.getenv("MONGO_DB", "ai_doctor")
+# Where /api/diagnosis used to save and list (the old sync client); copied into MONGO_DB once at
+# startup. Empty to skip.
+LEGACY_MONGO_DB = os.getenv("LEGACY_MONGO_DB", "ai_doctor_db")